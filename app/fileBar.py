@@ -16,12 +16,13 @@ from PyQt6.QtWidgets import (
     QDialog,
     QDateEdit
 )
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from .fileWorker import FileWorker
 
 
 FILE_WORKER = FileWorker()
+SIMILAR_NOTES_COUNT = 10
 
 
 class FileBar(QScrollArea):
@@ -169,21 +170,27 @@ class FileBar(QScrollArea):
                     btn.setStyleSheet(self.fileButtonStyle)
                     btn.setToolTip(f"{files[i]['date']}\n{' ,'.join(files[i]['emotion'])}")
                     
-                    menu = QMenu(btn)
-                    menu.setStyleSheet(self.menuStyles)
-
-                    openAction = menu.addAction("Open")
-                    openAction.triggered.connect(partial(self._openNote, i))
-
-                    deleteAction = menu.addAction("Delete")
-                    deleteAction.triggered.connect(partial(self._deleteNote, i))
-
-                    btn.setMenu(menu)
+                    btn.setMenu(self._noteMenu(btn, i))
 
                     self.filesLayout.addWidget(btn)
                     self.showenFiles.append(i)
                     self.buttons[i] = btn
     
+    def _noteMenu(self, btn, fileName) -> QMenu:
+        menu = QMenu(btn)
+        menu.setStyleSheet(self.menuStyles)
+
+        openAction = menu.addAction("Open")
+        openAction.triggered.connect(partial(self._openNote, fileName))
+
+        similarAction = menu.addAction("Similar notes")
+        similarAction.triggered.connect(partial(self._showSimilarNotes, fileName))
+
+        deleteAction = menu.addAction("Delete")
+        deleteAction.triggered.connect(partial(self._deleteNote, fileName))
+
+        return menu
+
     def _deleteNote(self, fileName):
         msgBox = QMessageBox()
         msgBox.setWindowTitle("Delete confirmation")
@@ -202,6 +209,15 @@ class FileBar(QScrollArea):
     def _openNote(self, fileName):
         self.openNoteRequested.emit(fileName)
 
+    def _showSimilarNotes(self, fileName):
+        similarNotes = FILE_WORKER.similarNotes(fileName, SIMILAR_NOTES_COUNT)
+        if not similarNotes:
+            QMessageBox.information(self, "Similar notes", f"{fileName} note isn't indexed yet. Similar notes will be found once the model processes it.")
+            return
+
+        files = FILE_WORKER.getFileList()
+        self._updateFileListWithNewOrder({title: files[title] for title, _ in similarNotes if title in files})
+
     def onNoteTitleChanged(self, previousTitle, newTitle):
         if previousTitle != "":
             btn = self.buttons.pop(previousTitle)
@@ -209,16 +225,7 @@ class FileBar(QScrollArea):
             self.showenFiles[self.showenFiles.index(previousTitle)] = newTitle
             btn.setText(newTitle)
 
-            menu = QMenu(btn)
-            menu.setStyleSheet(self.menuStyles)
-
-            openAction = menu.addAction("Open")
-            openAction.triggered.connect(partial(self._openNote, newTitle))
-
-            deleteAction = menu.addAction("Delete")
-            deleteAction.triggered.connect(partial(self._deleteNote, newTitle))
-
-            btn.setMenu(menu)
+            btn.setMenu(self._noteMenu(btn, newTitle))
 
         self.updateFileList()
     
@@ -253,22 +260,17 @@ class FileBar(QScrollArea):
     
     def _sortFiles(self, criterion):
         files = FILE_WORKER.getFileList()
-        if criterion == 'alphabet':
-            sorted_files = dict(sorted(files.items()))
-        elif criterion == 'date':
-            sorted_files = dict(sorted(files.items(), key=lambda item: datetime.strptime(item[1]['date'], "%Y-%m-%d %H:%M:%S")))
+        titles = FILE_WORKER.sortedBy('title' if criterion == 'alphabet' else 'date')
 
-        self._updateFileListWithNewOrder(sorted_files)
+        self._updateFileListWithNewOrder({title: files[title] for title in titles})
 
     def _filterFiles(self, start_date, end_date):
         files = FILE_WORKER.getFileList()
 
         start_date = datetime.strptime(start_date, "%Y-%m-%d")
-        end_date = datetime.strptime(end_date, "%Y-%m-%d")
+        end_date = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)  # the end date is included
 
-        filtered_files = {k: v for k, v in files.items() if start_date.date() <= datetime.strptime(v['date'], "%Y-%m-%d %H:%M:%S").date() <= end_date.date()}
-
-        self._updateFileListWithNewOrder(filtered_files)
+        self._updateFileListWithNewOrder({title: files[title] for title in FILE_WORKER.notesBetween(start_date, end_date)})
 
     def _updateFileListWithNewOrder(self, files):
         self.showenFiles = []
@@ -286,16 +288,7 @@ class FileBar(QScrollArea):
             btn.setStyleSheet(self.fileButtonStyle)
             btn.setToolTip(f"{files[i]['date']}\n{' ,'.join(files[i]['emotion'])}")
 
-            menu = QMenu(btn)
-            menu.setStyleSheet(self.menuStyles)
-
-            openAction = menu.addAction("Open")
-            openAction.triggered.connect(partial(self._openNote, i))
-
-            deleteAction = menu.addAction("Delete")
-            deleteAction.triggered.connect(partial(self._deleteNote, i))
-
-            btn.setMenu(menu)
+            btn.setMenu(self._noteMenu(btn, i))
 
             self.filesLayout.addWidget(btn)
             self.showenFiles.append(i)
@@ -1,90 +1,390 @@
 import os
 import glob
 import json
+import time
+import atexit
+import threading
 from datetime import datetime
 
+import numpy as np
+
+from .matrixStore import MatrixStore
+from .metaStore import SqliteMetaStore
+from .noteJournal import NoteJournal
+from .noteIndex import NoteIndex
+from ..cache_service import text_hash
+
+
+class JsonMetaStore:
+    """ Metadata of all the notes ({title: {"date", "emotion"}}) in one JSON file, which is rewritten as a whole.
+
+    `changed`, `removed` and `renamed` record changes of FileWorker's dict (nothing to record here), `pending` takes
+    a snapshot of them under FileWorker's lock and `write` saves the snapshot. SqliteMetaStore has the same interface.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def create(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({}, f)
+
+    def load(self) -> dict:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def changed(self, title: str):
+        pass
+
+    def removed(self, title: str):
+        pass
+
+    def renamed(self, oldTitle: str, newTitle: str):
+        pass
+
+    def pending(self, filesInfo: dict) -> str:
+        return json.dumps(filesInfo)
+
+    def write(self, meta: str):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(meta)
+
+    def close(self):
+        pass
+
 
 class FileWorker:
     __instance = None
     notesDirectory: str = "emotion_analyser/UserNotes"
     metaFile: str = "meta_info.json"
+    metaStorage: str = "json"  # or "sqlite": metadata rows in metaDatabase, meta_info.json is migrated into it once
+    metaDatabase: str = "notes.sqlite3"
+    probabilitiesFile: str = "emotion_probabilities"  # .bin and .json sidecar with float16 vectors of RoBertaModel.emotions
+    emotionsCount: int = 18
+    embeddingsFile: str = "note_embeddings"  # .bin and .json sidecar with float32 RoBERTa encoder embeddings
+    embeddingSize: int = 768
+    autosaveDelay: float = 1.0  # seconds without changes after which changed notes are written to disk
+    journalCompactSize: int = 32 * 1024  # bytes of a note's edit journal after which it's folded into the note file
     prohibitedChars: list = ['\\', '/', ':', '*', '?', '"', '<', '>', '|', '+']
 
     def __new__(csv, *args, **kwargs):
         if not isinstance(csv.__instance, csv):
             csv.__instance = object.__new__(csv, *args, **kwargs)
+            atexit.register(csv.__instance.close)  # changes which are still in memory are written on exit
         return csv.__instance
 
     def __init__(self):
+        if getattr(self, "_lock", None) is not None:
+            self.close()  # the singleton is initialized again, so pending changes are written before the metadata is re-read
+
+        self.metaStore = self._openMetaStore()
         if not os.path.exists(self.notesDirectory):
             os.makedirs(self.notesDirectory)
-            with open(self.notesDirectory + "/" + self.metaFile, "w", encoding="utf-8") as f:
-                json.dump({}, f)
-        
-        with open(self.notesDirectory + "/" + self.metaFile, "r", encoding="utf-8") as f:
-            self.filesInfo: dict = json.load(f)
-        
+            self.metaStore.create()
+
+        self.filesInfo: dict = self.metaStore.load()
+        self.index = NoteIndex(self.filesInfo)  # dates and emotions for sorting, filtering and the charts without parsing
+
+        self._probabilities = None
+        self._embeddings = None
+        self._embeddedStats = {}  # title -> journal.stat of the note files when its embedding was last checked
+
+        # write-behind state: changes are applied in memory at once and written by the autosave thread
+        # after `autosaveDelay` without changes, so typing doesn't touch the disk on every key press
+        self._lock = threading.RLock()  # guards the in-memory state
+        self._ioLock = threading.RLock()  # one writer at a time, so an older snapshot never overwrites a newer one
+        self._changed = threading.Condition(self._lock)
+        self._pendingContents = {}  # title -> content which isn't written yet
+        self._savedContents = {}  # title -> (journal.stat, content) of the notes written by this session
+        self._oversizedJournals = set()  # titles of the notes whose journals are folded by the autosave thread
+        self._metaChanged = False
+        self._lastChange = 0.0
+        self._autosave = None  # the thread is started with the first deferred change
+        self._closing = False
         self._updateMetaInfo()
     
+    def _openMetaStore(self):
+        if self.metaStorage == "sqlite":
+            return SqliteMetaStore(self.notesDirectory + "/" + self.metaDatabase, legacyPath=self.notesDirectory + "/" + self.metaFile)
+        if self.metaStorage == "json":
+            return JsonMetaStore(self.notesDirectory + "/" + self.metaFile)
+        raise ValueError(f"Unknown metadata storage: {self.metaStorage}. Use 'json' or 'sqlite'")
+
     def _updateMetaInfo(self):
-        txtFiles = [os.path.basename(file) for file in glob.glob(os.path.join(self.notesDirectory, "*.txt"))]
-        keys_to_delete = []
+        with self._ioLock:
+            txtFiles = [os.path.basename(file) for file in glob.glob(os.path.join(self.notesDirectory, "*.txt"))]
 
-        for fileTitle in self.filesInfo.keys():
-            if fileTitle + ".txt" not in txtFiles:
-                keys_to_delete.append(fileTitle)
+            with self._lock:
+                keys_to_delete = []
+                for fileTitle in self.filesInfo.keys():
+                    if fileTitle + ".txt" not in txtFiles and fileTitle not in self._pendingContents:
+                        keys_to_delete.append(fileTitle)
 
-        for key in keys_to_delete:
-            del self.filesInfo[key]
-        
-        with open(self.notesDirectory + "/" + self.metaFile, "w", encoding="utf-8") as f:
-            json.dump(self.filesInfo, f)
+                for key in keys_to_delete:
+                    del self.filesInfo[key]
+                    self.metaStore.removed(key)
+                    self.index.remove(key)
+
+                meta = self.metaStore.pending(self.filesInfo)
+                titles = set(self.filesInfo)
+
+            self.metaStore.write(meta)
+
+        for store in (self._probabilities, self._embeddings):
+            if store is not None:
+                store.keep(titles)
+
+    def _scheduleFlush(self):
+        with self._lock:
+            self._metaChanged = True
+            self._lastChange = time.monotonic()
+            if self._autosave is None:
+                self._autosave = threading.Thread(target=self._autosaveLoop, name="autosave", daemon=True)
+                self._autosave.start()
+            self._changed.notify()
+
+    def _autosaveLoop(self):
+        while True:
+            with self._lock:
+                while not self._closing:
+                    idle = time.monotonic() - self._lastChange
+                    if self._metaChanged and idle >= self.autosaveDelay:
+                        break
+                    self._changed.wait(self.autosaveDelay - idle if self._metaChanged else None)
+                if self._closing:
+                    return
+            self.flush()
+            self.compactJournals()
+
+    def flush(self):
+        """Writes all the changed notes and the metadata at once, returns when they are on disk"""
+
+        with self._ioLock:
+            with self._lock:
+                contents = dict(self._pendingContents)
+                metaChanged, self._metaChanged = self._metaChanged, False
+
+            for title, content in contents.items():
+                self._writeNote(title, content)
+
+            with self._lock:
+                # notes changed while writing stay pending, so their newer content is written by the next flush
+                for title, content in contents.items():
+                    if self._pendingContents.get(title) is content:
+                        del self._pendingContents[title]
+
+            if metaChanged or contents:
+                self._updateMetaInfo()
+
+    def _readNote(self, title: str) -> str:
+        with self._ioLock:
+            with open(self.notesDirectory + "/" + title + ".txt", "r", encoding="utf-8") as file:
+                checkpoint = "".join([line for line in file.readlines()])
+            return self.journal.replay(title, checkpoint)
+
+    def _savedContent(self, title: str) -> str:
+        """Content of the note on disk, it's read only if the files were changed since this session wrote them"""
+
+        saved = self._savedContents.get(title)
+        if saved is not None and saved[0] == self.journal.stat(title):
+            return saved[1]
+        return self._readNote(title)
+
+    def _writeNote(self, title: str, content: str):
+        """ Writes a new note as a whole and appends only the edit to the journal of a saved one,
+        so saving a long note costs the size of the change. Called under _ioLock
+        """
+
+        if not os.path.exists(self.notesDirectory + "/" + title + ".txt"):
+            with open(self.notesDirectory + "/" + title + ".txt", "w", encoding="utf-8") as file:
+                file.write(content)
+            self.journal.remove(title)
+        elif self.journal.append(title, self._savedContent(title), content):
+            with self._lock:
+                self._oversizedJournals.add(title)
+        self._savedContents[title] = (self.journal.stat(title), content)
+
+    def compactJournals(self):
+        """Folds the journals which outgrew `journalCompactSize` into the note files, the autosave thread calls it after a flush"""
+
+        with self._ioLock:
+            with self._lock:
+                titles, self._oversizedJournals = self._oversizedJournals, set()
+                titles = [title for title in titles if title in self.filesInfo]
+
+            for title in titles:
+                try:
+                    content = self._savedContent(title)
+                except FileNotFoundError:
+                    continue  # the note was deleted meanwhile
+                self.journal.fold(title, content)
+                self._savedContents[title] = (self.journal.stat(title), content)
+
+    def close(self):
+        """Stops the autosave thread and writes everything it hasn't written yet"""
+
+        with self._lock:
+            self._closing = True
+            self._changed.notify()
+            autosave, self._autosave = self._autosave, None
+        if autosave is not None and autosave is not threading.current_thread():
+            autosave.join()
+
+        self.flush()
+        with self._lock:
+            self._closing = False  # a later change starts a new thread
+        self.metaStore.close()
+
+    @property
+    def journal(self) -> NoteJournal:
+        """ Journals of the note edits, it keeps no state, so it always follows notesDirectory"""
+
+        return NoteJournal(self.notesDirectory, self.journalCompactSize)
+
+    @property
+    def probabilities(self) -> MatrixStore:
+        """ Probabilities of all the emotions of every analysed note, opened on the first use"""
+
+        with self._lock:  # the GUI thread and the analysis threads may both open it
+            if self._probabilities is None:
+                self._probabilities = MatrixStore(self.notesDirectory + "/" + self.probabilitiesFile, self.emotionsCount)
+                self._probabilities.keep(self.filesInfo)
+            return self._probabilities
+
+    @property
+    def embeddings(self) -> MatrixStore:
+        """ Embeddings of the notes content for the similar notes search, opened on the first use"""
+
+        with self._lock:  # the GUI thread and the analysis threads may both open it
+            if self._embeddings is None:
+                self._embeddings = MatrixStore(self.notesDirectory + "/" + self.embeddingsFile, self.embeddingSize, np.float32)
+                self._embeddings.keep(self.filesInfo)
+            return self._embeddings
     
-    def addNewNote(self, title: str, content: str, emotion: list = [""], u: bool = False):
+    def addNewNote(self, title: str, content: str, emotion: list = [""], u: bool = False, probabilities=None):
         if title != "":
             for c in self.prohibitedChars:
                 title = title.replace(c, "U")
             
-            if title not in self.filesInfo.keys():
-                self.filesInfo[title] = {
-                    "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "emotion": emotion
-                }
-            else:
-                self.filesInfo[title] = {
-                    "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "emotion": emotion if u else self.filesInfo[title]["emotion"]  # if u then we need to update the note's emotions (yeah,  i know it's ugly)
-                }
+            with self._lock:
+                if title not in self.filesInfo.keys():
+                    self.filesInfo[title] = {
+                        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "emotion": emotion
+                    }
+                else:
+                    self.filesInfo[title] = {
+                        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "emotion": emotion if u else self.filesInfo[title]["emotion"]  # if u then we need to update the note's emotions (yeah,  i know it's ugly)
+                    }
 
-            with open(self.notesDirectory + "/" + title + ".txt", "w", encoding="utf-8") as file:
-                file.write(content)
-            
-            self._updateMetaInfo()
+                # the file and the metadata are written by the autosave thread, repeated saves of a note are coalesced
+                self._pendingContents[title] = content
+                self.metaStore.changed(title)
+                self.index.put(title, self.filesInfo[title])
+                self._scheduleFlush()
+
+            if u and probabilities is not None:
+                self.probabilities.put(title, probabilities)
     
-    def changeEmotions(self, title: str, new_emotions: list):
+    def changeEmotions(self, title: str, new_emotions: list, probabilities=None):
         if title in self.filesInfo:
-            self.filesInfo[title]["emotion"] = new_emotions
-            self._updateMetaInfo()
+            with self._lock:
+                self.filesInfo[title]["emotion"] = new_emotions
+                self.metaStore.changed(title)
+                self.index.put(title, self.filesInfo[title])
+                self._scheduleFlush()
+            if probabilities is not None:
+                self.probabilities.put(title, probabilities)
 
-    def deleteNode(self, title: str):
-        os.remove(self.notesDirectory + "/" + title)
+    def changeEmotionsBatch(self, newEmotions: dict, probabilities: dict = None):
+        """ Updates emotions of many notes ({title: emotions}) with a single metadata write.
+        `probabilities` ({title: vector}) are saved into the sidecar with a single index write too.
+        """
+
+        with self._lock:
+            for title, emotions in newEmotions.items():
+                if title in self.filesInfo:
+                    self.filesInfo[title]["emotion"] = emotions
+                    self.metaStore.changed(title)
+                    self.index.put(title, self.filesInfo[title])
         self._updateMetaInfo()
+        if probabilities:
+            self.probabilities.putMany({title: vector for title, vector in probabilities.items() if title in self.filesInfo})
+
+    def deleteNode(self, title: str):
+        with self._ioLock:
+            name = os.path.splitext(title)[0]
+            with self._lock:
+                pending = self._pendingContents.pop(name, None)
+                self._oversizedJournals.discard(name)
+            # a new note may be not written yet
+            if pending is None or os.path.exists(self.notesDirectory + "/" + title):
+                os.remove(self.notesDirectory + "/" + title)
+            self.journal.remove(name)
+            self._savedContents.pop(name, None)
+            self._updateMetaInfo()
     
     def changeNoteTitle(self, prevTitle: str, newTitle: str):
-        if os.path.exists(self.notesDirectory + "/" + prevTitle + ".txt"):
-            self.filesInfo[newTitle] = self.filesInfo[prevTitle]
-            del self.filesInfo[prevTitle]
-            os.rename(self.notesDirectory + "/" + prevTitle + ".txt", self.notesDirectory + "/" + newTitle + ".txt")
+        with self._ioLock:
+            with self._lock:
+                if not os.path.exists(self.notesDirectory + "/" + prevTitle + ".txt") and prevTitle not in self._pendingContents:
+                    return
+                self.filesInfo[newTitle] = self.filesInfo[prevTitle]
+                del self.filesInfo[prevTitle]
+                self.metaStore.renamed(prevTitle, newTitle)
+                self.index.rename(prevTitle, newTitle)
+                if prevTitle in self._pendingContents:
+                    self._pendingContents[newTitle] = self._pendingContents.pop(prevTitle)
+                if prevTitle in self._oversizedJournals:
+                    self._oversizedJournals.discard(prevTitle)
+                    self._oversizedJournals.add(newTitle)
+                if prevTitle in self._embeddedStats:
+                    self._embeddedStats[newTitle] = self._embeddedStats.pop(prevTitle)
+
+            self.probabilities.rename(prevTitle, newTitle)
+            self.embeddings.rename(prevTitle, newTitle)
+            if os.path.exists(self.notesDirectory + "/" + prevTitle + ".txt"):
+                os.rename(self.notesDirectory + "/" + prevTitle + ".txt", self.notesDirectory + "/" + newTitle + ".txt")
+            self.journal.rename(prevTitle, newTitle)
+            if prevTitle in self._savedContents:
+                self._savedContents[newTitle] = self._savedContents.pop(prevTitle)
+            self._scheduleFlush()
 
     def getFileList(self) -> dict:
         return self.filesInfo
     
+    def notesBetween(self, start, end) -> list:
+        """ Titles of the notes dated in [start, end), oldest first. `start` and `end` are datetimes or epoch seconds"""
+
+        start, end = [bound.timestamp() if isinstance(bound, datetime) else bound for bound in (start, end)]
+        with self._lock:
+            return self.index.between(start, end)
+
+    def notesWithEmotion(self, emotion: str) -> list:
+        with self._lock:
+            return self.index.withEmotion(emotion)
+
+    def sortedBy(self, key: str) -> list:
+        """ Titles of all the notes sorted by their "date" (oldest first) or "title" """
+
+        with self._lock:
+            return self.index.sortedBy(key)
+
+    def noteDate(self, title: str) -> datetime:
+        """ Date of the note from the index, so it's not parsed again"""
+
+        with self._lock:
+            return datetime.fromtimestamp(self.index.timestamp(title))
+
     def getFileInfo(self, title: str):
         """ Returns a dict with fields: content, date, emotion"""
 
         if title in self.filesInfo.keys():
-            with open(self.notesDirectory + "/" + title + ".txt", "r", encoding="utf-8") as file:
-                content = "".join([line for line in file.readlines()])
+            with self._lock:
+                content = self._pendingContents.get(title)
+            if content is None:
+                content = self._readNote(title)
                 
             return {
                 "content": content,
@@ -93,3 +393,68 @@ class FileWorker:
             }
         
         raise FileNotFoundError("There is no such a file")
+
+    def getProbabilities(self, titles: list) -> np.ndarray:
+        """ Returns a float32 (len(titles), emotionsCount) matrix of emotion probabilities of the notes,
+        rows of notes which weren't analysed with probabilities are NaN
+        """
+
+        rows = self.probabilities.rows(titles)
+        result = np.full((len(titles), self.emotionsCount), np.nan, dtype=np.float32)
+        known = rows >= 0
+        result[known] = self.probabilities.matrix()[rows[known]]
+        return result
+
+    def softEmotionCounts(self, titles: list = None) -> np.ndarray:
+        """ Sum of the emotion probabilities over the notes (all of them by default), i.e. the expected number
+        of notes with every emotion. Notes without probabilities are skipped
+        """
+
+        return np.nansum(self.getProbabilities(list(self.filesInfo) if titles is None else titles), axis=0)
+
+    def staleEmbeddings(self) -> dict:
+        """ Returns {title: (content, file stat)} of the notes which have no embedding or were changed since
+        it was computed. Only files with another size or modification time than on the previous check are read
+        """
+
+        stale = {}
+        for title in list(self.filesInfo):
+            try:
+                fileStat = self.journal.stat(title)
+                if self._embeddedStats.get(title) == fileStat and title in self.embeddings:
+                    continue
+                content = self.getFileInfo(title)["content"]
+            except (FileNotFoundError, KeyError):
+                continue  # the note was deleted meanwhile
+
+            if self.embeddings.tag(title) == text_hash(content):
+                self._embeddedStats[title] = fileStat
+            else:
+                stale[title] = (content, fileStat)
+        return stale
+
+    def updateEmbeddings(self, embed_batch, batch_size: int = 32) -> int:
+        """ Computes embeddings of the stale notes only with `embed_batch` (e.g. RoBertaModel.embed_batch)
+        and returns their count. It's slow for many notes, so it should run in background
+        """
+
+        stale = list(self.staleEmbeddings().items())
+        for start in range(0, len(stale), batch_size):
+            chunk = stale[start:start + batch_size]
+            vectors = embed_batch([content for _, (content, _) in chunk])
+            self.embeddings.putMany(
+                {title: vector for (title, _), vector in zip(chunk, vectors)},
+                {title: text_hash(content) for title, (content, _) in chunk}
+            )
+            self._embeddedStats.update((title, fileStat) for title, (_, fileStat) in chunk)
+        return len(stale)
+
+    def similarNotes(self, title: str, k: int = 5) -> list:
+        """ Returns up to `k` (title, cosine similarity) of the notes most similar to the given one, best first.
+        The list is empty if the note has no embedding yet
+        """
+
+        vector = self.embeddings.get(title)
+        if vector is None:
+            return []
+        return self.embeddings.nearest(vector, k, exclude=[title])
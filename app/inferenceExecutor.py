@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class InferenceExecutor(QObject):
+    """ Runs model calls on a background thread and sends results back through Qt signals.
+
+    Every job is submitted under a key (e.g. a note's title). A newer job for the same key
+    cancels the older one if it hasn't started yet, otherwise the older result is just dropped.
+    """
+
+    resultReady = pyqtSignal(str, object)
+    jobFailed = pyqtSignal(str, str)
+
+    _jobFinished = pyqtSignal(str, int, object, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._jobIds = count()
+        self._latestJobs: dict = {}  # key -> (job id, future), touched only from the GUI thread
+
+        self._jobFinished.connect(self._onJobFinished)
+
+    def submit(self, key: str, fn, *args) -> int:
+        self.cancel(key)
+
+        jobId = next(self._jobIds)
+        future = self._pool.submit(self._run, key, jobId, fn, args)
+        self._latestJobs[key] = (jobId, future)
+        return jobId
+
+    def cancel(self, key: str):
+        if key in self._latestJobs:
+            _, future = self._latestJobs.pop(key)
+            future.cancel()
+
+    def hasPendingJobs(self) -> bool:
+        return bool(self._latestJobs)
+
+    def shutdown(self):
+        for key in list(self._latestJobs.keys()):
+            self.cancel(key)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, key: str, jobId: int, fn, args):
+        # executed in the worker thread, so the signal is delivered to the GUI thread through the event queue
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self._jobFinished.emit(key, jobId, None, str(e) or type(e).__name__)
+        else:
+            self._jobFinished.emit(key, jobId, result, "")
+
+    @pyqtSlot(str, int, object, str)
+    def _onJobFinished(self, key: str, jobId: int, result, error: str):
+        if key not in self._latestJobs or self._latestJobs[key][0] != jobId:
+            return  # the job was superseded by a newer one or cancelled
+
+        del self._latestJobs[key]
+        if error:
+            self.jobFailed.emit(key, error)
+        else:
+            self.resultReady.emit(key, result)
@@ -1,5 +1,5 @@
 import sys
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow, 
@@ -8,10 +8,13 @@ from PyQt6.QtWidgets import (
 )
 
 from .sideBar import SideBar
-from .fileBar import FileBar
+from .fileBar import FileBar, FILE_WORKER
 from .addButton import AddButton
-from .noteWindow import NoteWindow
+from .noteWindow import NoteWindow, PREDICTION_MODEL
 from .statisticWindow import AnalyticsWidget
+from .fileWorker import FileWorker
+from ..metrics import METRICS
+from ..cache_service import flush_caches
 
 
 class Window(QMainWindow):
@@ -116,4 +119,13 @@ if __name__ == "__main__":
     app = QApplication([])
     window = Window()
     window.show()
+    app.aboutToQuit.connect(window.noteWindow.inferenceExecutor.shutdown)
+    app.aboutToQuit.connect(window.noteWindow.indexExecutor.shutdown)
+    app.aboutToQuit.connect(FILE_WORKER.close)
+    app.aboutToQuit.connect(flush_caches)
+    if METRICS.enabled:
+        app.aboutToQuit.connect(lambda: METRICS.dump(FileWorker.notesDirectory + "/metrics.json"))
+
+    # the model is loaded in background once the window is painted
+    QTimer.singleShot(0, PREDICTION_MODEL.startLoading)
     sys.exit(app.exec())
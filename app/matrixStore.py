@@ -0,0 +1,245 @@
+import os
+import json
+import threading
+
+import numpy as np
+
+
+class MatrixStore:
+    """ Fixed-width vectors of notes in a flat binary file, one row per note.
+
+    `<path>.bin` is a C-ordered (capacity, width) array of `dtype` which can be read with NumPy memmap,
+    `<path>.json` maps note titles to row numbers and lists free rows of deleted notes for reuse.
+    Rows are written in place, so updating one note doesn't rewrite the others.
+    Every vector can have a tag, e.g. a hash of the content it was computed from.
+
+    The first line of the index is a snapshot and every next one is a JSON change ("put", title, row, tag),
+    ("delete", title) or ("rename", old title, new title), so a put appends a line instead of rewriting the index.
+    The index is compacted into a new snapshot once it has more changes than rows.
+    """
+
+    minChanges = 1024  # changes appended before the index may be compacted
+
+    def __init__(self, path: str, width: int, dtype=np.float16):
+        self.dataPath = path + ".bin"
+        self.indexPath = path + ".json"
+        self.width = width
+        self.dtype = np.dtype(dtype)
+
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._tags = {}
+        self._free = []
+        self._rowTitles = None
+        self._freeRows = None
+        self._capacity = 0
+        self._matrix = None
+        self._changes = None  # changes appended after the snapshot, None if the index has to be rewritten
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.indexPath):
+            return
+
+        with open(self.indexPath, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+
+        index = json.loads(lines[0])
+        if index["width"] != self.width or index["dtype"] != self.dtype.name:
+            return  # vectors of another model are useless, they're overwritten from scratch
+
+        self._rows = index["rows"]
+        self._tags = index.get("tags", {})
+        self._free = index["free"]
+        for number, line in enumerate(lines[1:], 2):
+            try:
+                self._replay(json.loads(line))
+            except ValueError:
+                if number == len(lines) and not line.endswith("\n"):
+                    break  # the last line was being written when the app stopped
+                raise ValueError(f"The index {self.indexPath} is broken at line {number}")
+
+        capacity = os.path.getsize(self.dataPath) // self._rowSize() if os.path.exists(self.dataPath) else 0
+        self._rows = {title: row for title, row in self._rows.items() if row < capacity}
+        self._tags = {title: tag for title, tag in self._tags.items() if title in self._rows}
+        self._free = [row for row in self._free if row < capacity]
+        self._capacity = capacity
+        if lines[-1].endswith("\n"):  # otherwise it's an index of the older format or its last line is cut off
+            self._changes = len(lines) - 1
+
+    def _replay(self, change: list):
+        if change[0] == "put":
+            _, title, row, tag = change
+            if title in self._rows and self._rows[title] != row:
+                self._free.append(self._rows[title])
+            if row in self._free:
+                self._free.remove(row)
+            self._rows[title] = row
+            if tag is not None:
+                self._tags[title] = tag
+        elif change[0] == "delete":
+            self._free.append(self._rows.pop(change[1]))
+            self._tags.pop(change[1], None)
+        else:
+            _, oldTitle, newTitle = change
+            self._moveRow(oldTitle, newTitle)
+
+    def _rowSize(self) -> int:
+        return self.width * self.dtype.itemsize
+
+    def _saveIndex(self, changes: list):
+        """Appends the changes to the index, or writes a new snapshot if there are too many of them"""
+
+        if self._changes is not None and self._changes + len(changes) <= max(len(self._rows), self.minChanges):
+            with open(self.indexPath, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(change, ensure_ascii=False) + "\n" for change in changes)
+            self._changes += len(changes)
+            return
+
+        tmpPath = self.indexPath + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            json.dump({"width": self.width, "dtype": self.dtype.name, "rows": self._rows, "tags": self._tags, "free": self._free}, f)
+            f.write("\n")
+        os.replace(tmpPath, self.indexPath)
+        self._changes = 0
+
+    def _setRowTitle(self, row: int, title):
+        """Keeps the row titles of `nearest` up to date, once they're built"""
+
+        if self._rowTitles is None:
+            return
+        if row >= len(self._rowTitles):
+            grown = np.full(max(row + 1, 2 * len(self._rowTitles)), None, dtype=object)
+            grown[:len(self._rowTitles)] = self._rowTitles
+            self._rowTitles = grown  # `nearest` may still be reading the old array
+        self._rowTitles[row] = title
+
+    def _allocate(self, title: str) -> int:
+        if title in self._rows:
+            return self._rows[title]
+
+        row = self._free.pop() if self._free else self._capacity
+        self._capacity = max(self._capacity, row + 1)
+        self._rows[title] = row
+        self._freeRows = None
+        self._setRowTitle(row, title)
+        return row
+
+    def _release(self, title: str):
+        row = self._rows.pop(title)
+        self._free.append(row)
+        self._tags.pop(title, None)
+        self._freeRows = None
+        self._setRowTitle(row, None)
+
+    def _moveRow(self, oldTitle: str, newTitle: str):
+        if newTitle in self._rows:
+            self._release(newTitle)
+        self._rows[newTitle] = self._rows.pop(oldTitle)
+        if oldTitle in self._tags:
+            self._tags[newTitle] = self._tags.pop(oldTitle)
+        self._setRowTitle(self._rows[newTitle], newTitle)
+
+    def putMany(self, vectors: dict, tags: dict = None):
+        """ Writes vectors ({title: vector}) into their rows and saves the index once"""
+
+        if not vectors:
+            return
+
+        tags = tags or {}
+        with self._lock:
+            capacity = self._capacity
+            changes = []
+            mode = "r+b" if os.path.exists(self.dataPath) else "w+b"
+            with open(self.dataPath, mode) as f:
+                for title, vector in vectors.items():
+                    row = self._allocate(title)
+                    f.seek(row * self._rowSize())
+                    f.write(np.asarray(vector, dtype=self.dtype).reshape(self.width).tobytes())
+                    changes.append(("put", title, row, tags.get(title)))
+            self._tags.update(tags)
+            if self._capacity != capacity:
+                self._matrix = None  # the rows are written in place, so the mapping sees them unless the file grew
+            self._saveIndex(changes)
+
+    def put(self, title: str, vector, tag: str = None):
+        self.putMany({title: vector}, None if tag is None else {title: tag})
+
+    def delete(self, title: str):
+        with self._lock:
+            if title in self._rows:
+                self._release(title)
+                self._saveIndex([("delete", title)])
+
+    def keep(self, titles):
+        """Frees rows of all the notes except the given ones"""
+        with self._lock:
+            removed = [title for title in self._rows if title not in titles]
+            for title in removed:
+                self._release(title)
+            if removed:
+                self._saveIndex([("delete", title) for title in removed])
+
+    def rename(self, oldTitle: str, newTitle: str):
+        with self._lock:
+            if oldTitle in self._rows:
+                self._moveRow(oldTitle, newTitle)
+                self._saveIndex([("rename", oldTitle, newTitle)])
+
+    def __contains__(self, title: str) -> bool:
+        return title in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def tag(self, title: str):
+        return self._tags.get(title)
+
+    def titles(self) -> list:
+        with self._lock:
+            return list(self._rows.keys())
+
+    def matrix(self) -> np.ndarray:
+        """Read-only memory-mapped (capacity, width) array of all rows, free rows included"""
+        with self._lock:
+            if self._capacity == 0:
+                return np.zeros((0, self.width), dtype=self.dtype)
+            if self._matrix is None:
+                self._matrix = np.memmap(self.dataPath, dtype=self.dtype, mode="r", shape=(self._capacity, self.width))
+            return self._matrix
+
+    def rows(self, titles: list) -> np.ndarray:
+        """Row numbers of the titles, -1 for titles without a vector"""
+        with self._lock:
+            return np.array([self._rows.get(title, -1) for title in titles], dtype=np.int64)
+
+    def get(self, title: str):
+        with self._lock:
+            if title not in self._rows:
+                return None
+            return np.array(self.matrix()[self._rows[title]])
+
+    def nearest(self, vector, k: int = 5, exclude=()) -> list:
+        """ Returns up to `k` (title, score) pairs with the largest dot products with the vector, best first.
+        For L2-normalized vectors the score is the cosine similarity
+        """
+        with self._lock:
+            matrix = self.matrix()
+            if self._rowTitles is None:
+                self._rowTitles = np.full(self._capacity, None, dtype=object)
+                self._rowTitles[list(self._rows.values())] = list(self._rows.keys())
+            if self._freeRows is None:
+                self._freeRows = np.array(self._free, dtype=np.int64)
+            rowTitles, freeRows = self._rowTitles, self._freeRows
+            excludedRows = [self._rows[title] for title in exclude if title in self._rows]
+
+        scores = matrix @ np.asarray(vector, dtype=self.dtype)
+        scores[freeRows] = -np.inf
+        scores[excludedRows] = -np.inf
+
+        k = min(k, len(scores) - len(freeRows) - len(set(excludedRows)))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(rowTitles[row], float(scores[row])) for row in best]
@@ -0,0 +1,165 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def toTimestamp(date: str) -> int:
+    return int(datetime.strptime(date, DATE_FORMAT).timestamp())
+
+
+def fromTimestamp(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
+
+
+class SqliteMetaStore:
+    """ Metadata of the notes in an SQLite database: a row per note with an indexed title and an integer
+    modified timestamp and a join table of the note emotions in their order. The notes are queried
+    through FileWorker's NoteIndex, so the database has no other indexes.
+
+    It has the interface of JsonMetaStore from fileWorker: `changed`, `removed` and `renamed` record changes of
+    FileWorker's dict, `pending` takes a snapshot of them and `write` saves it. Only the recorded changes are written,
+    so saving a note is a few row writes instead of the whole metadata.
+    An empty database is filled from `legacyPath` (meta_info.json) once, the JSON file is renamed afterwards.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL UNIQUE,
+            modified INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS note_emotions (
+            note_id INTEGER NOT NULL REFERENCES notes (id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            emotion TEXT NOT NULL,
+            PRIMARY KEY (note_id, position)
+        );
+    """
+    # indexes and a column of the earlier schema, nothing reads them
+    obsolete = """
+        DROP INDEX IF EXISTS notes_created;
+        DROP INDEX IF EXISTS notes_modified;
+        DROP INDEX IF EXISTS note_emotions_emotion;
+    """
+
+    def __init__(self, path: str, legacyPath: str = None):
+        self.path = path
+        self.legacyPath = legacyPath
+        self._connection = None
+        self._lock = threading.Lock()
+        self._changes = []  # ("changed" | "removed", title) or ("renamed", old title, new title) in their order
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # the connection is shared by the GUI thread and the autosave thread, SQLite serializes their calls
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA foreign_keys = ON")
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            self._connection.executescript(self.schema)
+            self._connection.executescript(self.obsolete)
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(notes)")]
+            if "created" in columns:
+                self._connection.execute("ALTER TABLE notes DROP COLUMN created")
+        return self._connection
+
+    def create(self):
+        self._connect()
+
+    def load(self) -> dict:
+        connection = self._connect()
+        if self.legacyPath is not None and os.path.exists(self.legacyPath) and not connection.execute("SELECT 1 FROM notes LIMIT 1").fetchone():
+            self.migrate(self.legacyPath)
+
+        filesInfo = {}
+        rows = connection.execute("""
+            SELECT notes.title, notes.modified, note_emotions.emotion FROM notes
+            LEFT JOIN note_emotions ON note_emotions.note_id = notes.id
+            ORDER BY notes.id, note_emotions.position
+        """)
+        for title, modified, emotion in rows:
+            info = filesInfo.setdefault(title, {"date": fromTimestamp(modified), "emotion": []})
+            if emotion is not None:
+                info["emotion"].append(emotion)
+        return filesInfo
+
+    def migrate(self, jsonPath: str):
+        """Copies the metadata from meta_info.json in one transaction and renames the JSON file, so it's done once"""
+        with open(jsonPath, "r", encoding="utf-8") as f:
+            filesInfo = json.load(f)
+
+        with self._connect() as connection:
+            for title, info in filesInfo.items():
+                self._put(connection, title, toTimestamp(info["date"]), info["emotion"])
+        os.replace(jsonPath, jsonPath + ".migrated")
+
+    def changed(self, title: str):
+        with self._lock:
+            self._changes.append(("changed", title))
+
+    def removed(self, title: str):
+        with self._lock:
+            self._changes.append(("removed", title))
+
+    def renamed(self, oldTitle: str, newTitle: str):
+        with self._lock:
+            self._changes.append(("renamed", oldTitle, newTitle))
+
+    def pending(self, filesInfo: dict) -> list:
+        """Recorded changes with the current metadata of the changed notes"""
+        with self._lock:
+            changes, self._changes = self._changes, []
+
+        snapshot = []
+        for change in changes:
+            if change[0] == "changed":
+                info = filesInfo.get(change[1])
+                if info is not None:
+                    snapshot.append(("changed", change[1], toTimestamp(info["date"]), list(info["emotion"])))
+            elif change[0] == "renamed":
+                # a note may be renamed before its first write, so the new title gets the whole row
+                info = filesInfo.get(change[2])
+                modified, emotions = (toTimestamp(info["date"]), list(info["emotion"])) if info is not None else (None, None)
+                snapshot.append((*change, modified, emotions))
+            else:
+                snapshot.append(change)
+        return snapshot
+
+    @staticmethod
+    def _put(connection, title: str, modified: int, emotions: list):
+        connection.execute("""
+            INSERT INTO notes (title, modified) VALUES (?, ?)
+            ON CONFLICT (title) DO UPDATE SET modified = excluded.modified
+        """, (title, modified))
+        noteId = connection.execute("SELECT id FROM notes WHERE title = ?", (title,)).fetchone()[0]
+        connection.execute("DELETE FROM note_emotions WHERE note_id = ?", (noteId,))
+        connection.executemany("INSERT INTO note_emotions (note_id, position, emotion) VALUES (?, ?, ?)",
+                               [(noteId, position, emotion) for position, emotion in enumerate(emotions)])
+
+    def write(self, changes: list):
+        if not changes:
+            return
+
+        with self._connect() as connection:
+            for change in changes:
+                if change[0] == "changed":
+                    _, title, modified, emotions = change
+                    self._put(connection, title, modified, emotions)
+                elif change[0] == "removed":
+                    connection.execute("DELETE FROM notes WHERE title = ?", (change[1],))
+                else:
+                    _, oldTitle, newTitle, modified, emotions = change
+                    connection.execute("DELETE FROM notes WHERE title = ?", (newTitle,))
+                    connection.execute("UPDATE notes SET title = ? WHERE title = ?", (newTitle, oldTitle))
+                    if modified is not None:
+                        self._put(connection, newTitle, modified, emotions)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,54 @@
+import threading
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class ModelHandle(QObject):
+    """ Builds a model with the given factory on a background thread.
+
+    Nothing is loaded until `startLoading` or `get` is called, so the heavy imports and weights
+    loading don't delay the first paint of the app.
+    """
+
+    loaded = pyqtSignal()
+    loadFailed = pyqtSignal(str)
+
+    def __init__(self, factory, parent=None):
+        super().__init__(parent)
+
+        self._factory = factory
+        self._model = None
+        self._error = None
+        self._thread = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def startLoading(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        try:
+            self._model = self._factory()
+        except Exception as e:
+            self._error = e
+            self._done.set()
+            self.loadFailed.emit(str(e) or type(e).__name__)
+        else:
+            self._done.set()
+            self.loaded.emit()
+
+    def isReady(self) -> bool:
+        return self._done.is_set() and self._error is None
+
+    def get(self, timeout: float = None):
+        """ Returns the model waiting until it's loaded. Starts loading if it wasn't started yet"""
+
+        self.startLoading()
+        if not self._done.wait(timeout):
+            raise TimeoutError("The model is still loading")
+        if self._error is not None:
+            raise RuntimeError("The model couldn't be loaded") from self._error
+        return self._model
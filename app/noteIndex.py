@@ -0,0 +1,94 @@
+from bisect import bisect_left, insort
+
+from .metaStore import toTimestamp
+
+
+class NoteIndex:
+    """ Indexes of FileWorker's metadata ({title: {"date", "emotion"}}) which are updated note by note:
+    epoch timestamps of the dates parsed once, (timestamp, title) and title lists kept sorted for bisection
+    and an inverted index of the emotions. FileWorker calls `put`, `remove` and `rename` under its lock.
+    """
+
+    def __init__(self, filesInfo: dict):
+        self._timestamps = {title: toTimestamp(info["date"]) for title, info in filesInfo.items()}
+        self._byDate = sorted((timestamp, title) for title, timestamp in self._timestamps.items())
+        self._byTitle = sorted(filesInfo)
+        self._emotions = {}  # title -> emotions it's indexed under
+        self._byEmotion = {}  # emotion -> {title: None}, ordered by the indexing time
+        for title, info in filesInfo.items():
+            self._indexEmotions(title, info["emotion"])
+
+    def _indexEmotions(self, title: str, emotions: list):
+        self._emotions[title] = [emotion for emotion in dict.fromkeys(emotions) if emotion]
+        for emotion in self._emotions[title]:
+            self._byEmotion.setdefault(emotion, {})[title] = None
+
+    @staticmethod
+    def _discard(items: list, item):
+        position = bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    def put(self, title: str, info: dict):
+        """Adds a note or updates the date and the emotions of an indexed one"""
+
+        timestamp = toTimestamp(info["date"])
+        previous = self._timestamps.get(title)
+        if previous is None:
+            insort(self._byTitle, title)
+        if previous != timestamp:
+            if previous is not None:
+                self._discard(self._byDate, (previous, title))
+            insort(self._byDate, (timestamp, title))
+            self._timestamps[title] = timestamp
+
+        if self._emotions.get(title) != [emotion for emotion in dict.fromkeys(info["emotion"]) if emotion]:
+            self._removeEmotions(title)
+            self._indexEmotions(title, info["emotion"])
+
+    def _removeEmotions(self, title: str):
+        for emotion in self._emotions.pop(title, []):
+            titles = self._byEmotion[emotion]
+            del titles[title]
+            if not titles:
+                del self._byEmotion[emotion]
+
+    def remove(self, title: str):
+        timestamp = self._timestamps.pop(title, None)
+        if timestamp is None:
+            return
+        self._discard(self._byDate, (timestamp, title))
+        self._discard(self._byTitle, title)
+        self._removeEmotions(title)
+
+    def rename(self, oldTitle: str, newTitle: str):
+        timestamp = self._timestamps.get(oldTitle)
+        if timestamp is None:
+            return
+        emotions = self._emotions.get(oldTitle, [])
+        self.remove(newTitle)
+        self.remove(oldTitle)
+        self._timestamps[newTitle] = timestamp
+        insort(self._byDate, (timestamp, newTitle))
+        insort(self._byTitle, newTitle)
+        self._indexEmotions(newTitle, emotions)
+
+    def timestamp(self, title: str):
+        return self._timestamps.get(title)
+
+    def between(self, start: float, end: float) -> list:
+        """Titles of the notes dated in [start, end), oldest first"""
+
+        first = bisect_left(self._byDate, (start,))
+        last = bisect_left(self._byDate, (end,))
+        return [title for _, title in self._byDate[first:last]]
+
+    def withEmotion(self, emotion: str) -> list:
+        return list(self._byEmotion.get(emotion, ()))
+
+    def sortedBy(self, key: str) -> list:
+        if key == "date":
+            return [title for _, title in self._byDate]
+        if key == "title":
+            return list(self._byTitle)
+        raise ValueError(f"Unknown sort key: {key}. Use 'date' or 'title'")
@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+
+
+def contentHash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _commonLength(previous: str, content: str, limit: int, fromEnd: bool, chunk: int = 4096) -> int:
+    """ Length of the common prefix (or suffix) of the texts up to `limit`. It's compared chunk by chunk
+    and then character by character inside the first different chunk, so it stops near the first difference
+    """
+
+    def piece(text, start, stop):
+        return text[len(text) - stop:len(text) - start] if fromEnd else text[start:stop]
+
+    length = 0
+    while length < limit:
+        stop = min(length + chunk, limit)
+        if piece(previous, length, stop) != piece(content, length, stop):
+            break
+        length = stop
+    while length < limit and piece(previous, length, length + 1) == piece(content, length, length + 1):
+        length += 1
+    return length
+
+
+def delta(previous: str, content: str) -> tuple:
+    """ The edit turning `previous` into `content` as (start, removed characters count, inserted text),
+    i.e. everything between their common prefix and common suffix
+    """
+
+    limit = min(len(previous), len(content))
+    prefix = _commonLength(previous, content, limit, fromEnd=False)
+    suffix = _commonLength(previous, content, limit - prefix, fromEnd=True)
+    return prefix, len(previous) - prefix - suffix, content[prefix:len(content) - suffix]
+
+
+class NoteJournal:
+    """ Edits of the notes appended to `<title>.journal` next to `<title>.txt`, which is the checkpoint of the note.
+
+    The first line of a journal is {"base": hash of the checkpoint} and every next one is a JSON
+    [start, removed, inserted] delta, so saving an edit writes a line of the edit size instead of the whole note.
+    `fold` writes the current content as a new checkpoint and removes the journal. A journal whose base isn't
+    the checkpoint was folded already (the app stopped between the two steps), so it's ignored.
+    A last line cut off by a crash is skipped and removed before the next edit is appended.
+    """
+
+    suffix = ".journal"
+
+    def __init__(self, directory: str, compactSize: int = 32 * 1024):
+        self.directory = directory
+        self.compactSize = compactSize
+
+    def checkpointPath(self, title: str) -> str:
+        return self.directory + "/" + title + ".txt"
+
+    def path(self, title: str) -> str:
+        return self.directory + "/" + title + self.suffix
+
+    def replay(self, title: str, checkpoint: str) -> str:
+        """Content of the note from its checkpoint and the journal"""
+
+        if not os.path.exists(self.path(title)):
+            return checkpoint
+
+        with open(self.path(title), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+
+        try:
+            base = json.loads(lines[0])["base"]
+        except (IndexError, ValueError, KeyError):
+            base = None
+        if base != contentHash(checkpoint):
+            os.remove(self.path(title))
+            return checkpoint
+
+        content = checkpoint
+        for number, line in enumerate(lines[1:], 2):
+            try:
+                start, removed, inserted = json.loads(line)
+            except ValueError:
+                if number == len(lines) and not line.endswith("\n"):
+                    break  # the last line was being written when the app stopped
+                raise ValueError(f"The journal of {title} note is broken at line {number}")
+            content = content[:start] + inserted + content[start + removed:]
+        return content
+
+    def _dropTornLine(self, title: str) -> int:
+        """ Cuts off the last line of the journal if the app stopped while it was written, so the next edit
+        starts on its own line. Returns the size of the journal (0 if there is none)
+        """
+
+        if not os.path.exists(self.path(title)):
+            return 0
+
+        with open(self.path(title), "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(position - 4096, 0)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                f.truncate(position)
+            return position
+
+    def append(self, title: str, previous: str, content: str) -> bool:
+        """ Appends the edit from `previous` (the content on disk) to `content`,
+        returns True if the journal is big enough to be folded
+        """
+
+        start, removed, inserted = delta(previous, content)
+        if not removed and not inserted:
+            return False
+
+        lines = []
+        if self._dropTornLine(title) == 0:
+            lines.append(json.dumps({"base": contentHash(previous)}) + "\n")  # without a journal the checkpoint is the content
+        lines.append(json.dumps([start, removed, inserted], ensure_ascii=False) + "\n")
+        with open(self.path(title), "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            size = f.tell()
+        return size > self.compactSize
+
+    def fold(self, title: str, content: str):
+        tmpPath = self.checkpointPath(title) + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmpPath, self.checkpointPath(title))
+        if os.path.exists(self.path(title)):
+            os.remove(self.path(title))
+
+    def stat(self, title: str) -> tuple:
+        """(size, modification time) of the checkpoint and of the journal, if there is one"""
+
+        stat = os.stat(self.checkpointPath(title))
+        result = (stat.st_size, stat.st_mtime_ns)
+        if os.path.exists(self.path(title)):
+            stat = os.stat(self.path(title))
+            result += (stat.st_size, stat.st_mtime_ns)
+        return result
+
+    def rename(self, oldTitle: str, newTitle: str):
+        if os.path.exists(self.path(oldTitle)):
+            os.replace(self.path(oldTitle), self.path(newTitle))
+
+    def remove(self, title: str):
+        if os.path.exists(self.path(title)):
+            os.remove(self.path(title))
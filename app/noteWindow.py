@@ -1,4 +1,7 @@
-from PyQt6.QtCore import QSize, pyqtSignal, pyqtSlot
+import os
+import logging
+
+from PyQt6.QtCore import QSize, QTimer, pyqtSignal, pyqtSlot
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (
     QWidget,
@@ -8,17 +11,61 @@ from PyQt6.QtWidgets import (
     QTextEdit,
     QLabel,
     QPushButton,
-    QApplication,
     QCheckBox,
-    QDialog
+    QDialog,
+    QMessageBox
 )
 
 from .fileBar import FILE_WORKER
 from .preloaderDialog import LoadingDialog
-from ..model_service import RoBertaModel
+from .inferenceExecutor import InferenceExecutor
+from .modelHandle import ModelHandle
+from .paragraphScorer import ParagraphScorer
+from ..model_packaging import DEFAULT_MODEL_PATH, weights_path
+
+
+MODEL_PATH = DEFAULT_MODEL_PATH
+LONG_TEXT_MODE = 'mean'
+MODEL_ENGINE = 'torch'  # 'int8' or 'onnx' are faster on CPU, check their accuracy with emotion_analyser.evaluation
+LIVE_ANALYSIS_DELAY_MS = 1500  # a pause in typing after which the live analysis runs
+
+
+def _loadPredictionModel():
+    from ..model_server import ModelClient
+
+    # a running model server already holds a warm model, so the app doesn't load its own copy
+    if ModelClient.is_available():
+        return ModelClient()
+
+    # imported here to keep torch and transformers out of the app startup
+    from ..model_service import RoBertaModel
+    from ..cache_service import PersistentLRUCache, PredictionCache
+    from ..translation_service import TranslationService
+    from ..cascade import CASCADE_CONFIG_PATH, load_cascade
+
+    # entries are probability vectors of all the emotions, "proba" keeps them apart from top-3 lists of older versions
+    cache = PredictionCache(FILE_WORKER.notesDirectory + "/prediction_cache.json", [weights_path(MODEL_PATH)], variant=f"proba-{LONG_TEXT_MODE}-{MODEL_ENGINE}")
+    translator = TranslationService(cache=PersistentLRUCache(FILE_WORKER.notesDirectory + "/translation_cache.json"))
+    model = RoBertaModel(MODEL_PATH, cache=cache, long_text_mode=LONG_TEXT_MODE, engine=MODEL_ENGINE, translator=translator)
 
+    # once the cascade is calibrated, easy notes are analysed by the fast model in milliseconds
+    if os.path.exists(CASCADE_CONFIG_PATH):
+        return load_cascade(model)
+    return model
 
-PREDICTION_MODEL = RoBertaModel('emotion_analyser/model/nlp_model.pt')
+
+PREDICTION_MODEL = ModelHandle(_loadPredictionModel)
+
+
+def _analyseText(text: str) -> tuple:
+    """ Returns top-3 emotions of the text and probabilities of all the emotions,
+    the probabilities are None if the model doesn't give them (e.g. the model server)
+    """
+    model = PREDICTION_MODEL.get()
+    if hasattr(model, "predict_batch_with_proba"):
+        emotions, probabilities = model.predict_batch_with_proba([text])
+        return emotions[0], probabilities[0]
+    return model.predict(text), None
 
 
 class NoteWindow(QWidget):
@@ -72,6 +119,20 @@ class NoteWindow(QWidget):
         super().__init__(parent)
 
         self.previousTitle = ""
+        self.paragraphScorer = None
+
+        self.liveAnalysisTimer = QTimer(self)
+        self.liveAnalysisTimer.setSingleShot(True)
+        self.liveAnalysisTimer.setInterval(LIVE_ANALYSIS_DELAY_MS)
+        self.liveAnalysisTimer.timeout.connect(self._analyseLive)
+
+        self.loadingDialog = LoadingDialog(self)
+        self.inferenceExecutor = InferenceExecutor(self)
+        self.inferenceExecutor.resultReady.connect(self._onPredictionReady)
+        self.inferenceExecutor.jobFailed.connect(self._onPredictionFailed)
+        # embeddings for the similar notes search are computed on their own thread, they don't delay the analysis
+        self.indexExecutor = InferenceExecutor(self)
+        self.indexExecutor.jobFailed.connect(self._onIndexingFailed)
 
         self.titleField = QLineEdit()
         self.titleField.setPlaceholderText("Title")
@@ -97,12 +158,28 @@ class NoteWindow(QWidget):
         self.setLayout(self.emLayout)
 
         self.header.changeEmotionsRequested.connect(self._changeEmotions)
+        self.header.liveAnalysisToggled.connect(self._onLiveAnalysisToggled)
+
+        PREDICTION_MODEL.loaded.connect(self._onModelLoaded)
+        PREDICTION_MODEL.loadFailed.connect(self._onModelLoadFailed)
+        self.header.setModelReady(PREDICTION_MODEL.isReady())
+
+    @pyqtSlot()
+    def _onModelLoaded(self):
+        self.header.setModelReady(True)
+        if not hasattr(PREDICTION_MODEL.get(), "predict_proba_batch"):
+            self.header.setLiveAnalysisAvailable(False, "The live analysis isn't supported by the model server")
+        self._updateEmbeddings()
+
+    @pyqtSlot(str)
+    def _onModelLoadFailed(self, error):
+        self.header.setModelReady(False, f"The model couldn't be loaded: {error}")
 
     def _changeEmotions(self):
         dialog = ChangeEmotionsDialog(self.header.emotionContainer.text().split(", "))
         if dialog.exec() == QDialog.DialogCode.Accepted:
             new_emotions = dialog._save_emotions()
-            selected_emotion_ids = [emotion_name for _, emotion_name in PREDICTION_MODEL.emotions.items() if emotion_name in new_emotions]
+            selected_emotion_ids = [emotion_name for _, emotion_name in PREDICTION_MODEL.get().emotions.items() if emotion_name in new_emotions]
             FILE_WORKER.changeEmotions(self.titleField.text(), selected_emotion_ids)
             self.header.emotionContainer.setText(", ".join(new_emotions))
     
@@ -118,6 +195,9 @@ class NoteWindow(QWidget):
     def _onContentChanged(self):
         if self.contentField.toPlainText():
             FILE_WORKER.addNewNote(self.titleField.text(), self.contentField.toPlainText())
+
+        if self.header.liveAnalysisCheckBox.isChecked():
+            self.liveAnalysisTimer.start()  # restarted on every change, so it fires only after a pause
     
     @pyqtSlot()
     def _onTitleChanged(self):
@@ -134,28 +214,75 @@ class NoteWindow(QWidget):
         self.titleField.setText("")
         self.contentField.setText("")
         self.header.emotionContainer.setText("")
+        self.liveAnalysisTimer.stop()
+        FILE_WORKER.flush()  # the note is written at once, not after the autosave delay, before its embedding is updated
+        self._updateEmbeddings()
 
         self.windowClosed.emit()
     
-    def _predictText(self, text):
-        # TODO: animation doesn't work
-        loadingDialog = LoadingDialog(self)
-        loadingDialog.show()
+    @pyqtSlot(bool)
+    def _onLiveAnalysisToggled(self, enabled):
+        if enabled:
+            self.liveAnalysisTimer.start()
+        else:
+            self.liveAnalysisTimer.stop()
+
+    @pyqtSlot()
+    def _analyseLive(self):
+        text = self.contentField.toPlainText()
+        if not PREDICTION_MODEL.isReady() or not self.titleField.text() or not text.strip():
+            return
+
+        if self.paragraphScorer is None:
+            model = PREDICTION_MODEL.get()
+            self.paragraphScorer = ParagraphScorer(model.predict_proba_batch, model.emotions)
+
+        # no loading dialog here, the analysis mustn't interrupt typing
+        self.inferenceExecutor.submit(self.titleField.text(), self.paragraphScorer.analyse, text)
 
-        QApplication.processEvents()
+    def _predictText(self, text):
+        self.loadingDialog.show()
+        self.inferenceExecutor.submit(self.titleField.text(), _analyseText, text)
 
-        prediction = PREDICTION_MODEL.predict(text)
+    @pyqtSlot(str, object)
+    def _onPredictionReady(self, title, result):
+        prediction, probabilities = result
+        if not self.inferenceExecutor.hasPendingJobs():
+            self.loadingDialog.close()
 
-        loadingDialog.close()
+        if title != self.titleField.text():
+            # the note was switched while the analysis was running
+            FILE_WORKER.changeEmotions(title, prediction, probabilities)
+            return
 
         self.header.emotionContainer.setText(", ".join(prediction))
-        FILE_WORKER.addNewNote(self.titleField.text(), self.contentField.toPlainText(), self.header.emotionContainer.text().split(", "), u=True)
+        FILE_WORKER.addNewNote(self.titleField.text(), self.contentField.toPlainText(), self.header.emotionContainer.text().split(", "), u=True, probabilities=probabilities)
+
+    def _updateEmbeddings(self):
+        """Computes embeddings of new and changed notes, the model server doesn't give them"""
+        if PREDICTION_MODEL.isReady() and hasattr(PREDICTION_MODEL.get(), "embed_batch"):
+            self.indexExecutor.submit("embeddings", FILE_WORKER.updateEmbeddings, PREDICTION_MODEL.get().embed_batch)
+
+    @pyqtSlot(str, str)
+    def _onIndexingFailed(self, _, error):
+        logging.getLogger(__name__).warning("Couldn't compute embeddings of the notes: %s", error)
+
+    @pyqtSlot(str, str)
+    def _onPredictionFailed(self, title, error):
+        if not self.inferenceExecutor.hasPendingJobs():
+            self.loadingDialog.close()
+
+        # otherwise the same error would come after every pause in typing
+        self.header.liveAnalysisCheckBox.setChecked(False)
+
+        QMessageBox.warning(self, "Analysis failed", f"Couldn't analyse {title} note: {error}")
 
 
 class NoteWindowHeader(QHBoxLayout):
     closeRequested = pyqtSignal()
     textChanged = pyqtSignal(str)
     changeEmotionsRequested = pyqtSignal()
+    liveAnalysisToggled = pyqtSignal(bool)
 
     labelStyles = """
         QLabel {
@@ -209,11 +336,35 @@ class NoteWindowHeader(QHBoxLayout):
         self.changeEmotionsBtn.setStyleSheet(self.analyseButtonStyles)
         self.changeEmotionsBtn.clicked.connect(self._changeEmotionsClicked)
 
+        self.liveAnalysisCheckBox = QCheckBox("Live")
+        self.liveAnalysisCheckBox.setToolTip("Analyse the note while you type")
+        self.liveAnalysisCheckBox.toggled.connect(self.liveAnalysisToggled)
+        self.liveAnalysisAvailable = True
+
         self.addWidget(self.emotionContainer, 10)
+        self.addWidget(self.liveAnalysisCheckBox, 1)
         self.addWidget(self.changeEmotionsBtn, 1)
         self.addWidget(self.analyseBtn, 3)
         self.addWidget(self.closeBtn, 1)
     
+    def setModelReady(self, ready: bool, reason: str = "The model is warming up..."):
+        """ The analysis and emotions editing are available only once the model is loaded"""
+
+        self.analyseBtn.setEnabled(ready)
+        self.changeEmotionsBtn.setEnabled(ready)
+        self.analyseBtn.setToolTip("Analyse the note" if ready else reason)
+        self.changeEmotionsBtn.setToolTip("Change Emotions" if ready else reason)
+        if self.liveAnalysisAvailable:
+            self.liveAnalysisCheckBox.setEnabled(ready)
+            self.liveAnalysisCheckBox.setToolTip("Analyse the note while you type" if ready else reason)
+
+    def setLiveAnalysisAvailable(self, available: bool, reason: str = ""):
+        self.liveAnalysisAvailable = available
+        self.liveAnalysisCheckBox.setEnabled(available)
+        self.liveAnalysisCheckBox.setToolTip("Analyse the note while you type" if available else reason)
+        if not available:
+            self.liveAnalysisCheckBox.setChecked(False)
+
     def _closeButtonClicked(self):
         self.closeRequested.emit()
 
@@ -232,7 +383,7 @@ class ChangeEmotionsDialog(QDialog):
         self.setLayout(QVBoxLayout())
 
         self.emotion_checkboxes = []
-        for emotion_id, emotion_name in PREDICTION_MODEL.emotions.items():
+        for emotion_id, emotion_name in PREDICTION_MODEL.get().emotions.items():
             checkbox = QCheckBox(emotion_name)
             checkbox.setChecked(emotion_name in current_emotions)
             self.layout().addWidget(checkbox)
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ..cache_service import text_hash
+
+
+class ParagraphScorer:
+    """ Scores a note paragraph by paragraph and keeps the probabilities of every paragraph in memory.
+
+    Paragraphs are cached by their content hash, so after an edit only the changed paragraphs go through
+    `predict_proba_batch`. Emotions of the note are the top-3 of the paragraph probabilities averaged
+    with weights by paragraph length in words, the same way long notes are combined in the 'mean' mode.
+    """
+
+    def __init__(self, predict_proba_batch, emotions: dict, max_paragraphs: int = 4096):
+        self.predict_proba_batch = predict_proba_batch
+        self.emotions = emotions
+        self.max_paragraphs = max_paragraphs
+
+        self._probabilities = OrderedDict()  # paragraph hash -> probabilities, least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def splitParagraphs(text: str) -> list:
+        return [paragraph.strip() for paragraph in text.split("\n") if paragraph.strip()]
+
+    def missingParagraphs(self, text: str) -> list:
+        """Paragraphs of the text which aren't scored yet, without duplicates"""
+        with self._lock:
+            missing = {text_hash(p): p for p in self.splitParagraphs(text) if text_hash(p) not in self._probabilities}
+        return list(missing.values())
+
+    def probabilities(self, text: str) -> np.ndarray:
+        paragraphs = self.splitParagraphs(text)
+        if not paragraphs:
+            return np.zeros(len(self.emotions), dtype=np.float32)
+
+        missing = self.missingParagraphs(text)
+        scored = self.predict_proba_batch(missing) if missing else []
+
+        with self._lock:
+            for paragraph, row in zip(missing, scored):
+                self._probabilities[text_hash(paragraph)] = np.asarray(row, dtype=np.float32)
+
+            rows = []
+            for paragraph in paragraphs:
+                key = text_hash(paragraph)
+                self._probabilities.move_to_end(key)
+                rows.append(self._probabilities[key])
+
+            while len(self._probabilities) > max(self.max_paragraphs, len(paragraphs)):
+                self._probabilities.popitem(last=False)
+
+        weights = np.array([len(paragraph.split()) for paragraph in paragraphs], dtype=np.float32)
+        return weights @ np.stack(rows) / weights.sum()
+
+    def analyse(self, text: str) -> tuple:
+        """Top-3 emotions of the whole note and probabilities of all the emotions, ([], None) for an empty note"""
+        if not self.splitParagraphs(text):
+            return [], None
+
+        probabilities = self.probabilities(text)
+        return [self.emotions[i] for i in np.argsort(-probabilities, kind="stable")[:3]], probabilities
+
+    def predict(self, text: str) -> list:
+        return self.analyse(text)[0]
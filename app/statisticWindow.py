@@ -1,7 +1,8 @@
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QBrush, QColor, QFont
 import matplotlib.pyplot as plt
-from datetime import datetime, time
+import numpy as np
+from datetime import datetime, time, timedelta
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt6.QtWidgets import (
     QWidget,
@@ -10,7 +11,8 @@ from PyQt6.QtWidgets import (
     QDateEdit,
     QLabel,
     QHBoxLayout,
-    QCalendarWidget
+    QCalendarWidget,
+    QCheckBox
 )
 from .fileWorker import FileWorker
 
@@ -37,6 +39,12 @@ class AnalyticsWidget(QWidget):
         font-weight: bold;
     }
     """
+    time_ranges = {
+        "Morning": (time(5, 0), time(11, 0)),
+        "Day": (time(11, 0), time(18, 0)),
+        "Evening": (time(18, 0), time(23, 0)),
+        "Night": (time(23, 0), time(5, 0)),
+    }
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -52,6 +60,11 @@ class AnalyticsWidget(QWidget):
         self.comboBox.currentTextChanged.connect(self.update_inputs)
         self.layout().addWidget(self.comboBox)
 
+        self.softCheckBox = QCheckBox("Weight by probability")
+        self.softCheckBox.setToolTip("Sum probabilities of all the emotions instead of counting the top-3 emotions of the notes")
+        self.softCheckBox.toggled.connect(self.update_chart)
+        self.layout().addWidget(self.softCheckBox)
+
         self.dateEdit = QDateEdit()
         self.dateEdit.setDate(QDate.currentDate())
         self.dateLabel = QLabel("Select Date:")
@@ -104,6 +117,12 @@ class AnalyticsWidget(QWidget):
         self.monthLabel.setVisible(period == "Month")
         self.update_chart()
 
+    def _period_of(self, date: datetime) -> int:
+        """Position of the time of day of the date in time_ranges, a range with start > end goes over midnight"""
+        for j, (start, end) in enumerate(self.time_ranges.values()):
+            if start <= date.time() < end or (start > end and (date.time() >= start or date.time() < end)):
+                return j
+
     def update_chart(self):
         period = self.comboBox.currentText()
         selected_date = self.dateEdit.date().toPyDate() if period in ["Day", "Time of Day"] else None
@@ -114,42 +133,44 @@ class AnalyticsWidget(QWidget):
 
         data = FILE_WORKER.getFileList()
 
-        dates = []
-        emotions = []
-        for _, value in data.items():
-            date = datetime.strptime(value['date'], "%Y-%m-%d %H:%M:%S")
-            if period == "Day" and date.date() == selected_date:
-                dates.append(date)
-                emotions.append(value['emotion'])
-            elif period == "Week" and date.isocalendar()[1] == selected_week_date.isocalendar()[1] and date.year == selected_week_date.year:
-                dates.append(date)
-                emotions.append(value['emotion'])
-            elif period == "Month" and date.month == selected_month and date.year == selected_year:
-                dates.append(date)
-                emotions.append(value['emotion'])
-            elif period == "Time of Day" and date.isocalendar()[1] == selected_date.isocalendar()[1] and date.year == selected_date.year:
-                dates.append(date)
-                emotions.append(value['emotion'])
+        # the notes of the period are a range of the date index, so the dates aren't parsed on every change
+        if period == "Day":
+            start = datetime.combine(selected_date, time())
+            end = start + timedelta(days=1)
+        elif period in ["Week", "Time of Day"]:
+            week_date = selected_week_date if period == "Week" else selected_date
+            start = datetime.combine(week_date - timedelta(days=week_date.weekday()), time())
+            end = start + timedelta(weeks=1)
+        else:
+            start = datetime(selected_year, selected_month, 1)
+            end = datetime(selected_year + selected_month // 12, selected_month % 12 + 1, 1)
+
+        titles = FILE_WORKER.notesBetween(start, end)
+        dates = [FILE_WORKER.noteDate(title) for title in titles]
+        emotions = [data[title]['emotion'] for title in titles]
 
         colors = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf", "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f"]
         if period == "Time of Day":
-            time_ranges = {
-                "Morning": (time(5, 0), time(11, 0)),
-                "Day": (time(11, 0), time(18, 0)),
-                "Evening": (time(18, 0), time(23, 0)),
-                "Night": (time(23, 0), time(5, 0)),
-            }
+            time_ranges = self.time_ranges
             week_days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
             emotion_list = ["afraid", "angry", "anxious", "ashamed", "awkward", "bored", "calm", "confused", "disgusted", "excited", "frustrated", "happy", "jealous", "nostalgic", "proud", "sad", "satisfied", "surprised"]
             time_of_day_data = {day: {period: {emotion: 0 for emotion in emotion_list} for period in time_ranges.keys()} for day in week_days}
             
-            for date, emotion_list in zip(dates, emotions):
-                day_name = week_days[date.weekday()]
-                for period_name, (start, end) in time_ranges.items():
-                    if start <= date.time() < end or (start > end and (date.time() >= start or date.time() < end)):
-                        for emotion in emotion_list:
-                            if emotion in time_of_day_data[day_name][period_name]:
-                                time_of_day_data[day_name][period_name][emotion] += 1
+            if self.softCheckBox.isChecked():
+                # probabilities of every note are added to its (weekday, time of day) cell at once
+                cells = np.zeros((len(week_days), len(time_ranges), len(emotion_list)), dtype=np.float32)
+                period_ids = [self._period_of(date) for date in dates]
+                np.add.at(cells, (np.array([date.weekday() for date in dates], dtype=int), np.array(period_ids, dtype=int)), np.nan_to_num(FILE_WORKER.getProbabilities(titles)))
+                for i, day_name in enumerate(week_days):
+                    for j, period_name in enumerate(time_ranges.keys()):
+                        time_of_day_data[day_name][period_name] = dict(zip(emotion_list, cells[i, j].tolist()))
+            else:
+                for date, emotion_list in zip(dates, emotions):
+                    day_name = week_days[date.weekday()]
+                    period_name = list(time_ranges)[self._period_of(date)]
+                    for emotion in emotion_list:
+                        if emotion in time_of_day_data[day_name][period_name]:
+                            time_of_day_data[day_name][period_name][emotion] += 1
             
             self.figure.clear()
             ax = self.figure.add_subplot(111)
@@ -175,10 +196,13 @@ class AnalyticsWidget(QWidget):
             self.canvas.draw()
         else:
             emotion_counts = {emotion: 0 for emotion in ["afraid", "angry", "anxious", "ashamed", "awkward", "bored", "calm", "confused", "disgusted", "excited", "frustrated", "happy", "jealous", "nostalgic", "proud", "sad", "satisfied", "surprised"]}
-            for emotion_list in emotions:
-                for emotion in emotion_list:
-                    if emotion in emotion_counts:
-                        emotion_counts[emotion] += 1
+            if self.softCheckBox.isChecked():
+                emotion_counts = dict(zip(emotion_counts.keys(), FILE_WORKER.softEmotionCounts(titles).tolist()))
+            else:
+                for emotion_list in emotions:
+                    for emotion in emotion_list:
+                        if emotion in emotion_counts:
+                            emotion_counts[emotion] += 1
 
             self.figure.clear()
             ax = self.figure.add_subplot(111)
@@ -190,7 +214,7 @@ class AnalyticsWidget(QWidget):
 
             ax.set_xticks(bar_positions)
             ax.set_xticklabels(emotion_counts.keys(), rotation=45, ha='right')
-            ax.set_title(f"Notes count per {period.lower()}")
+            ax.set_title(f"{'Expected notes count' if self.softCheckBox.isChecked() else 'Notes count'} per {period.lower()}")
             ax.grid(axis="y", linestyle='dashed', linewidth=1)
             self.canvas.draw()
 
@@ -0,0 +1,136 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import multiprocessing
+from datetime import datetime
+
+import numpy as np
+
+from .evaluation import DATA_PATH, load_labeled_notes, labels_matrix, multilabel_scores
+from .metrics import METRICS
+from .model_packaging import DEFAULT_MODEL_PATH, STUDENT_MODEL_DIR
+
+
+ROBERTA_PATH = DEFAULT_MODEL_PATH
+STUDENT_PATH = STUDENT_MODEL_DIR
+XGBOOST_PATH = "emotion_analyser/model/xgboost.model"
+VECTORIZER_PATH = "emotion_analyser/model/tfidf_vectorizer.pkl"
+
+# TFIDFEmotionalModel was trained on another dataset, "love" has no pair among data.csv emotions
+TFIDF_TO_DATASET_EMOTIONS = {"sadness": "sad", "joy": "happy", "anger": "angry", "fear": "afraid", "surprise": "surprised"}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # not available on Windows
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024  # bytes on macOS, kilobytes on Linux
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_model(name: str, engine: str):
+    from .model_service import RoBertaModel, StudentModel, TFIDFEmotionalModel
+
+    if name == "roberta":
+        return RoBertaModel(ROBERTA_PATH, engine=engine)
+    if name == "student":
+        return StudentModel(STUDENT_PATH, engine=engine)
+    return TFIDFEmotionalModel(XGBOOST_PATH, VECTORIZER_PATH)
+
+
+def accuracy(name: str, model, texts: list, batch_size: int) -> dict:
+    from .model_service import RoBertaModel
+
+    _, true = load_labeled_notes(DATA_PATH, RoBertaModel.emotions, len(texts))
+    if name in ("roberta", "student"):
+        predicted = labels_matrix(model.predict_batch(texts, batch_size), RoBertaModel.emotions)
+        return multilabel_scores(predicted, true)
+
+    # only the emotions both label sets have are scored
+    columns = [i for i, emotion in RoBertaModel.emotions.items() if emotion in TFIDF_TO_DATASET_EMOTIONS.values()]
+    predictions = [[TFIDF_TO_DATASET_EMOTIONS[e] for e in top if e in TFIDF_TO_DATASET_EMOTIONS] for top in model.predict_batch(texts, top_k=1)]
+    predicted = labels_matrix(predictions, RoBertaModel.emotions)
+    return {"emotions": [RoBertaModel.emotions[i] for i in columns], **multilabel_scores(predicted[:, columns], true[:, columns])}
+
+
+def benchmark_model(name: str, engine: str, texts: list, latency_notes: int, batch_sizes: list, stages: bool = False) -> dict:
+    """Runs in its own process, so the load time includes imports and the RSS belongs to this model only"""
+    METRICS.enabled = stages
+    start = time.perf_counter()
+    model = load_model(name, engine)
+    result = {"model": name, "engine": engine if name != "tfidf" else None, "cold_load_s": time.perf_counter() - start}
+
+    latencies = []
+    for text in texts[:latency_notes]:
+        start = time.perf_counter()
+        model.predict(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+    result["latency_ms"] = {f"p{q}": float(np.percentile(latencies, q)) for q in (50, 95, 99)}
+
+    result["throughput_notes_per_s"] = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        if name != "tfidf":
+            model.predict_batch(texts, batch_size)
+        else:
+            for i in range(0, len(texts), batch_size):
+                model.predict_batch(texts[i:i + batch_size])
+        result["throughput_notes_per_s"][str(batch_size)] = len(texts) / (time.perf_counter() - start)
+
+    result["accuracy"] = accuracy(name, model, texts, max(batch_sizes))
+    result["peak_rss_mb"] = peak_rss_mb()
+    if stages:
+        result["stages"] = METRICS.snapshot()
+    return result
+
+
+def run(models: list, engine: str, limit: int, latency_notes: int, batch_sizes: list, stages: bool = False) -> dict:
+    from .model_service import RoBertaModel
+
+    texts, _ = load_labeled_notes(DATA_PATH, RoBertaModel.emotions, limit)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "notes": len(texts),
+        "results": []
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for name in models:
+        with context.Pool(1) as pool:
+            report["results"].append(pool.apply(benchmark_model, (name, engine, texts, latency_notes, batch_sizes, stages)))
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency, throughput, memory and accuracy benchmark of the emotion models")
+    parser.add_argument("--models", nargs="+", default=["tfidf", "roberta"], choices=["tfidf", "roberta", "student"])
+    parser.add_argument("--engine", default="torch", choices=["torch", "int8", "onnx"], help="engine of RoBertaModel and StudentModel")
+    parser.add_argument("--limit", type=int, default=512, help="number of notes from data.csv to use")
+    parser.add_argument("--latency-notes", type=int, default=100, help="number of notes for the single note latency")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--output", default="benchmark.json", help="path of a JSON file with the results")
+    parser.add_argument("--stages", action="store_true", help="add durations of every pipeline stage to the results")
+    args = parser.parse_args()
+
+    report = run(args.models, args.engine, args.limit, args.latency_notes, args.batch_sizes, args.stages)
+    print(json.dumps(report, indent=4))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
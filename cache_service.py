@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+
+
+def text_hash(text: str) -> str:
+    """Hash of the text with normalized whitespaces, so re-indented notes hit the same entry"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+_caches = weakref.WeakSet()
+
+
+def flush_caches():
+    """Writes every changed cache of the process, e.g. when the app quits"""
+    for cache in list(_caches):
+        cache.flush()
+
+
+atexit.register(flush_caches)
+
+
+class PersistentLRUCache:
+    """ LRU cache with JSON-serializable values which is mirrored into a JSON file.
+
+    The file isn't rewritten on every change: it's written after `flush_every` changed entries
+    or on the first change `flush_interval` seconds after the previous write, and by `flush` (e.g. on exit).
+    So caching many values costs a few writes of the whole cache instead of one per value,
+    and a crash loses only the latest changes.
+    """
+
+    def __init__(self, path: str, max_entries: int = 2048, flush_every: int = 64, flush_interval: float = 30.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._changes = 0  # changed entries since the last write
+        self._last_write = time.monotonic()
+        self._load()
+        _caches.add(self)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # a broken cache file is just ignored and rewritten on the next change
+
+        self._restore(data)
+
+    def _restore(self, data: dict):
+        self._entries = OrderedDict(data.get("entries", []))
+        self._evict()
+
+    def _serialize(self) -> dict:
+        return {"entries": list(self._entries.items())}
+
+    def _dump(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            json.dump(self._serialize(), f)
+        os.replace(tmpPath, self.path)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        with self._lock:
+            count = 0
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                count += 1
+            self._evict()
+            self._changed(count)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._changed()
+
+    def _changed(self, count: int = 1):
+        self._changes += count
+        if self._changes >= self.flush_every or time.monotonic() - self._last_write >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes the cache into its file if it was changed since the last write"""
+        with self._lock:
+            if self._changes:
+                self._dump()
+                self._changes = 0
+            self._last_write = time.monotonic()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PredictionCache(PersistentLRUCache):
+    """ Cache of model predictions keyed by (note content hash, model weights hash).
+
+    Hashes of the weights files are remembered together with their size and modification time,
+    so the weights are re-read only when they change. Entries of other weights are dropped.
+    `variant` should describe model settings which change predictions of the same weights.
+    """
+
+    def __init__(self, path: str, weights_paths: list, max_entries: int = 2048, variant: str = ""):
+        self.weights_paths = [os.path.abspath(p) for p in weights_paths]
+        self.variant = variant
+        self._weights_stats = {}
+        self._weights_hashes = {}
+        self.weights_hash = ""
+        super().__init__(path, max_entries)
+
+    def _restore(self, data: dict):
+        super()._restore(data)
+        for path, (size, mtime, digest) in data.get("weights", {}).items():
+            self._weights_stats[path] = (size, mtime)
+            self._weights_hashes[path] = digest
+        self._refresh_weights_hash()
+
+    def _serialize(self) -> dict:
+        data = super()._serialize()
+        data["weights"] = {
+            path: [*self._weights_stats[path], self._weights_hashes[path]] for path in self._weights_hashes
+        }
+        return data
+
+    def _refresh_weights_hash(self):
+        changed = False
+        for path in self.weights_paths:
+            stat = os.stat(path)
+            if self._weights_stats.get(path) != (stat.st_size, stat.st_mtime_ns):
+                self._weights_stats[path] = (stat.st_size, stat.st_mtime_ns)
+                self._weights_hashes[path] = file_hash(path)
+                changed = True
+
+        weights_hash = "".join(self._weights_hashes[p] for p in self.weights_paths) + self.variant
+        weights_hash = hashlib.sha256(weights_hash.encode()).hexdigest()
+        if weights_hash != self.weights_hash:
+            self.weights_hash = weights_hash
+            self._entries = OrderedDict(
+                (key, value) for key, value in self._entries.items() if key.startswith(weights_hash + ":")
+            )
+            changed = True
+
+        return changed
+
+    def key(self, text: str) -> str:
+        with self._lock:
+            if self._refresh_weights_hash():
+                self._changed()
+            return f"{self.weights_hash}:{text_hash(text)}"
@@ -0,0 +1,140 @@
+import json
+import time
+import argparse
+
+import numpy as np
+
+from .evaluation import DATA_PATH, load_labeled_notes, top_k_matrix, jaccard_per_note, multilabel_scores
+from .model_packaging import DEFAULT_MODEL_PATH
+from .training import fit_xgboost, save_xgboost
+
+
+FAST_MODEL_PATH = "emotion_analyser/model/fast_xgboost.model"
+FAST_VECTORIZER_PATH = "emotion_analyser/model/fast_tfidf_vectorizer.pkl"
+CASCADE_CONFIG_PATH = "emotion_analyser/model/cascade.json"
+
+
+def split_indices(count: int, calibration_share: float = 0.15, test_share: float = 0.15, seed: int = 42) -> tuple:
+    """Returns shuffled train, calibration and test indices"""
+    indices = np.random.default_rng(seed).permutation(count)
+    calibration_size, test_size = int(count * calibration_share), int(count * test_share)
+    return indices[calibration_size + test_size:], indices[:calibration_size], indices[calibration_size:calibration_size + test_size]
+
+
+def train_fast_model(texts: list, labels: np.ndarray, model_path: str = FAST_MODEL_PATH,
+                     vectorizer_path: str = FAST_VECTORIZER_PATH, num_threads: int = None):
+    """ Trains TF-IDF + XGBoost over the 18 emotions and saves them where FastEmotionalModel loads them from.
+
+    A note with several emotions becomes one training sample per emotion, so the classifier learns
+    a distribution over all the emotions just like RoBERTa's softmax.
+    """
+    from .model_service import FastEmotionalModel
+
+    preprocessor = FastEmotionalModel.preprocessor()
+    preprocessed = [preprocessor._preprocessing(text) for text in texts]
+
+    vectorizer, classifier = fit_xgboost(
+        preprocessed, labels,
+        vectorizer_params={"ngram_range": (1, 2), "min_df": 2, "sublinear_tf": True},
+        xgb_params={"n_estimators": 300, "max_depth": 6, "learning_rate": 0.1},
+        num_threads=num_threads
+    )
+    save_xgboost(vectorizer, classifier, model_path, vectorizer_path)
+
+
+def calibrate_threshold(margins: np.ndarray, fast_scores: np.ndarray, slow_scores: np.ndarray, max_accuracy_drop: float = 0.01) -> float:
+    """ Returns the lowest margin threshold (so the fewest escalations) with which the cascade's mean score
+    is at most `max_accuracy_drop` below the slow model's one. Scores are per note, e.g. Jaccard of the top-3
+    """
+    target = slow_scores.mean() - max_accuracy_drop
+
+    # with a threshold equal to the i-th smallest margin, notes before it are escalated and the rest stay with the fast model
+    order = np.argsort(margins, kind="stable")
+    margins, fast_scores, slow_scores = margins[order], fast_scores[order], slow_scores[order]
+    escalated_scores = np.concatenate([[0.0], np.cumsum(slow_scores)])
+    kept_scores = np.concatenate([np.cumsum(fast_scores[::-1])[::-1], [0.0]])
+    cascade_means = (escalated_scores + kept_scores) / len(margins)
+
+    # threshold 0 escalates nothing, infinity escalates everything
+    candidates = np.concatenate([[0.0], margins[1:], [np.inf]])
+    for escalated, (threshold, mean) in enumerate(zip(candidates, cascade_means)):
+        splits_ties = 0 < escalated < len(margins) and margins[escalated - 1] == margins[escalated]
+        if mean >= target and not splits_ties:
+            return float(threshold)
+    return float("inf")
+
+
+def load_cascade(slow_model, config_path: str = CASCADE_CONFIG_PATH,
+                 fast_model_path: str = FAST_MODEL_PATH, fast_vectorizer_path: str = FAST_VECTORIZER_PATH):
+    from .model_service import FastEmotionalModel, CascadeModel
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    return CascadeModel(FastEmotionalModel(fast_model_path, fast_vectorizer_path), slow_model, config["threshold"])
+
+
+def timed_predictions(model, texts: list) -> tuple:
+    """Probabilities of the texts predicted one by one as in the app and milliseconds per text"""
+    start = time.perf_counter()
+    probabilities = np.stack([model.predict_proba_batch([text])[0] for text in texts]) if texts else np.zeros((0, len(model.emotions)))
+    return probabilities, (time.perf_counter() - start) / max(len(texts), 1) * 1000
+
+
+def build_cascade(model_path: str = DEFAULT_MODEL_PATH, data_path: str = DATA_PATH, max_accuracy_drop: float = 0.01,
+                  config_path: str = CASCADE_CONFIG_PATH, engine: str = "torch", batch_size: int = 16) -> dict:
+    """ Trains the fast model, calibrates the threshold on a held-out part of data.csv and measures
+    the escalation rate, accuracy and latency of the cascade against RoBERTa on another held-out part
+    """
+    from .model_service import RoBertaModel, FastEmotionalModel, CascadeModel
+
+    texts, labels = load_labeled_notes(data_path, RoBertaModel.emotions)
+    train, calibration, test = split_indices(len(texts))
+    train_fast_model([texts[i] for i in train], labels[train])
+
+    fast_model = FastEmotionalModel(FAST_MODEL_PATH, FAST_VECTORIZER_PATH)
+    slow_model = RoBertaModel(model_path, engine=engine)
+
+    calibration_texts = [texts[i] for i in calibration]
+    fast_probabilities = fast_model.predict_proba_batch(calibration_texts)
+    slow_probabilities = slow_model.predict_proba_batch(calibration_texts, batch_size)
+    threshold = calibrate_threshold(
+        CascadeModel.margins(fast_probabilities),
+        jaccard_per_note(top_k_matrix(fast_probabilities), labels[calibration]),
+        jaccard_per_note(top_k_matrix(slow_probabilities), labels[calibration]),
+        max_accuracy_drop
+    )
+
+    # notes are analysed one by one as in the app, so the latency is per note
+    test_texts = [texts[i] for i in test]
+    cascade = CascadeModel(fast_model, slow_model, threshold)
+    cascade_probabilities, cascade_ms = timed_predictions(cascade, test_texts)
+    roberta_probabilities, roberta_ms = timed_predictions(slow_model, test_texts)
+    cascade_scores = multilabel_scores(top_k_matrix(cascade_probabilities), labels[test])
+    roberta_scores = multilabel_scores(top_k_matrix(roberta_probabilities), labels[test])
+
+    report = {
+        "threshold": threshold,
+        "max_accuracy_drop": max_accuracy_drop,
+        "notes": {"train": len(train), "calibration": len(calibration), "test": len(test)},
+        "escalation_rate": cascade.stats()["escalation_rate"],
+        "accuracy_delta": {name: cascade_scores[name] - roberta_scores[name] for name in cascade_scores},
+        "cascade": {"ms_per_note": cascade_ms, **cascade_scores},
+        "roberta": {"ms_per_note": roberta_ms, **roberta_scores},
+    }
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trains the fast model of the TF-IDF -> RoBERTa cascade and calibrates its threshold")
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH, help="RoBERTa model the cascade escalates to")
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--engine", default="torch", choices=["torch", "int8", "onnx"])
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01,
+                        help="how much lower the Jaccard score of the cascade may be than the RoBERTa one")
+    parser.add_argument("--output", default=CASCADE_CONFIG_PATH, help="path of the cascade config with the report")
+    args = parser.parse_args()
+
+    print(json.dumps(build_cascade(args.model_path, args.data_path, args.max_accuracy_drop, args.output, args.engine), indent=4))
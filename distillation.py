@@ -0,0 +1,178 @@
+import os
+import json
+import argparse
+
+import numpy as np
+
+from .cache_service import file_hash
+from .cascade import timed_predictions
+from .evaluation import DATA_PATH, top_k_matrix, jaccard_per_note
+from .model_packaging import DEFAULT_MODEL_PATH, STUDENT_MODEL_DIR, WEIGHTS_FILE, weights_path
+from .training import FEATURES_DIR, FeatureCache, split_train_test, padded_batch, held_out_scores
+
+
+REPORT_FILE = "distillation.json"
+
+
+def soften(probabilities: np.ndarray, temperature: float) -> np.ndarray:
+    """softmax(logits / temperature) of the teacher computed from its softmax(logits)"""
+    logits = np.log(np.clip(probabilities, 1e-12, None)) / temperature
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def agreement(student_probabilities: np.ndarray, teacher_probabilities: np.ndarray) -> dict:
+    """How often the student picks the teacher's top emotion and the mean Jaccard of their top-3 emotions"""
+    return {
+        "top1": float((student_probabilities.argmax(axis=1) == teacher_probabilities.argmax(axis=1)).mean()),
+        "top3_jaccard": float(jaccard_per_note(top_k_matrix(student_probabilities), top_k_matrix(teacher_probabilities)).mean()),
+    }
+
+
+def user_notes(fileWorker) -> list:
+    """Contents of the user's notes, they have no labels but the teacher's probabilities are enough to learn from"""
+    contents = []
+    for title in list(fileWorker.getFileList()):
+        try:
+            contents.append(fileWorker.getFileInfo(title)["content"])
+        except FileNotFoundError:
+            continue
+    return [content for content in contents if content.strip()]
+
+
+def build_student(teacher, layers: int, hidden_size: int, heads: int):
+    """ A RoBERTa classifier with fewer and narrower layers and the teacher's vocabulary and labels.
+    Its word embeddings start as the teacher's ones projected onto their `hidden_size` principal components
+    """
+    import copy
+    import torch
+    from transformers import RobertaForSequenceClassification
+
+    config = copy.deepcopy(teacher.config)
+    config.num_hidden_layers = layers
+    config.hidden_size = hidden_size
+    config.num_attention_heads = heads
+    config.intermediate_size = 4 * hidden_size
+    student = RobertaForSequenceClassification(config)
+
+    with torch.no_grad():
+        embeddings = teacher.roberta.embeddings.word_embeddings.weight
+        _, _, components = torch.pca_lowrank(embeddings, q=hidden_size)
+        student.roberta.embeddings.word_embeddings.weight.copy_((embeddings - embeddings.mean(dim=0)) @ components)
+    return student
+
+
+def train_student(student, token_ids: list, targets: np.ndarray, pad_id: int, epochs: int, batch_size: int,
+                  learning_rate: float, temperature: float) -> list:
+    """Fits the student to the softened teacher distributions with the KL divergence, returns the mean loss of every epoch"""
+    import torch
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=learning_rate)
+    targets = torch.tensor(targets, dtype=torch.float)
+    losses = []
+    for epoch in range(epochs):
+        student.train()
+        order = np.random.default_rng(epoch).permutation(len(token_ids))
+        epoch_losses = []
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            input_ids, attention_mask = padded_batch([token_ids[i] for i in batch], pad_id)
+            log_probabilities = torch.log_softmax(student(input_ids=input_ids, attention_mask=attention_mask).logits / temperature, dim=-1)
+            # temperature squared keeps the gradients of soft targets on the scale of hard ones
+            loss = torch.nn.functional.kl_div(log_probabilities, targets[batch], reduction="batchmean") * temperature ** 2
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            epoch_losses.append(loss.item())
+        losses.append(float(np.mean(epoch_losses)))
+    student.eval()
+    return losses
+
+
+def distill(teacher_path: str = DEFAULT_MODEL_PATH, output_dir: str = STUDENT_MODEL_DIR, data_path: str = DATA_PATH,
+            fileWorker=None, layers: int = 4, hidden_size: int = 256, heads: int = 4, epochs: int = 10, batch_size: int = 32,
+            learning_rate: float = 5e-4, temperature: float = 2.0, max_length: int = 256, features_dir: str = FEATURES_DIR,
+            num_threads: int = None, latency_notes: int = 100) -> dict:
+    """ Trains a StudentModel on the teacher's probabilities of the training part of data.csv and of the user's notes,
+    packages it into `output_dir` and reports its agreement with the teacher, scores, latency and size
+    on the held-out part of data.csv. The report is saved next to the student too.
+    """
+    import torch
+    from .model_service import RoBertaModel, StudentModel
+
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    teacher = RoBertaModel(teacher_path)
+    features = FeatureCache(data_path, features_dir)
+    texts, labels = features.dataset(RoBertaModel.emotions)
+    teacher_probabilities = features.matrix(f"teacher-{file_hash(weights_path(teacher_path))[:16]}", lambda: teacher.predict_proba_batch(texts))
+    train, test = split_train_test(len(texts))
+
+    notes = user_notes(fileWorker) if fileWorker is not None else []
+    notes_probabilities = teacher.predict_proba_batch(notes) if notes else np.zeros((0, len(RoBertaModel.emotions)))
+
+    def tokenize(texts):
+        return teacher.tokenizer(teacher.translator.translate_batch(texts), truncation=True, max_length=max_length)["input_ids"]
+
+    data_token_ids = features.token_ids(texts, tokenize, f"roberta-{max_length}")
+    token_ids = [data_token_ids[i] for i in train] + (tokenize(notes) if notes else [])
+    targets = soften(np.concatenate([np.asarray(teacher_probabilities)[train], notes_probabilities]), temperature)
+
+    student = build_student(teacher.model, layers, hidden_size, heads)
+    losses = train_student(student, token_ids, targets, teacher.tokenizer.pad_token_id, epochs, batch_size, learning_rate, temperature)
+    student.save_pretrained(output_dir, safe_serialization=True)
+    teacher.tokenizer.save_pretrained(output_dir)
+
+    # the packaged student is evaluated exactly as the app would run it
+    test_texts = [texts[i] for i in test]
+    student_model = StudentModel(output_dir)
+    student_probabilities = student_model.predict_proba_batch(test_texts)
+    _, student_ms = timed_predictions(student_model, test_texts[:latency_notes])
+    _, teacher_ms = timed_predictions(teacher, test_texts[:latency_notes])
+
+    report = {
+        "notes": {"train": len(train), "user": len(notes), "test": len(test)},
+        "losses": losses,
+        "agreement": agreement(student_probabilities, np.asarray(teacher_probabilities)[test]),
+        "student": {
+            "parameters": sum(p.numel() for p in student.parameters()),
+            "weights_mb": os.path.getsize(os.path.join(output_dir, WEIGHTS_FILE)) / 1024 ** 2,
+            "ms_per_note": student_ms,
+            **held_out_scores(student_probabilities, labels[test])
+        },
+        "teacher": {
+            "parameters": sum(p.numel() for p in teacher.model.parameters()),
+            "weights_mb": os.path.getsize(weights_path(teacher_path)) / 1024 ** 2,
+            "ms_per_note": teacher_ms,
+            **held_out_scores(np.asarray(teacher_probabilities)[test], labels[test])
+        },
+    }
+    with open(os.path.join(output_dir, REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distills the RoBERTa model into a small StudentModel")
+    parser.add_argument("--teacher", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--output-dir", default=STUDENT_MODEL_DIR)
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--no-user-notes", action="store_true", help="don't learn from the notes of the diary")
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--heads", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    fileWorker = None
+    if not args.no_user_notes:
+        from .app.fileWorker import FileWorker
+        fileWorker = FileWorker()
+
+    report = distill(args.teacher, args.output_dir, args.data_path, fileWorker, args.layers, args.hidden_size, args.heads,
+                     args.epochs, temperature=args.temperature, num_threads=args.threads)
+    print(json.dumps(report, indent=4))
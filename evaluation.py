@@ -0,0 +1,117 @@
+import csv
+import json
+import time
+import argparse
+
+import numpy as np
+
+from .model_packaging import DEFAULT_MODEL_PATH
+
+
+DATA_PATH = "emotion_analyser/data/data.csv"
+MODEL_PATH = DEFAULT_MODEL_PATH
+LABEL_COLUMN = "Answer.f1.{}.raw"
+
+
+def load_labeled_notes(path: str, emotions: dict, limit: int = None):
+    """Returns notes from the dataset and a boolean matrix of their emotions, columns follow `emotions` ids"""
+    texts, labels = [], []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            texts.append(row["Answer"])
+            labels.append([row[LABEL_COLUMN.format(emotions[i])] == "TRUE" for i in range(len(emotions))])
+            if limit is not None and len(texts) >= limit:
+                break
+
+    return texts, np.array(labels, dtype=bool).reshape(len(texts), len(emotions))
+
+
+def labels_matrix(predictions: list, emotions: dict) -> np.ndarray:
+    """Converts lists of predicted emotion names into a boolean matrix"""
+    ids = {name: i for i, name in emotions.items()}
+    matrix = np.zeros((len(predictions), len(emotions)), dtype=bool)
+    for row, names in enumerate(predictions):
+        matrix[row, [ids[name] for name in names]] = True
+    return matrix
+
+
+def jaccard_per_note(predicted: np.ndarray, true: np.ndarray) -> np.ndarray:
+    """Share of the matched emotions among predicted and true ones of every note, 1 if both are empty"""
+    union = (predicted | true).sum(axis=1)
+    return np.divide((predicted & true).sum(axis=1), union, out=np.ones(len(union)), where=union > 0)
+
+
+def multilabel_scores(predicted: np.ndarray, true: np.ndarray) -> dict:
+    """ Scores of boolean (notes x emotions) matrices.
+
+    label_accuracy and macro_f1 are averaged over emotions as in the training notebooks,
+    jaccard is the mean share of the matched emotions per note.
+    """
+    tp = (predicted & true).sum(axis=0)
+    fp = (predicted & ~true).sum(axis=0)
+    fn = (~predicted & true).sum(axis=0)
+
+    f1_denominators = 2 * tp + fp + fn
+    per_label_f1 = np.divide(2 * tp, f1_denominators, out=np.ones(len(tp)), where=f1_denominators > 0)
+
+    return {
+        "label_accuracy": float((predicted == true).mean()),
+        "jaccard": float(jaccard_per_note(predicted, true).mean()),
+        "micro_f1": float(2 * tp.sum() / max(f1_denominators.sum(), 1)),
+        "macro_f1": float(per_label_f1.mean()),
+    }
+
+
+def top_k_matrix(probabilities: np.ndarray, k: int = 3) -> np.ndarray:
+    matrix = np.zeros(probabilities.shape, dtype=bool)
+    np.put_along_axis(matrix, np.argsort(-probabilities, axis=1)[:, :k], True, axis=1)
+    return matrix
+
+
+def engine_parity(engine: str, model_path: str = MODEL_PATH, data_path: str = DATA_PATH,
+                  limit: int = None, batch_size: int = 16) -> dict:
+    """Compares predictions of the given engine with the fp32 PyTorch model on the labeled dataset"""
+    from .model_service import RoBertaModel
+
+    texts, true = load_labeled_notes(data_path, RoBertaModel.emotions, limit)
+    report = {"engine": engine, "notes": len(texts)}
+
+    probabilities = {}
+    for name in ("torch", engine):
+        model = RoBertaModel(model_path, engine=name)
+
+        start = time.perf_counter()
+        probabilities[name] = model.predict_proba_batch(texts, batch_size)
+        elapsed = time.perf_counter() - start
+
+        report[name] = {
+            "ms_per_note": elapsed / max(len(texts), 1) * 1000,
+            **multilabel_scores(top_k_matrix(probabilities[name]), true)
+        }
+        del model
+
+    reference, candidate = probabilities["torch"], probabilities[engine]
+    report["top1_agreement"] = float((reference.argmax(axis=1) == candidate.argmax(axis=1)).mean())
+    report["top3_agreement"] = float((top_k_matrix(reference) == top_k_matrix(candidate)).all(axis=1).mean())
+    report["max_probability_diff"] = float(np.abs(reference - candidate).max(initial=0.0))
+    report["speedup"] = report["torch"]["ms_per_note"] / max(report[engine]["ms_per_note"], 1e-9)
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy parity check of a RoBERTa inference engine against the fp32 model")
+    parser.add_argument("--engine", default="int8", choices=["torch", "int8", "onnx"])
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--limit", type=int, default=None, help="use only the first N notes of the dataset")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--output", default=None, help="path of a JSON file for the report")
+    args = parser.parse_args()
+
+    report = engine_parity(args.engine, args.model_path, args.data_path, args.limit, args.batch_size)
+    print(json.dumps(report, indent=4))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
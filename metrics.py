@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+class Histogram:
+    """Histogram of durations in milliseconds with log-spaced buckets (0.05 ms ... ~26 s) and input sizes"""
+
+    bounds = [0.05 * 2 ** i for i in range(20)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.size_total = 0
+
+    def observe(self, duration_ms: float, size: int = None):
+        self.counts[bisect.bisect_left(self.bounds, duration_ms)] += 1
+        self.count += 1
+        self.total += duration_ms
+        self.min = min(self.min, duration_ms)
+        self.max = max(self.max, duration_ms)
+        if size is not None:
+            self.size_total += size
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket where the quantile falls"""
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "min_ms": self.min if self.count else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "mean_size": self.size_total / self.count if self.count else 0.0,
+            "buckets": {f"<={bound:g}": count for bound, count in zip(self.bounds, self.counts) if count},
+        }
+
+
+class MetricsRegistry:
+    """ In-process registry of stage durations.
+
+    It's disabled by default, then `stage` returns a shared no-op context manager and nothing is measured.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._noop = nullcontext()
+
+    def stage(self, name: str, size: int = None):
+        if not self.enabled:
+            return self._noop
+        return self._measure(name, size)
+
+    @contextmanager
+    def _measure(self, name: str, size: int = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, size)
+
+    def observe(self, name: str, duration_ms: float, size: int = None):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram()
+            self._histograms[name].observe(duration_ms, size)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=4)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+METRICS = MetricsRegistry(enabled=os.environ.get("EMOTIONAL_DIARY_METRICS") == "1")
@@ -0,0 +1,62 @@
+import os
+import argparse
+
+
+STATE_DICT_PATH = "emotion_analyser/model/nlp_model.pt"
+PACKAGED_MODEL_DIR = "emotion_analyser/model/roberta_emotions"
+STUDENT_MODEL_DIR = "emotion_analyser/model/roberta_student"  # packaged the same way by `distillation`
+WEIGHTS_FILE = "model.safetensors"
+
+# the packaged model is used once it exists, the state dict is a fallback for installations which weren't packaged yet
+DEFAULT_MODEL_PATH = PACKAGED_MODEL_DIR if os.path.isdir(PACKAGED_MODEL_DIR) else STATE_DICT_PATH
+
+
+def is_packaged(model_path: str) -> bool:
+    return os.path.isdir(model_path)
+
+
+def weights_path(model_path: str) -> str:
+    """File with the weights of a packaged model directory or of a state dict, e.g. to hash it"""
+    return os.path.join(model_path, WEIGHTS_FILE) if is_packaged(model_path) else model_path
+
+
+def package_model(state_dict_path: str = STATE_DICT_PATH, output_dir: str = PACKAGED_MODEL_DIR, base_model: str = "roberta-base"):
+    """ Saves the fine-tuned RoBERTa with its config and tokenizer into one self-contained directory.
+
+    Weights go to safetensors, so RoBertaModel memory-maps them straight into an empty model
+    instead of building roberta-base from the hub and overwriting its weights with the state dict.
+    Only this step needs the hub (for the config and the tokenizer of `base_model`).
+    """
+    import torch
+    from transformers import RobertaConfig, RobertaForSequenceClassification, RobertaTokenizer
+    from .model_service import RoBertaModel
+
+    config = RobertaConfig.from_pretrained(
+        base_model,
+        num_labels=len(RoBertaModel.emotions),
+        id2label=RoBertaModel.emotions,
+        label2id={emotion: i for i, emotion in RoBertaModel.emotions.items()}
+    )
+    with torch.device("meta"):
+        model = RobertaForSequenceClassification(config)
+
+    state_dict = torch.load(state_dict_path, map_location="cpu", mmap=True, weights_only=True)
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    # buffers which aren't a part of the state dict (e.g. position ids) are still on the meta device
+    if any(tensor.is_meta for tensor in model.state_dict().values()):
+        missing = [name for name, tensor in model.state_dict().items() if tensor.is_meta]
+        raise ValueError(f"{state_dict_path} doesn't have weights for: {', '.join(missing)}")
+
+    model.save_pretrained(output_dir, safe_serialization=True)
+    RobertaTokenizer.from_pretrained(base_model).save_pretrained(output_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packages the fine-tuned RoBERTa state dict into a self-contained model directory")
+    parser.add_argument("--state-dict", default=STATE_DICT_PATH)
+    parser.add_argument("--output-dir", default=PACKAGED_MODEL_DIR)
+    parser.add_argument("--base-model", default="roberta-base", help="model the config and the tokenizer are taken from")
+    args = parser.parse_args()
+
+    package_model(args.state_dict, args.output_dir, args.base_model)
+    print(f"The model was packaged into {args.output_dir}")
@@ -0,0 +1,233 @@
+import json
+import time
+import queue
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+
+from .app.fileWorker import FileWorker
+from .cache_service import PersistentLRUCache, PredictionCache
+from .translation_service import TranslationService
+from .metrics import METRICS
+from .model_packaging import DEFAULT_MODEL_PATH, weights_path
+
+
+HOST = "127.0.0.1"
+PORT = 47311
+
+
+class MicroBatcher:
+    """ Collects texts from concurrent requests into batches for `predict_batch`.
+
+    A batch is sent to the model when it has `max_batch_size` texts or when `max_wait` seconds
+    have passed since its first text came, whichever happens first.
+    """
+
+    def __init__(self, predict_batch, max_batch_size: int = 16, max_wait: float = 0.01):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first) -> tuple:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _loop(self):
+        closed = False
+        while not closed:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch, closed = self._collect(first)
+            try:
+                predictions = self.predict_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), prediction in zip(batch, predictions):
+                    future.set_result(prediction)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Every line of a connection is a JSON request, every request gets a JSON line with the response"""
+
+    def handle(self):
+        for line in self.rfile:
+            request = None
+            try:
+                request = json.loads(line)
+                response = self.server.handle_request_data(request)
+            except Exception as e:
+                response = {"error": str(e) or type(e).__name__}
+
+            response["id"] = request.get("id") if isinstance(request, dict) else None
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class ModelServer(socketserver.ThreadingTCPServer):
+    """Serves one model to every app window and process on the machine"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, model, host: str = HOST, port: int = PORT, max_batch_size: int = 16, max_wait: float = 0.01):
+        super().__init__((host, port), _RequestHandler)
+        self.model = model
+        self.batcher = MicroBatcher(model.predict_batch, max_batch_size, max_wait)
+
+    def handle_request_data(self, request: dict) -> dict:
+        method = request.get("method")
+        if method == "info":
+            return {"emotions": self.model.emotions}
+        if method == "metrics":
+            return {"metrics": METRICS.snapshot()}
+        if method == "predict":
+            return {"prediction": self.batcher.submit(request["text"]).result()}
+        if method == "predict_batch":
+            futures = [self.batcher.submit(text) for text in request["texts"]]
+            return {"predictions": [future.result() for future in futures]}
+
+        raise ValueError(f"Unknown method: {method}")
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+class ModelClient:
+    """Client of ModelServer with the same `predict`, `predict_batch` and `emotions` as the models"""
+
+    def __init__(self, host: str = HOST, port: int = PORT, timeout: float = 60.0):
+        self._lock = threading.Lock()
+        self._requestIds = iter(range(1, 2 ** 63))
+        self._address = (host, port)
+        self._timeout = timeout
+        self._socket = None
+        self._file = None
+        self._connect()
+
+        self.emotions = {int(i): name for i, name in self._call({"method": "info"})["emotions"].items()}
+
+    @staticmethod
+    def is_available(host: str = HOST, port: int = PORT, timeout: float = 0.2) -> bool:
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def _connect(self):
+        if self._socket is None:
+            self._socket = socket.create_connection(self._address, timeout=self._timeout)
+            self._file = self._socket.makefile("rwb")
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def _call(self, request: dict) -> dict:
+        with self._lock:
+            requestId = request["id"] = next(self._requestIds)
+            try:
+                self._connect()
+                self._file.write(json.dumps(request).encode("utf-8") + b"\n")
+                self._file.flush()
+
+                while True:
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("The model server closed the connection")
+                    response = json.loads(line)
+                    if response.get("id") == requestId:
+                        break  # responses to earlier requests which failed on the client side are skipped
+            except OSError:
+                # the response of a timed out request may still come, so the next request gets a new connection
+                self._disconnect()
+                raise
+
+        if "error" in response:
+            raise RuntimeError(f"The model server failed: {response['error']}")
+        return response
+
+    def predict(self, text: str) -> list:
+        return self._call({"method": "predict", "text": text})["prediction"]
+
+    def predict_batch(self, texts: list) -> list:
+        return self._call({"method": "predict_batch", "texts": texts})["predictions"]
+
+    def metrics(self) -> dict:
+        """Stage durations measured by the server, they're collected when it runs with EMOTIONAL_DIARY_METRICS=1"""
+        return self._call({"method": "metrics"})["metrics"]
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local server of the emotion model shared by all the app windows")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--engine", default="torch", choices=["torch", "int8", "onnx"])
+    parser.add_argument("--long-text-mode", default="mean", choices=["truncate", "mean", "max"])
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="how long the first request of a batch waits for others")
+    parser.add_argument("--cascade", action="store_true", help="analyse easy notes with the fast model calibrated by emotion_analyser.cascade")
+    parser.add_argument("--cache-dir", default=FileWorker.notesDirectory, help="directory of the prediction and translation caches")
+    args = parser.parse_args()
+
+    from .model_service import RoBertaModel
+
+    cache = PredictionCache(args.cache_dir + "/prediction_cache.json", [weights_path(args.model_path)], variant=f"proba-{args.long_text_mode}-{args.engine}")
+    translator = TranslationService(cache=PersistentLRUCache(args.cache_dir + "/translation_cache.json"))
+    model = RoBertaModel(args.model_path, cache=cache, long_text_mode=args.long_text_mode, engine=args.engine, translator=translator)
+    if args.cascade:
+        from .cascade import load_cascade
+        model = load_cascade(model)
+    with ModelServer(model, args.host, args.port, args.max_batch_size, args.max_wait_ms / 1000) as server:
+        # SIGTERM skips atexit handlers, so it stops the server the way Ctrl+C does and the caches are written below
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        print(f"Serving the model on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cache.flush()
+            translator.cache.flush()
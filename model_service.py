@@ -1,22 +1,33 @@
 import os
+import json
 import pickle
-import requests
 import re
+import threading
 from abc import ABC, abstractmethod
 import logging
+from functools import lru_cache
+import numpy as np
 import torch
 from transformers import RobertaTokenizer, RobertaForSequenceClassification
-from googletrans import Translator
 
 import xgboost as xgb
-import nltk
 
+import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
 
+from .cache_service import PredictionCache, file_hash
+from .translation_service import TranslationService
+from .nltk_resources import ensure_resources
+from .metrics import METRICS
+from .model_packaging import is_packaged, weights_path, STUDENT_MODEL_DIR
+
 
 class AbstractModel(ABC):
+    cache = None
+    metrics = METRICS
+
     @abstractmethod
     def _validation(self):
         """This method should validate input data and return preprocessed data"""
@@ -32,6 +43,29 @@ class AbstractModel(ABC):
         """This method recieves data and returns some prediction"""
         pass
 
+    def _stage(self, name: str, size: int = None):
+        """Measures duration of a pipeline stage, e.g. `with self._stage("forward", size=tokens):`.
+        It does nothing unless the metrics registry is enabled.
+        """
+        return self.metrics.stage(f"{type(self).__name__}.{name}", size)
+
+    def _predict_cached(self, texts: list, predict_uncached) -> list:
+        """Returns cached predictions for the texts and runs `predict_uncached` only for the missing ones"""
+        if self.cache is None:
+            return predict_uncached(texts)
+
+        keys = [self.cache.key(text) for text in texts]
+        predictions = [self.cache.get(key) for key in keys]
+        missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+
+        if missing:
+            computed = predict_uncached([texts[i] for i in missing])
+            for i, prediction in zip(missing, computed):
+                predictions[i] = prediction
+            self.cache.put_many((keys[i], predictions[i]) for i in missing)
+
+        return predictions
+
 
 class TFIDFEmotionalModel(AbstractModel):
     emotions = {
@@ -43,20 +77,9 @@ class TFIDFEmotionalModel(AbstractModel):
         5: "surprise"
     }
 
-    def __init__(self, model_path: str, vectorizer_path: str):
-        if self.__check_internet_connection():
-            nltk.download('punkt', download_dir="emotion_analyser/model/nltk_data")
-            nltk.download('stopwords', download_dir="emotion_analyser/model/nltk_data")
-            nltk.download('wordnet', download_dir="emotion_analyser/model/nltk_data")
-        else:
-            if not all(
-                os.path.exists(os.path.join("emotion_analyser/model/nltk_data", filename)) 
-                    for filename in ['tokenizers/punkt', 'corpora/stopwords']
-            ):
-                raise FileNotFoundError("Necessary NLTK data files are missing.")
-
-        self.stop_words = set(stopwords.words('english'))
-        self.lemmatizer = WordNetLemmatizer()
+    def __init__(self, model_path: str, vectorizer_path: str, cache: PredictionCache = None, lemma_cache_size: int = 65536):
+        self.cache = cache
+        self._setup_preprocessing(lemma_cache_size)
 
         self.xgb_model = xgb.XGBClassifier()
         self.xgb_model.load_model(model_path)
@@ -69,13 +92,25 @@ class TFIDFEmotionalModel(AbstractModel):
         if self.vectorizer is None:
             raise ValueError("The text vectorizer wasn't downloaded. Please, check its path")
         
-    def __check_internet_connection(self) -> bool:
-        try:
-            _ = requests.get("http://www.google.com", timeout=1)
-            return True
-        except requests.ConnectionError:
-            return False
-    
+    def _setup_preprocessing(self, lemma_cache_size: int):
+        ensure_resources()
+
+        self.stop_words = set(stopwords.words('english'))
+        self.lemmatizer = WordNetLemmatizer()
+        # words repeat a lot across notes, so lemmas are memoized instead of asking WordNet every time
+        self._lemmatize = lru_cache(maxsize=lemma_cache_size)(self.lemmatizer.lemmatize)
+
+    @classmethod
+    def preprocessor(cls, lemma_cache_size: int = 65536):
+        """Returns a model without the classifier which can only preprocess texts, e.g. to train a new classifier"""
+        model = cls.__new__(cls)
+        model._setup_preprocessing(lemma_cache_size)
+        return model
+
+    def preprocessing_settings(self) -> dict:
+        """What `_preprocessing` depends on besides its code, e.g. to tell cached preprocessed texts apart"""
+        return {"stop_words": sorted(self.stop_words), "lemmatizer": type(self.lemmatizer).__name__, "nltk": nltk.__version__}
+
     def _validation(self, text: str) -> bool:
         if re.match(r'^[a-zA-Z0-9\s.,!?\'\"]+$', text):
             return True
@@ -83,20 +118,36 @@ class TFIDFEmotionalModel(AbstractModel):
             return False
 
     def _preprocessing(self, text: str) -> str:
-        tokens = word_tokenize(text)
-        tokens = [word.lower() for word in tokens]
-        tokens = [word for word in tokens if word not in self.stop_words]
-        tokens = [self.lemmatizer.lemmatize(word) for word in tokens]
-        return " ".join(tokens)
+        tokens = [word.lower() for word in word_tokenize(text)]
+        return " ".join(self._lemmatize(word) for word in tokens if word not in self.stop_words)
 
     def predict(self, text_input: str) -> str:
         # if not self._validation(text_input):
         #     raise ValueError("Text should contain only: English lettes, punktuation or digits.")
         
-        text_input = self._preprocessing(text_input)
-        vector = self.vectorizer.transform([text_input])
+        return self._predict_cached([text_input], lambda texts: [top[0] for top in self.predict_batch(texts, top_k=1)])[0]
+
+    def predict_batch(self, texts: list, top_k: int = 3) -> list:
+        """Returns `top_k` most probable emotions for every text.
+        The whole batch is vectorized and classified with a single call of the vectorizer and the model.
+        """
+        if not texts:
+            return []
+
+        probabilities = self.predict_proba_batch(texts)
+        with self._stage("top_k", size=len(texts)):
+            top_ids = np.argsort(-probabilities, axis=1, kind="stable")[:, :top_k]
+
+        return [[self.emotions[i] for i in row] for row in top_ids]
 
-        return TFIDFEmotionalModel.emotions[self.xgb_model.predict(vector)[0]]
+    def predict_proba_batch(self, texts: list) -> np.ndarray:
+        """Returns a matrix with probabilities of every emotion (columns follow `emotions` ids) for every text"""
+        with self._stage("preprocessing", size=len(texts)):
+            preprocessed = [self._preprocessing(text) for text in texts]
+        with self._stage("vectorization", size=len(texts)):
+            vectors = self.vectorizer.transform(preprocessed)
+        with self._stage("classification", size=len(texts)):
+            return self.xgb_model.predict_proba(vectors)
 
 
 class RoBertaModel(AbstractModel):
@@ -121,40 +172,317 @@ class RoBertaModel(AbstractModel):
         17: "surprised"
     }
 
-    def __init__(self, model_path: str):
+    max_length = 512
+    long_text_modes = ("truncate", "mean", "max")
+    engines = ("torch", "int8", "onnx")
+
+    def __init__(self, model_path: str, num_threads: int = None, cache: PredictionCache = None,
+                 long_text_mode: str = "truncate", window_stride: int = 384, engine: str = "torch", onnx_path: str = None,
+                 translator: TranslationService = None):
+        """ `long_text_mode` defines how texts longer than `max_length` tokens are handled:
+            truncate - only the beginning of the text is analysed;
+            mean - the text is split into overlapping windows which probabilities are averaged weighted by window length;
+            max - the same windows, but every emotion gets its maximum probability among the windows.
+
+        `model_path` is either a directory packaged by `model_packaging` (config, tokenizer and safetensors weights,
+        loaded locally with memory-mapping) or a state dict of the fine-tuned roberta-base.
+
+        `engine` defines how the forward pass is run:
+            torch - the fp32 PyTorch model;
+            int8 - the PyTorch model with linear layers dynamically quantized to int8;
+            onnx - ONNX Runtime session over the graph from `onnx_path` (next to the weights by default),
+                   the graph is exported from the weights if it doesn't exist yet.
+        """
+        if long_text_mode not in self.long_text_modes:
+            raise ValueError(f"Unknown long text mode: {long_text_mode}. Use one of {self.long_text_modes}")
+        if engine not in self.engines:
+            raise ValueError(f"Unknown engine: {engine}. Use one of {self.engines}")
+
         self.model_path = model_path
+        self.cache = cache
+        self.long_text_mode = long_text_mode
+        self.window_stride = window_stride
+        self.engine = engine
+        self.onnx_path = onnx_path or (os.path.join(model_path, "model.onnx") if is_packaged(model_path) else os.path.splitext(model_path)[0] + ".onnx")
         logging.getLogger("transformers.modeling_utils").setLevel(logging.ERROR)
+        logging.getLogger("transformers.tokenization_utils_base").setLevel(logging.ERROR)
 
-        self.model = RobertaForSequenceClassification.from_pretrained('roberta-base', num_labels=len(self.emotions))
-        self.model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
-        self.model.eval()
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
 
-        self.tokenizer = RobertaTokenizer.from_pretrained('roberta-base')
+        if is_packaged(model_path):
+            self.tokenizer = RobertaTokenizer.from_pretrained(model_path, local_files_only=True)
+        else:
+            self.tokenizer = RobertaTokenizer.from_pretrained('roberta-base')
 
-        self.translator = Translator()
+        if engine == "onnx":
+            self.model = None
+            self.onnx_session = self._onnx_session()
+        else:
+            self.model = self._load_torch_model()
+            if engine == "int8":
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
 
-    def _validation(self, text: str) -> bool:
-        if re.match(r'^[a-zA-Z0-9\s.,!?\'\"]+$', text):
-            return True
+        self.translator = translator if translator is not None else TranslationService()
+
+    def _load_torch_model(self):
+        if is_packaged(self.model_path):
+            # the model is created empty and its weights are memory-mapped from safetensors,
+            # so there is neither a random initialization nor a second copy of the weights
+            model = RobertaForSequenceClassification.from_pretrained(self.model_path, local_files_only=True, low_cpu_mem_usage=True)
         else:
+            model = RobertaForSequenceClassification.from_pretrained('roberta-base', num_labels=len(self.emotions))
+            model.load_state_dict(torch.load(self.model_path, map_location=torch.device('cpu')))
+        model.eval()
+        return model
+
+    def _onnx_session(self):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx engine requires onnxruntime. Please, install it: pip install onnxruntime")
+
+        if not self._onnx_is_current():
+            self.export_onnx(self._load_torch_model(), self.onnx_path)
+            self._save_onnx_stamp(file_hash(weights_path(self.model_path)))
+
+        return onnxruntime.InferenceSession(self.onnx_path, providers=["CPUExecutionProvider"])
+
+    def _onnx_stamp_path(self) -> str:
+        return self.onnx_path + ".json"
+
+    def _save_onnx_stamp(self, weights_hash: str):
+        stat = os.stat(weights_path(self.model_path))
+        with open(self._onnx_stamp_path(), "w", encoding="utf-8") as f:
+            json.dump({"weights_hash": weights_hash, "weights_stat": [stat.st_size, stat.st_mtime_ns]}, f)
+
+    def _onnx_is_current(self) -> bool:
+        """ The exported graph is reused only if it was exported from the current weights: its sidecar keeps
+        the hash of the weights file, which is computed again only if the file's size or modification time changed
+        """
+        if not os.path.exists(self.onnx_path) or not os.path.exists(self._onnx_stamp_path()):
             return False
-    
-    def _preprocessing(self, text: str) -> str:
-        if not self._validation(text):
-            translated = self.translator.translate(text, dest='en').text
-        else:
-            translated = text
-        
-        inputs = self.tokenizer(translated, return_tensors="pt", padding=True, truncation=True, max_length=512)
-        return inputs
 
-    def predict(self, text: str) -> dict:
-        inputs = self._preprocessing(text)
+        with open(self._onnx_stamp_path(), "r", encoding="utf-8") as f:
+            stamp = json.load(f)
+        stat = os.stat(weights_path(self.model_path))
+        if stamp["weights_stat"] == [stat.st_size, stat.st_mtime_ns]:
+            return True
+
+        weights_hash = file_hash(weights_path(self.model_path))
+        if weights_hash != stamp["weights_hash"]:
+            return False
+        self._save_onnx_stamp(weights_hash)  # the file was only touched
+        return True
+
+    @staticmethod
+    def export_onnx(model, onnx_path: str):
+        """Exports the classifier into an ONNX graph with dynamic batch and sequence axes"""
+        dummy_ids = torch.ones((1, 8), dtype=torch.long)
+        dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}, "logits": {0: "batch"}}
+
+        torch.onnx.export(
+            model,
+            (dummy_ids, torch.ones_like(dummy_ids)),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+
+    def _forward(self, inputs) -> np.ndarray:
+        """Returns probabilities of the emotions for a padded batch"""
+        if self.engine == "onnx":
+            feeds = {name: inputs[name].numpy() for name in ("input_ids", "attention_mask")}
+            logits = self.onnx_session.run(["logits"], feeds)[0]
+            exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            return exp / exp.sum(axis=-1, keepdims=True)
+
         with torch.no_grad():
             outputs = self.model(**inputs)
-            probabilities = torch.softmax(outputs.logits, dim=-1).cpu().numpy()
+            return torch.softmax(outputs.logits, dim=-1).cpu().numpy()
+
+    def _validation(self, text: str) -> bool:
+        return not self.translator.needs_translation(text)
+    
+    def _preprocessing(self, text: str) -> list:
+        """Returns token ids of the (already translated) text windows without padding.
+        A text gets a single window unless it's longer than `max_length` in a windowed mode.
+        """
+        if self.long_text_mode == "truncate":
+            return [self.tokenizer(text, truncation=True, max_length=self.max_length)["input_ids"]]
+
+        token_ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+        return self._windows(token_ids)
 
-        emotion_probabilities = {self.emotions[i]: prob * 100 for i, prob in enumerate(probabilities[0])}
+    def _windows(self, token_ids: list) -> list:
+        size = self.max_length - 2  # room for <s> and </s>
+        if len(token_ids) <= size:
+            starts = [0]
+        else:
+            starts = list(range(0, len(token_ids) - size, self.window_stride)) + [len(token_ids) - size]
+
+        return [self.tokenizer.build_inputs_with_special_tokens(token_ids[start:start + size]) for start in starts]
+
+    def _top_emotions(self, probabilities) -> list:
+        emotion_probabilities = {self.emotions[i]: prob * 100 for i, prob in enumerate(probabilities)}
         top_3_emotions = dict(sorted(emotion_probabilities.items(), key=lambda item: item[1], reverse=True)[:3])
-        
+
         return list(top_3_emotions.keys())
+
+    def predict(self, text: str) -> list:
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts: list, batch_size: int = 16) -> list:
+        """Returns top-3 emotions for every text in the same order as the texts were given"""
+        return self.predict_batch_with_proba(texts, batch_size)[0]
+
+    def predict_batch_with_proba(self, texts: list, batch_size: int = 16) -> tuple:
+        """Returns top-3 emotions of every text and the matrix of all emotion probabilities they were taken from"""
+        probabilities = self.predict_proba_batch(texts, batch_size)
+        with self._stage("top_3", size=len(texts)):
+            return [self._top_emotions(row) for row in probabilities], probabilities
+
+    def _run_windows(self, texts: list, batch_size: int, forward, width: int, mode: str) -> np.ndarray:
+        """ Runs `forward` over length-bucketed windows of the texts and combines outputs of every text's windows
+        with `mode` ('max' or a length-weighted mean otherwise) into a (texts, width) matrix
+        """
+        with self._stage("translation", size=len(texts)):
+            translated = self.translator.translate_batch(texts)
+        with self._stage("tokenization", size=len(texts)):
+            windows = [(i, window) for i, text in enumerate(translated) for window in self._preprocessing(text)]
+            order = sorted(range(len(windows)), key=lambda w: len(windows[w][1]))
+
+        window_outputs = np.zeros((len(windows), width), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            inputs = self.tokenizer.pad({"input_ids": [windows[w][1] for w in bucket]}, return_tensors="pt")
+            with self._stage("forward", size=inputs["input_ids"].numel()):
+                window_outputs[bucket] = forward(inputs)
+
+        # windows of every text are contiguous, so they are combined with one reduction over the offsets
+        offsets = np.searchsorted([i for i, _ in windows], np.arange(len(texts)))
+        if mode == "max":
+            return np.maximum.reduceat(window_outputs, offsets, axis=0)
+
+        lengths = np.array([len(window) for _, window in windows], dtype=np.float32)
+        weighted = np.add.reduceat(window_outputs * lengths[:, None], offsets, axis=0)
+        return weighted / np.add.reduceat(lengths, offsets)[:, None]
+
+    def predict_proba_batch(self, texts: list, batch_size: int = 16) -> np.ndarray:
+        """Returns a matrix with probabilities of every emotion (columns follow `emotions` ids) for every text.
+
+        Probabilities of the texts analysed before are taken from the cache. The other texts (or their windows)
+        are sorted by token length and split into buckets of `batch_size`, so every bucket is padded only
+        up to its own longest sequence.
+        """
+        rows = self._predict_cached(texts, lambda missing: self._predict_proba_batch(missing, batch_size).tolist())
+        return np.array(rows, dtype=np.float32).reshape(len(texts), len(self.emotions))
+
+    def _predict_proba_batch(self, texts: list, batch_size: int) -> np.ndarray:
+        return self._run_windows(texts, batch_size, self._forward, len(self.emotions), self.long_text_mode)
+
+    def _embed(self, inputs) -> np.ndarray:
+        """Returns the encoder's last hidden states averaged over the tokens of every sequence in a padded batch"""
+        with torch.no_grad():
+            hidden = self.model.roberta(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            return ((hidden * mask).sum(dim=1) / mask.sum(dim=1)).cpu().numpy()
+
+    def embed_batch(self, texts: list, batch_size: int = 16) -> np.ndarray:
+        """ Returns L2-normalized embeddings of the texts from the fine-tuned encoder, so a dot product
+        of two embeddings is their cosine similarity. Windows of long texts are averaged in every long text mode
+        """
+        if self.model is None:
+            raise ValueError("Embeddings need the torch or int8 engine, the ONNX graph gives only the logits")
+        if not texts:
+            return np.zeros((0, self.model.config.hidden_size), dtype=np.float32)
+
+        embeddings = self._run_windows(texts, batch_size, self._embed, self.model.config.hidden_size, "mean")
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+class StudentModel(RoBertaModel):
+    """ A narrow few-layer transformer distilled from RoBertaModel by `distillation`.
+
+    It has the same tokenizer, emotions and pipeline (translation, long texts, engines), only its packaged
+    directory is another one, so it's several times faster and smaller than the teacher.
+    """
+
+    def __init__(self, model_path: str = STUDENT_MODEL_DIR, **kwargs):
+        super().__init__(model_path, **kwargs)
+
+
+class FastEmotionalModel(TFIDFEmotionalModel):
+    """TF-IDF + XGBoost model over the 18 emotions of RoBertaModel, trained on data.csv by `emotion_analyser.cascade`"""
+
+    emotions = RoBertaModel.emotions
+
+
+class CascadeModel(AbstractModel):
+    """ Runs the fast model first and escalates a note to the slow one only when the fast model isn't sure.
+
+    The fast model is sure when the gap between its two most probable emotions is at least `threshold`
+    (calibrated by `emotion_analyser.cascade`). Notes which need a translation always go to the slow model,
+    the fast one understands only English.
+    """
+
+    def __init__(self, fast_model: FastEmotionalModel, slow_model: RoBertaModel, threshold: float):
+        self.fast_model = fast_model
+        self.slow_model = slow_model
+        self.threshold = threshold
+        self.emotions = slow_model.emotions
+
+        self._lock = threading.Lock()
+        self.notes_count = 0
+        self.escalated_count = 0
+
+    def _validation(self, text: str) -> bool:
+        return self.slow_model._validation(text)
+
+    def _preprocessing(self, text: str) -> str:
+        return text  # every model of the cascade preprocesses texts on its own
+
+    @staticmethod
+    def margins(probabilities: np.ndarray) -> np.ndarray:
+        top_2 = -np.partition(-probabilities, 1, axis=1)[:, :2]
+        return top_2[:, 0] - top_2[:, 1]
+
+    def predict_proba_batch(self, texts: list, batch_size: int = 16) -> np.ndarray:
+        """Probabilities of the fast model for the notes it's sure about and of the slow model for the others"""
+        if not texts:
+            return np.zeros((0, len(self.emotions)), dtype=np.float32)
+
+        probabilities = np.asarray(self.fast_model.predict_proba_batch(texts), dtype=np.float32)
+        escalated = [i for i, (text, margin) in enumerate(zip(texts, self.margins(probabilities)))
+                     if margin < self.threshold or not self._validation(text)]
+        if escalated:
+            probabilities[escalated] = self.slow_model.predict_proba_batch([texts[i] for i in escalated], batch_size)
+
+        with self._lock:
+            self.notes_count += len(texts)
+            self.escalated_count += len(escalated)
+        return probabilities
+
+    def predict_batch_with_proba(self, texts: list, batch_size: int = 16) -> tuple:
+        probabilities = self.predict_proba_batch(texts, batch_size)
+        top_ids = np.argsort(-probabilities, axis=1, kind="stable")[:, :3]
+        return [[self.emotions[i] for i in row] for row in top_ids], probabilities
+
+    def predict_batch(self, texts: list, batch_size: int = 16) -> list:
+        return self.predict_batch_with_proba(texts, batch_size)[0]
+
+    def embed_batch(self, texts: list, batch_size: int = 16) -> np.ndarray:
+        return self.slow_model.embed_batch(texts, batch_size)
+
+    def predict(self, text: str) -> list:
+        return self.predict_batch([text])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "notes": self.notes_count,
+                "escalated": self.escalated_count,
+                "escalation_rate": self.escalated_count / self.notes_count if self.notes_count else 0.0
+            }
@@ -0,0 +1,58 @@
+import argparse
+
+import nltk
+
+
+NLTK_DATA_DIR = "emotion_analyser/model/nltk_data"
+REQUIRED_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "stopwords": "corpora/stopwords",
+    "wordnet": "corpora/wordnet",
+}
+
+
+def register_data_dir(data_dir: str = NLTK_DATA_DIR):
+    """Makes NLTK look for resources in the app's data directory first"""
+    if data_dir not in nltk.data.path:
+        nltk.data.path.insert(0, data_dir)
+
+
+def missing_resources(data_dir: str = NLTK_DATA_DIR) -> list:
+    """Returns names of the required resources which aren't installed locally. It never goes to the network"""
+    register_data_dir(data_dir)
+
+    missing = []
+    for name, resource in REQUIRED_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except (LookupError, OSError):  # OSError means a broken installation of the resource
+            missing.append(name)
+    return missing
+
+
+def ensure_resources(data_dir: str = NLTK_DATA_DIR):
+    missing = missing_resources(data_dir)
+    if missing:
+        raise FileNotFoundError(
+            f"Necessary NLTK data files are missing: {', '.join(missing)}. "
+            f"Please, install them with `python -m emotion_analyser.nltk_resources`."
+        )
+
+
+def provision(data_dir: str = NLTK_DATA_DIR, force: bool = False) -> list:
+    """Downloads the missing resources (or all of them if `force`) and returns names of the downloaded ones"""
+    names = list(REQUIRED_RESOURCES.keys()) if force else missing_resources(data_dir)
+    for name in names:
+        if not nltk.download(name, download_dir=data_dir):
+            raise RuntimeError(f"Couldn't download NLTK resource: {name}")
+    return names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Downloads NLTK resources needed by TFIDFEmotionalModel")
+    parser.add_argument("--data-dir", default=NLTK_DATA_DIR)
+    parser.add_argument("--force", action="store_true", help="download resources even if they're already installed")
+    args = parser.parse_args()
+
+    downloaded = provision(args.data_dir, args.force)
+    print(f"Downloaded: {', '.join(downloaded)}" if downloaded else "All NLTK resources are already installed")
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .app.fileWorker import FileWorker
+from .model_packaging import DEFAULT_MODEL_PATH, weights_path
+
+
+MODEL_PATH = DEFAULT_MODEL_PATH
+PROGRESS_FILE = "reanalysis_progress.json"
+
+_worker_model = None
+
+
+def build_model(model_path: str, engine: str, long_text_mode: str, num_threads: int = None):
+    from .model_service import RoBertaModel
+    return RoBertaModel(model_path, num_threads=num_threads, long_text_mode=long_text_mode, engine=engine)
+
+
+def _init_worker(model_factory, factory_args: tuple):
+    global _worker_model
+    _worker_model = model_factory(*factory_args)
+
+
+def _analyse_chunk(chunk: list) -> list:
+    """Returns (title, emotions, probabilities) of every note, probabilities are None if the model doesn't give them"""
+    titles = [title for title, _ in chunk]
+    texts = [content for _, content in chunk]
+    if hasattr(_worker_model, "predict_batch_with_proba"):
+        predictions, probabilities = _worker_model.predict_batch_with_proba(texts)
+        return list(zip(titles, predictions, probabilities))
+    return [(title, prediction, None) for title, prediction in zip(titles, _worker_model.predict_batch(texts))]
+
+
+def model_fingerprint(model_path: str, engine: str, long_text_mode: str) -> str:
+    stat = os.stat(weights_path(model_path))
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{engine}-{long_text_mode}"
+
+
+def load_progress(path: str, fingerprint: str) -> set:
+    """Returns titles already analysed by the same model, progress of another model is ignored"""
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, "r", encoding="utf-8") as f:
+        progress = json.load(f)
+
+    return set(progress["done"]) if progress.get("model") == fingerprint else set()
+
+
+def save_progress(path: str, fingerprint: str, done: set):
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "w", encoding="utf-8") as f:
+        json.dump({"model": fingerprint, "done": sorted(done)}, f)
+    os.replace(tmpPath, path)
+
+
+def reanalyse(fileWorker: FileWorker, model_factory, factory_args: tuple, fingerprint: str,
+              workers: int = 2, chunk_size: int = 32, report=print) -> int:
+    """ Analyses all notes again and writes new emotions into the notes metadata.
+
+    Notes are sent in chunks to `workers` processes, each of them builds one model with `model_factory`.
+    Emotions of every finished chunk are saved with one metadata write together with the progress,
+    so an interrupted run continues from the notes which weren't analysed yet.
+    With `workers=0` notes are analysed in the current process.
+    """
+    progressPath = os.path.join(fileWorker.notesDirectory, PROGRESS_FILE)
+    done = load_progress(progressPath, fingerprint)
+
+    titles = [title for title in fileWorker.getFileList().keys() if title not in done]
+    total = len(titles)
+    chunks = [titles[i:i + chunk_size] for i in range(0, total, chunk_size)]
+
+    def read_chunk(chunk):
+        return [(title, fileWorker.getFileInfo(title)["content"]) for title in chunk]
+
+    def save_results(results):
+        fileWorker.changeEmotionsBatch(
+            {title: emotions for title, emotions, _ in results},
+            {title: probabilities for title, _, probabilities in results if probabilities is not None}
+        )
+        done.update(title for title, _, _ in results)
+        save_progress(progressPath, fingerprint, done)
+
+    start = time.perf_counter()
+    analysed = 0
+
+    def report_progress():
+        elapsed = time.perf_counter() - start
+        report(f"{analysed}/{total} notes, {analysed / elapsed if elapsed else 0:.1f} notes/s")
+
+    if workers == 0:
+        _init_worker(model_factory, factory_args)
+        for chunk in chunks:
+            save_results(_analyse_chunk(read_chunk(chunk)))
+            analysed += len(chunk)
+            report_progress()
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_factory, factory_args)) as pool:
+            futures = [pool.submit(_analyse_chunk, read_chunk(chunk)) for chunk in chunks]
+            for future in as_completed(futures):
+                results = future.result()
+                save_results(results)
+                analysed += len(results)
+                report_progress()
+
+    if os.path.exists(progressPath):
+        os.remove(progressPath)
+    return analysed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyses emotions of all the notes again, e.g. after a model update")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--engine", default="torch", choices=["torch", "int8", "onnx"])
+    parser.add_argument("--long-text-mode", default="mean", choices=["truncate", "mean", "max"])
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                        help="number of processes with a model each, 0 to analyse in this process")
+    parser.add_argument("--chunk-size", type=int, default=32, help="notes per task and per metadata update")
+    args = parser.parse_args()
+
+    # cores are shared between the workers instead of every torch using all of them
+    threads = max((os.cpu_count() or 1) // max(args.workers, 1), 1)
+    fingerprint = model_fingerprint(args.model_path, args.engine, args.long_text_mode)
+
+    count = reanalyse(
+        FileWorker(),
+        build_model,
+        (args.model_path, args.engine, args.long_text_mode, threads),
+        fingerprint,
+        args.workers,
+        args.chunk_size,
+        report=lambda line: print("\r" + line, end="", file=sys.stderr, flush=True)
+    )
+    print(f"\nDone, {count} notes were analysed", file=sys.stderr)
@@ -0,0 +1,85 @@
+import os
+import pytest
+from ..cache_service import PersistentLRUCache, PredictionCache, text_hash, flush_caches
+
+
+@pytest.fixture
+def weights_file(tmp_path):
+    path = tmp_path / "weights.pt"
+    path.write_bytes(b"first weights")
+    return str(path)
+
+def test_text_hash_ignores_whitespaces():
+    assert text_hash("I feel  happy\ntoday ") == text_hash("I feel happy today")
+    assert text_hash("I feel happy") != text_hash("I feel sad")
+
+def test_lru_cache_evicts_least_recently_used(tmp_path):
+    cache = PersistentLRUCache(str(tmp_path / "cache.json"), max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+
+def test_lru_cache_is_persistent(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = PersistentLRUCache(path)
+    cache.put("a", ["happy", "calm", "proud"])
+    cache.put("b", ["sad"])
+
+    assert not os.path.exists(path)  # nothing is written until the flush
+    cache.flush()
+    assert PersistentLRUCache(path).get("a") == ["happy", "calm", "proud"]
+
+def test_lru_cache_is_written_every_few_changes(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = PersistentLRUCache(path, flush_every=3)
+    cache.put_many([("a", 1), ("b", 2)])
+    assert not os.path.exists(path)
+
+    cache.put("c", 3)
+    assert len(PersistentLRUCache(path)) == 3
+
+def test_lru_cache_is_written_after_interval(tmp_path):
+    path = str(tmp_path / "cache.json")
+    PersistentLRUCache(path, flush_interval=0.0).put("a", 1)
+
+    assert PersistentLRUCache(path).get("a") == 1
+
+def test_flush_caches_writes_changed_caches(tmp_path):
+    caches = [PersistentLRUCache(str(tmp_path / f"cache-{i}.json")) for i in range(2)]
+    caches[0].put("a", 1)
+
+    flush_caches()
+
+    assert os.path.exists(caches[0].path) and not os.path.exists(caches[1].path)
+
+def test_prediction_cache_survives_restart(tmp_path, weights_file):
+    path = str(tmp_path / "cache.json")
+    cache = PredictionCache(path, [weights_file])
+    cache.put(cache.key("some note"), ["sad"])
+    cache.flush()
+
+    cache = PredictionCache(path, [weights_file])
+    assert cache.get(cache.key("some note")) == ["sad"]
+
+def test_prediction_cache_invalidated_by_new_weights(tmp_path, weights_file):
+    path = str(tmp_path / "cache.json")
+    cache = PredictionCache(path, [weights_file])
+    cache.put(cache.key("some note"), ["sad"])
+    cache.flush()
+
+    with open(weights_file, "wb") as f:
+        f.write(b"second weights")
+    os.utime(weights_file, ns=(0, 0))
+
+    assert cache.get(cache.key("some note")) is None
+    assert len(PredictionCache(path, [weights_file])) == 0
+
+def test_prediction_cache_variants_dont_share_entries(tmp_path, weights_file):
+    truncated = PredictionCache(str(tmp_path / "cache.json"), [weights_file], variant="truncate")
+    windowed = PredictionCache(str(tmp_path / "cache.json"), [weights_file], variant="mean")
+
+    assert truncated.key("some note") != windowed.key("some note")
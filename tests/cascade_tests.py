@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from ..cascade import calibrate_threshold, split_indices
+from ..model_service import CascadeModel
+from ..translation_service import TranslationService, OfflineBackend
+
+
+EMOTIONS = {0: "happy", 1: "sad", 2: "calm", 3: "angry"}
+
+
+class FakeFastModel:
+    def predict_proba_batch(self, texts):
+        # sure about happy notes only
+        return np.array([[0.9, 0.05, 0.03, 0.02] if "good" in text else [0.3, 0.28, 0.22, 0.2] for text in texts])
+
+
+class FakeSlowModel:
+    emotions = EMOTIONS
+
+    def __init__(self):
+        self.texts = []
+        self.translator = TranslationService(OfflineBackend())
+
+    def _validation(self, text):
+        return not self.translator.needs_translation(text)
+
+    def predict_proba_batch(self, texts, batch_size=16):
+        self.texts.extend(texts)
+        return np.array([[0.1, 0.7, 0.1, 0.1] for _ in texts])
+
+
+@pytest.fixture
+def cascade():
+    return CascadeModel(FakeFastModel(), FakeSlowModel(), threshold=0.5)
+
+def test_cascade_escalates_only_unsure_notes(cascade):
+    predictions = cascade.predict_batch(["a good day", "a bad day", "another good day"])
+
+    assert [p[0] for p in predictions] == ["happy", "sad", "happy"]
+    assert cascade.slow_model.texts == ["a bad day"]
+    assert cascade.stats() == {"notes": 3, "escalated": 1, "escalation_rate": pytest.approx(1 / 3)}
+
+def test_cascade_escalates_notes_which_need_translation(cascade):
+    cascade.predict("хороший good day")
+
+    assert cascade.slow_model.texts == ["хороший good day"]
+
+def test_cascade_returns_probabilities_of_the_model_used(cascade):
+    emotions, probabilities = cascade.predict_batch_with_proba(["a good day", "a bad day"])
+
+    assert emotions == [["happy", "sad", "calm"], ["sad", "happy", "calm"]]
+    assert np.allclose(probabilities[1], [0.1, 0.7, 0.1, 0.1])
+
+def test_margins():
+    assert np.allclose(CascadeModel.margins(np.array([[0.1, 0.6, 0.3], [0.5, 0.5, 0.0]])), [0.3, 0.0])
+
+def test_calibrated_threshold_escalates_as_few_notes_as_possible():
+    margins = np.array([0.1, 0.8, 0.05, 0.6])
+    fast_scores = np.array([0.0, 1.0, 0.0, 1.0])
+    slow_scores = np.array([1.0, 1.0, 1.0, 0.5])
+
+    # both notes with small margins must go to the slow model, the rest are better with the fast one
+    assert calibrate_threshold(margins, fast_scores, slow_scores, max_accuracy_drop=0.0) == 0.6
+
+def test_calibrated_threshold_keeps_everything_on_a_good_fast_model():
+    margins = np.array([0.1, 0.2, 0.3])
+
+    assert calibrate_threshold(margins, np.ones(3), np.ones(3) * 0.9) == 0.0
+
+def test_calibrated_threshold_escalates_everything_on_a_bad_fast_model():
+    margins = np.array([0.1, 0.2, 0.3])
+
+    assert calibrate_threshold(margins, np.zeros(3), np.ones(3), max_accuracy_drop=0.0) == float("inf")
+
+def test_split_indices_are_disjoint():
+    train, calibration, test = split_indices(100)
+
+    assert (len(train), len(calibration), len(test)) == (70, 15, 15)
+    assert len(set(train) | set(calibration) | set(test)) == 100
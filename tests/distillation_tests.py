@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from ..distillation import soften, agreement
+
+
+def test_soften_keeps_order_and_flattens_distribution():
+    probabilities = np.array([[0.7, 0.2, 0.1]])
+    soft = soften(probabilities, temperature=2.0)
+
+    assert soft.sum() == pytest.approx(1.0)
+    assert np.argsort(soft[0]).tolist() == np.argsort(probabilities[0]).tolist()
+    assert soft[0, 0] < 0.7 and soft[0, 2] > 0.1
+    assert np.allclose(soften(probabilities, temperature=1.0), probabilities)
+
+def test_agreement():
+    teacher = np.array([[0.5, 0.3, 0.1, 0.1], [0.1, 0.2, 0.3, 0.4]])
+    student = np.array([[0.4, 0.35, 0.15, 0.1], [0.4, 0.1, 0.2, 0.3]])
+
+    result = agreement(student, teacher)
+
+    assert result["top1"] == 0.5
+    assert result["top3_jaccard"] == pytest.approx((1.0 + 0.5) / 2)
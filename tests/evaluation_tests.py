@@ -0,0 +1,34 @@
+import numpy as np
+from ..evaluation import load_labeled_notes, labels_matrix, multilabel_scores, top_k_matrix
+
+
+EMOTIONS = {0: "afraid", 1: "anxious", 2: "happy"}
+
+
+def test_load_labeled_notes():
+    texts, labels = load_labeled_notes("emotion_analyser/data/data.csv", EMOTIONS, limit=2)
+
+    assert len(texts) == 2
+    assert texts[0].startswith("My family was the most salient part of my day")
+    assert labels.tolist() == [[False, True, True], [False, False, False]]
+
+def test_labels_matrix():
+    matrix = labels_matrix([["happy"], ["afraid", "anxious"]], EMOTIONS)
+
+    assert matrix.tolist() == [[False, False, True], [True, True, False]]
+
+def test_top_k_matrix():
+    probabilities = np.array([[0.1, 0.7, 0.2], [0.5, 0.1, 0.4]])
+
+    assert top_k_matrix(probabilities, k=2).tolist() == [[False, True, True], [True, False, True]]
+
+def test_multilabel_scores():
+    true = np.array([[True, False, True], [False, True, False]])
+
+    perfect = multilabel_scores(true.copy(), true)
+    assert perfect["micro_f1"] == 1.0 and perfect["jaccard"] == 1.0 and perfect["label_accuracy"] == 1.0
+
+    scores = multilabel_scores(np.array([[True, False, False], [False, True, True]]), true)
+    assert scores["label_accuracy"] == 4 / 6
+    assert scores["jaccard"] == (1 / 2 + 1 / 2) / 2
+    assert scores["micro_f1"] == 2 * 2 / (2 * 2 + 1 + 1)
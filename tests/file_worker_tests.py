@@ -1,4 +1,8 @@
+import json
+import time
+from datetime import datetime, timedelta
 import pytest
+import numpy as np
 from unittest.mock import MagicMock, patch, mock_open
 from ..app.fileWorker import FileWorker
 
@@ -41,3 +45,211 @@ def test_file_worker_get_file_info(file_worker):
         assert file_info["content"] == "Test content"
         assert file_info["date"] == "2024-07-21 16:00:00"
         assert file_info["emotion"] == ["happy"]
+
+def test_file_worker_change_emotions_batch(file_worker):
+    file_worker._updateMetaInfo = MagicMock()
+    file_worker.filesInfo = {
+        "First": {"date": "2024-07-21 16:00:00", "emotion": ["happy"]},
+        "Second": {"date": "2024-07-22 16:00:00", "emotion": ["sad"]}
+    }
+
+    file_worker.changeEmotionsBatch({"First": ["calm"], "Second": ["proud", "excited"], "Missing": ["sad"]})
+
+    assert file_worker.filesInfo["First"]["emotion"] == ["calm"]
+    assert file_worker.filesInfo["Second"]["emotion"] == ["proud", "excited"]
+    assert "Missing" not in file_worker.filesInfo
+    file_worker._updateMetaInfo.assert_called_once()
+
+def test_file_worker_soft_emotion_counts(file_worker, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_worker, "notesDirectory", str(tmp_path))
+    monkeypatch.setattr(file_worker, "emotionsCount", 3)
+    monkeypatch.setattr(file_worker, "_probabilities", None)
+    file_worker._updateMetaInfo = MagicMock()
+    file_worker.filesInfo = {
+        "First": {"date": "2024-07-21 16:00:00", "emotion": ["happy"]},
+        "Second": {"date": "2024-07-22 16:00:00", "emotion": ["sad"]},
+        "Third": {"date": "2024-07-23 16:00:00", "emotion": ["calm"]}
+    }
+
+    file_worker.changeEmotionsBatch(
+        {"First": ["happy"], "Second": ["sad"]},
+        {"First": [0.75, 0.25, 0.0], "Second": [0.25, 0.5, 0.25]}
+    )
+
+    assert np.isnan(file_worker.getProbabilities(["Third"])).all()
+    assert np.allclose(file_worker.softEmotionCounts(), [1.0, 0.75, 0.25])
+    assert np.allclose(file_worker.softEmotionCounts(["Second"]), [0.25, 0.5, 0.25])
+
+def test_file_worker_embeds_only_changed_notes(file_worker, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_worker, "notesDirectory", str(tmp_path))
+    monkeypatch.setattr(file_worker, "embeddingSize", 2)
+    monkeypatch.setattr(file_worker, "_embeddings", None)
+    monkeypatch.setattr(file_worker, "_embeddedStats", {})
+    file_worker.filesInfo = {}
+    for title, content in [("Sunny", "a sunny day"), ("Warm", "a warm day"), ("Rainy", "a rainy night")]:
+        (tmp_path / f"{title}.txt").write_text(content, encoding="utf-8")
+        file_worker.filesInfo[title] = {"date": "2024-07-21 16:00:00", "emotion": [""]}
+
+    embedded = []
+    def embed_batch(texts):
+        embedded.extend(texts)
+        return [[0.0, 1.0] if "night" in text else [0.8, 0.6] if "warm" in text else [1.0, 0.0] for text in texts]
+
+    assert file_worker.updateEmbeddings(embed_batch) == 3
+    (tmp_path / "Rainy.txt").write_text("a rainy night again", encoding="utf-8")
+    assert file_worker.updateEmbeddings(embed_batch) == 1
+
+    assert embedded == ["a sunny day", "a warm day", "a rainy night", "a rainy night again"]
+    assert [title for title, _ in file_worker.similarNotes("Sunny", k=2)] == ["Warm", "Rainy"]
+    assert file_worker.similarNotes("Missing") == []
+
+@pytest.fixture
+def notes_dir(tmp_path):
+    return tmp_path / "UserNotes"
+
+@pytest.fixture
+def autosaving_worker(notes_dir):
+    # a separate instance instead of the singleton, whose methods are replaced by the tests above
+    worker = object.__new__(FileWorker)
+    worker.notesDirectory = str(notes_dir)
+    worker.autosaveDelay = 60.0
+    worker.__init__()
+    yield worker
+    worker.close()
+
+def test_file_worker_coalesces_saves_until_flush(autosaving_worker, notes_dir):
+    for content in ("a", "a go", "a good day"):
+        autosaving_worker.addNewNote("Diary", content)
+
+    assert not (notes_dir / "Diary.txt").exists()
+    assert autosaving_worker.getFileInfo("Diary")["content"] == "a good day"
+    assert "Diary" in autosaving_worker.getFileList()
+
+    autosaving_worker.flush()
+
+    assert (notes_dir / "Diary.txt").read_text(encoding="utf-8") == "a good day"
+    assert "Diary" in json.loads((notes_dir / "meta_info.json").read_text(encoding="utf-8"))
+
+def test_file_worker_autosaves_after_idle_delay(autosaving_worker, notes_dir):
+    autosaving_worker.autosaveDelay = 0.05
+    autosaving_worker.addNewNote("Diary", "a good day")
+
+    deadline = time.monotonic() + 5
+    while not (notes_dir / "Diary.txt").exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert (notes_dir / "Diary.txt").read_text(encoding="utf-8") == "a good day"
+
+def test_file_worker_writes_pending_notes_on_close(autosaving_worker, notes_dir):
+    autosaving_worker.addNewNote("Diary", "a good day")
+    autosaving_worker.changeEmotions("Diary", ["happy"])
+    autosaving_worker.close()
+
+    assert (notes_dir / "Diary.txt").read_text(encoding="utf-8") == "a good day"
+    assert json.loads((notes_dir / "meta_info.json").read_text(encoding="utf-8"))["Diary"]["emotion"] == ["happy"]
+
+def test_file_worker_renames_and_deletes_unsaved_notes(autosaving_worker, notes_dir):
+    autosaving_worker.addNewNote("Draft", "a good day")
+    autosaving_worker.changeNoteTitle("Draft", "Diary")
+    autosaving_worker.addNewNote("Other", "a bad day")
+    autosaving_worker.deleteNode("Other.txt")
+    autosaving_worker.flush()
+
+    assert sorted(path.name for path in notes_dir.glob("*.txt")) == ["Diary.txt"]
+    assert list(autosaving_worker.getFileList()) == ["Diary"]
+
+def test_file_worker_migrates_metadata_into_sqlite(notes_dir):
+    notes_dir.mkdir()
+    (notes_dir / "Diary.txt").write_text("a good day", encoding="utf-8")
+    (notes_dir / "meta_info.json").write_text(json.dumps({"Diary": {"date": "2024-07-21 16:00:00", "emotion": ["happy"]}}), encoding="utf-8")
+
+    worker = object.__new__(FileWorker)
+    worker.notesDirectory = str(notes_dir)
+    worker.metaStorage = "sqlite"
+    worker.__init__()
+    worker.addNewNote("Other", "a bad day", ["sad"])
+    worker.changeEmotions("Diary", ["calm"])
+    worker.close()
+
+    assert not (notes_dir / "meta_info.json").exists()
+    assert worker.metaStore.load() == {
+        "Diary": {"date": "2024-07-21 16:00:00", "emotion": ["calm"]},
+        "Other": {"date": worker.getFileInfo("Other")["date"], "emotion": ["sad"]}
+    }
+    assert worker.getFileInfo("Diary") == {"content": "a good day", "date": "2024-07-21 16:00:00", "emotion": ["calm"]}
+
+def test_file_worker_journals_edits_of_saved_notes(autosaving_worker, notes_dir):
+    autosaving_worker.journalCompactSize = 100
+    autosaving_worker.addNewNote("Diary", "a good day")
+    autosaving_worker.flush()
+    autosaving_worker.addNewNote("Diary", "a very good day")
+    autosaving_worker.flush()
+
+    assert (notes_dir / "Diary.txt").read_text(encoding="utf-8") == "a good day"
+    assert (notes_dir / "Diary.journal").exists()
+    assert autosaving_worker.getFileInfo("Diary")["content"] == "a very good day"
+
+    content = "a very good day"
+    for _ in range(5):
+        content += " and a long walk"
+        autosaving_worker.addNewNote("Diary", content)
+        autosaving_worker.flush()
+    autosaving_worker.compactJournals()
+
+    assert not (notes_dir / "Diary.journal").exists()
+    assert (notes_dir / "Diary.txt").read_text(encoding="utf-8") == content
+
+    autosaving_worker.addNewNote("Diary", content + "!")
+    autosaving_worker.changeNoteTitle("Diary", "Walk")
+    autosaving_worker.flush()
+    autosaving_worker.deleteNode("Walk.txt")
+    assert list(notes_dir.glob("Walk.*")) == []
+
+def test_file_worker_keeps_indexes_of_notes(autosaving_worker):
+    autosaving_worker.addNewNote("Walk", "a calm walk", ["calm"])
+    autosaving_worker.addNewNote("Exam", "an exam", ["anxious"])
+    autosaving_worker.changeEmotions("Walk", ["happy"])
+    autosaving_worker.changeNoteTitle("Exam", "Test")
+
+    now = datetime.now()
+    assert autosaving_worker.notesWithEmotion("happy") == ["Walk"]
+    assert autosaving_worker.notesWithEmotion("calm") == []
+    assert autosaving_worker.sortedBy("title") == ["Test", "Walk"]
+    assert set(autosaving_worker.notesBetween(now - timedelta(minutes=1), now + timedelta(minutes=1))) == {"Test", "Walk"}
+    assert autosaving_worker.notesBetween(now + timedelta(minutes=1), now + timedelta(minutes=2)) == []
+    assert abs(autosaving_worker.noteDate("Walk") - now) < timedelta(minutes=1)
+
+    autosaving_worker.deleteNode("Test.txt")
+    assert autosaving_worker.sortedBy("date") == ["Walk"]
+
+def test_file_worker_doesnt_check_renamed_notes_again(autosaving_worker):
+    autosaving_worker.embeddingSize = 2
+    autosaving_worker.addNewNote("Draft", "a good day")
+    autosaving_worker.flush()
+    embed_batch = lambda texts: [[1.0, 0.0] for _ in texts]
+
+    assert autosaving_worker.updateEmbeddings(embed_batch) == 1
+    autosaving_worker.changeNoteTitle("Draft", "Diary")
+    autosaving_worker.getFileInfo = MagicMock(side_effect=AssertionError("the note is read again"))
+
+    assert autosaving_worker.updateEmbeddings(embed_batch) == 0
+    assert "Diary" in autosaving_worker.embeddings
+
+def test_file_worker_keeps_notes_renamed_before_first_write_in_sqlite(notes_dir):
+    def open_worker():
+        worker = object.__new__(FileWorker)
+        worker.notesDirectory = str(notes_dir)
+        worker.metaStorage = "sqlite"
+        worker.autosaveDelay = 60.0
+        worker.__init__()
+        return worker
+
+    worker = open_worker()
+    worker.addNewNote("Draft", "a good day", ["happy"], u=True)
+    worker.changeNoteTitle("Draft", "Diary")
+    worker.flush()
+    worker.close()
+
+    worker = open_worker()
+    assert worker.getFileList() == {"Diary": {"date": worker.getFileInfo("Diary")["date"], "emotion": ["happy"]}}
+    worker.close()
@@ -0,0 +1,64 @@
+import time
+import threading
+import pytest
+from PyQt6.QtCore import QCoreApplication
+from ..app.inferenceExecutor import InferenceExecutor
+
+
+@pytest.fixture(scope="module")
+def qt_app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+def wait_for(qt_app, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        qt_app.processEvents()
+        time.sleep(0.01)
+
+def test_executor_returns_result_through_signal(qt_app):
+    executor = InferenceExecutor()
+    results = []
+    executor.resultReady.connect(lambda key, result: results.append((key, result)))
+
+    executor.submit("note", lambda text: text.upper(), "hello")
+    wait_for(qt_app, lambda: results)
+
+    assert results == [("note", "HELLO")]
+    assert not executor.hasPendingJobs()
+    executor.shutdown()
+
+def test_executor_newer_job_supersedes_older_one(qt_app):
+    executor = InferenceExecutor()
+    results = []
+    executor.resultReady.connect(lambda key, result: results.append((key, result)))
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(value):
+        started.set()
+        release.wait(5)
+        return value
+
+    executor.submit("note", slow, "first")
+    started.wait(5)
+    executor.submit("note", slow, "second")
+    release.set()
+    wait_for(qt_app, lambda: results)
+
+    assert results == [("note", "second")]
+    executor.shutdown()
+
+def test_executor_reports_errors(qt_app):
+    executor = InferenceExecutor()
+    errors = []
+    executor.jobFailed.connect(lambda key, error: errors.append((key, error)))
+
+    def failing():
+        raise ValueError("broken model")
+
+    executor.submit("note", failing)
+    wait_for(qt_app, lambda: errors)
+
+    assert errors == [("note", "broken model")]
+    executor.shutdown()
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+from ..app.matrixStore import MatrixStore
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "emotion_probabilities")
+
+def test_matrix_store_is_persistent(store_path):
+    MatrixStore(store_path, 3).putMany({"first": [0.5, 0.25, 0.25], "second": [0.0, 1.0, 0.0]})
+    store = MatrixStore(store_path, 3)
+
+    assert len(store) == 2
+    assert np.array_equal(store.get("second"), np.array([0.0, 1.0, 0.0], dtype=np.float16))
+    assert np.memmap(store.dataPath, dtype=np.float16, mode="r").shape == (6,)
+
+def test_matrix_store_overwrites_rows_in_place(store_path):
+    store = MatrixStore(store_path, 2)
+    store.put("first", [1.0, 0.0])
+    store.put("first", [0.0, 1.0])
+
+    assert store.matrix().shape == (1, 2)
+    assert np.array_equal(store.get("first"), [0.0, 1.0])
+
+def test_matrix_store_reuses_rows_of_deleted_notes(store_path):
+    store = MatrixStore(store_path, 2)
+    store.putMany({"first": [1.0, 0.0], "second": [0.0, 1.0]})
+    store.delete("first")
+    store.put("third", [0.5, 0.5])
+
+    assert store.matrix().shape == (2, 2)
+    assert list(store.rows(["third", "second", "first"])) == [0, 1, -1]
+
+def test_matrix_store_rename_and_keep(store_path):
+    store = MatrixStore(store_path, 2)
+    store.putMany({"first": [1.0, 0.0], "second": [0.0, 1.0]})
+    store.rename("first", "renamed")
+    store.keep({"renamed"})
+
+    assert MatrixStore(store_path, 2).titles() == ["renamed"]
+    assert np.array_equal(store.get("renamed"), [1.0, 0.0])
+
+def test_matrix_store_of_another_width_is_dropped(store_path):
+    MatrixStore(store_path, 2).put("first", [1.0, 0.0])
+
+    assert len(MatrixStore(store_path, 3)) == 0
+
+def test_matrix_store_nearest(store_path):
+    store = MatrixStore(store_path, 2, np.float32)
+    store.putMany({"east": [1.0, 0.0], "north": [0.0, 1.0], "north-east": [0.6, 0.8], "deleted": [1.0, 0.0]})
+    store.delete("deleted")
+
+    assert [title for title, _ in store.nearest([1.0, 0.0], k=2)] == ["east", "north-east"]
+    assert store.nearest([1.0, 0.0], k=5, exclude=["east"]) == [("north-east", pytest.approx(0.6)), ("north", 0.0)]
+
+def test_matrix_store_tags_follow_titles(store_path):
+    store = MatrixStore(store_path, 2)
+    store.put("first", [1.0, 0.0], tag="hash")
+    store.rename("first", "renamed")
+
+    assert MatrixStore(store_path, 2).tag("renamed") == "hash"
+    store.delete("renamed")
+    assert store.tag("renamed") is None
+
+def test_matrix_store_appends_changes_to_index(store_path):
+    store = MatrixStore(store_path, 2)
+    store.putMany({"first": [1.0, 0.0], "second": [0.0, 1.0]}, {"first": "hash"})
+    store.delete("first")
+    store.put("third", [0.5, 0.5])
+    store.rename("second", "renamed")
+
+    with open(store.indexPath, "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 4
+    reloaded = MatrixStore(store_path, 2)
+    assert list(reloaded.rows(["third", "renamed", "first", "second"])) == [0, 1, -1, -1]
+    assert reloaded.tag("first") is None
+
+def test_matrix_store_compacts_index(store_path):
+    store = MatrixStore(store_path, 2)
+    store.minChanges = 3
+    for number in range(5):
+        store.put("first", [float(number), 0.0])
+        with open(store.indexPath, "r", encoding="utf-8") as f:
+            assert len(f.readlines()) == [1, 2, 3, 4, 1][number]
+    assert np.array_equal(MatrixStore(store_path, 2).get("first"), [4.0, 0.0])
+
+def test_matrix_store_skips_cut_off_index_line(store_path):
+    store = MatrixStore(store_path, 2)
+    store.putMany({"first": [1.0, 0.0], "second": [0.0, 1.0]})
+    with open(store.indexPath, "a", encoding="utf-8") as f:
+        f.write('["delete", "fir')
+
+    reloaded = MatrixStore(store_path, 2)
+    assert reloaded.titles() == ["first", "second"]
+    reloaded.delete("second")
+    assert MatrixStore(store_path, 2).titles() == ["first"]
+
+def test_matrix_store_nearest_follows_changes(store_path):
+    store = MatrixStore(store_path, 2, np.float32)
+    store.putMany({"east": [1.0, 0.0], "north": [0.0, 1.0]})
+    assert store.nearest([1.0, 0.0], k=1) == [("east", 1.0)]
+    matrix = store.matrix()
+
+    store.put("east", [0.6, 0.8])
+    store.rename("north", "up")
+    assert store.matrix() is matrix
+    assert store.nearest([0.0, 1.0], k=2) == [("up", 1.0), ("east", pytest.approx(0.8))]
+
+    store.delete("east")
+    store.put("west", [-1.0, 0.0])
+    store.put("south", [0.0, -1.0])
+    assert store.nearest([-1.0, 0.0], k=5) == [("west", 1.0), ("up", 0.0), ("south", 0.0)]
+
+def test_matrix_store_reads_single_json_index(store_path):
+    MatrixStore(store_path, 2).putMany({"first": [1.0, 0.0], "second": [0.0, 1.0]})
+    with open(store_path + ".json", "w", encoding="utf-8") as f:
+        f.write('{"width": 2, "dtype": "float16", "rows": {"first": 0, "second": 1}, "tags": {}, "free": []}')
+
+    store = MatrixStore(store_path, 2)
+    store.delete("first")
+    assert MatrixStore(store_path, 2).titles() == ["second"]
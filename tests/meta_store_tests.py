@@ -0,0 +1,86 @@
+import json
+import sqlite3
+import pytest
+from ..app.metaStore import SqliteMetaStore, toTimestamp
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "notes.sqlite3")
+
+def rows(db_path, query, *args):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute(query, args).fetchall()
+
+def test_sqlite_meta_store_writes_only_recorded_changes(db_path):
+    store = SqliteMetaStore(db_path)
+    filesInfo = store.load()
+    filesInfo["First"] = {"date": "2024-07-21 16:00:00", "emotion": ["happy", "calm"]}
+    filesInfo["Second"] = {"date": "2024-07-22 16:00:00", "emotion": ["sad"]}
+    store.changed("First")
+    store.changed("Second")
+    store.write(store.pending(filesInfo))
+
+    filesInfo["Second"]["emotion"] = ["proud"]  # not recorded, so it's not saved
+    store.write(store.pending(filesInfo))
+
+    assert SqliteMetaStore(db_path).load() == {
+        "First": {"date": "2024-07-21 16:00:00", "emotion": ["happy", "calm"]},
+        "Second": {"date": "2024-07-22 16:00:00", "emotion": ["sad"]}
+    }
+
+def test_sqlite_meta_store_keeps_creation_time(db_path):
+    store = SqliteMetaStore(db_path)
+    filesInfo = {"Draft": {"date": "2024-07-21 16:00:00", "emotion": [""]}}
+    store.changed("Draft")
+    store.write(store.pending(filesInfo))
+
+    filesInfo["Diary"] = dict(filesInfo.pop("Draft"), date="2024-07-23 09:30:00")
+    store.renamed("Draft", "Diary")
+    store.changed("Diary")
+    store.write(store.pending(filesInfo))
+
+    assert rows(db_path, "SELECT title, modified FROM notes") == [("Diary", toTimestamp("2024-07-23 09:30:00"))]
+
+def test_sqlite_meta_store_drops_unused_schema_of_older_databases(db_path):
+    with sqlite3.connect(db_path) as connection:
+        connection.executescript("""
+            CREATE TABLE notes (id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE, created INTEGER NOT NULL, modified INTEGER NOT NULL);
+            CREATE INDEX notes_created ON notes (created);
+            CREATE INDEX notes_modified ON notes (modified);
+            INSERT INTO notes (title, created, modified) VALUES ('Old', 1, 2);
+        """)
+    connection.close()
+
+    store = SqliteMetaStore(db_path)
+    filesInfo = store.load()
+    filesInfo["New"] = {"date": "2024-07-21 16:00:00", "emotion": []}
+    store.changed("New")
+    store.write(store.pending(filesInfo))
+    store.close()
+
+    assert rows(db_path, "SELECT title, modified FROM notes") == [("Old", 2), ("New", toTimestamp("2024-07-21 16:00:00"))]
+    assert rows(db_path, "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL") == []
+
+def test_sqlite_meta_store_keeps_emotions_in_order(db_path):
+    store = SqliteMetaStore(db_path)
+    filesInfo = {
+        "First": {"date": "2024-07-21 16:00:00", "emotion": ["happy", "calm"]},
+        "Second": {"date": "2024-07-22 16:00:00", "emotion": ["sad", "calm"]},
+    }
+    for title in filesInfo:
+        store.changed(title)
+    store.removed("First")
+    store.write(store.pending(filesInfo))
+
+    assert rows(db_path, "SELECT emotion, position FROM note_emotions ORDER BY position") == [("sad", 0), ("calm", 1)]
+    assert SqliteMetaStore(db_path).load() == {"Second": {"date": "2024-07-22 16:00:00", "emotion": ["sad", "calm"]}}
+
+def test_sqlite_meta_store_migrates_json_once(db_path, tmp_path):
+    legacyPath = tmp_path / "meta_info.json"
+    meta = {"First": {"date": "2024-07-21 16:00:00", "emotion": ["happy"]}}
+    legacyPath.write_text(json.dumps(meta), encoding="utf-8")
+
+    assert SqliteMetaStore(db_path, str(legacyPath)).load() == meta
+    assert not legacyPath.exists() and (tmp_path / "meta_info.json.migrated").exists()
+    assert SqliteMetaStore(db_path, str(legacyPath)).load() == meta
@@ -0,0 +1,53 @@
+import json
+import pytest
+from ..metrics import Histogram, MetricsRegistry
+
+
+def test_disabled_registry_measures_nothing():
+    registry = MetricsRegistry(enabled=False)
+    with registry.stage("forward", size=10):
+        pass
+
+    assert registry.snapshot() == {}
+
+def test_enabled_registry_measures_stages():
+    registry = MetricsRegistry(enabled=True)
+    for size in (10, 20):
+        with registry.stage("forward", size=size):
+            pass
+    with registry.stage("translation"):
+        pass
+
+    snapshot = registry.snapshot()
+    assert list(snapshot.keys()) == ["forward", "translation"]
+    assert snapshot["forward"]["count"] == 2
+    assert snapshot["forward"]["mean_size"] == 15
+
+def test_stage_is_measured_when_it_fails():
+    registry = MetricsRegistry(enabled=True)
+    with pytest.raises(ValueError):
+        with registry.stage("forward"):
+            raise ValueError()
+
+    assert registry.snapshot()["forward"]["count"] == 1
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    for duration in [1.0] * 90 + [100.0] * 10:
+        histogram.observe(duration)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["p50_ms"] == 1.6
+    assert snapshot["p99_ms"] == 102.4
+    assert snapshot["min_ms"] == 1.0 and snapshot["max_ms"] == 100.0
+    assert sum(snapshot["buckets"].values()) == 100
+
+def test_registry_dump_and_reset(tmp_path):
+    registry = MetricsRegistry(enabled=True)
+    registry.observe("vectorization", 2.5, size=4)
+    path = tmp_path / "metrics.json"
+    registry.dump(str(path))
+    registry.reset()
+
+    assert json.loads(path.read_text())["vectorization"]["total_ms"] == 2.5
+    assert registry.snapshot() == {}
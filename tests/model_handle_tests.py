@@ -0,0 +1,32 @@
+import pytest
+from unittest.mock import MagicMock
+from ..app.modelHandle import ModelHandle
+
+
+def test_model_handle_is_lazy():
+    factory = MagicMock(return_value="model")
+    handle = ModelHandle(factory)
+
+    factory.assert_not_called()
+    assert not handle.isReady()
+
+    assert handle.get(timeout=5) == "model"
+    assert handle.isReady()
+    factory.assert_called_once()
+
+def test_model_handle_loads_once():
+    factory = MagicMock(return_value="model")
+    handle = ModelHandle(factory)
+
+    handle.startLoading()
+    handle.startLoading()
+    handle.get(timeout=5)
+
+    factory.assert_called_once()
+
+def test_model_handle_reports_load_error():
+    handle = ModelHandle(MagicMock(side_effect=FileNotFoundError("no weights")))
+
+    with pytest.raises(RuntimeError):
+        handle.get(timeout=5)
+    assert not handle.isReady()
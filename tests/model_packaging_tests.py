@@ -0,0 +1,17 @@
+import os
+from ..model_packaging import is_packaged, weights_path, WEIGHTS_FILE
+
+
+def test_weights_path_of_packaged_model(tmp_path):
+    model_dir = tmp_path / "roberta_emotions"
+    model_dir.mkdir()
+
+    assert is_packaged(str(model_dir))
+    assert weights_path(str(model_dir)) == os.path.join(str(model_dir), WEIGHTS_FILE)
+
+def test_weights_path_of_state_dict(tmp_path):
+    state_dict = tmp_path / "nlp_model.pt"
+    state_dict.write_bytes(b"weights")
+
+    assert not is_packaged(str(state_dict))
+    assert weights_path(str(state_dict)) == str(state_dict)
@@ -0,0 +1,96 @@
+import time
+import threading
+import pytest
+from ..model_server import MicroBatcher, ModelServer, ModelClient
+from ..metrics import METRICS
+
+
+class FakeModel:
+    emotions = {0: "happy", 1: "sad"}
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict_batch(self, texts):
+        self.batch_sizes.append(len(texts))
+        if any("slow" in text for text in texts):
+            time.sleep(0.5)
+        return [["happy"] if "good" in text else ["sad"] for text in texts]
+
+
+@pytest.fixture
+def server():
+    server = ModelServer(FakeModel(), port=0, max_batch_size=8, max_wait=0.2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_micro_batcher_groups_concurrent_texts():
+    model = FakeModel()
+    batcher = MicroBatcher(model.predict_batch, max_batch_size=3, max_wait=0.5)
+
+    futures = [batcher.submit(text) for text in ["good day", "bad day", "good night", "bad night"]]
+
+    assert [f.result(timeout=5) for f in futures] == [["happy"], ["sad"], ["happy"], ["sad"]]
+    assert model.batch_sizes == [3, 1]
+    batcher.close()
+
+def test_micro_batcher_passes_model_errors():
+    def failing(texts):
+        raise ValueError("broken model")
+
+    batcher = MicroBatcher(failing)
+    with pytest.raises(ValueError):
+        batcher.submit("text").result(timeout=5)
+    batcher.close()
+
+def test_client_gets_predictions_from_server(server):
+    client = ModelClient(*server.server_address)
+
+    assert client.emotions == FakeModel.emotions
+    assert client.predict("a good day") == ["happy"]
+    assert client.predict_batch(["a bad day", "a good day"]) == [["sad"], ["happy"]]
+    client.close()
+
+def test_client_doesnt_take_response_of_timed_out_request(server):
+    client = ModelClient(*server.server_address, timeout=0.3)
+
+    with pytest.raises(TimeoutError):
+        client.predict("a slow good day")
+    time.sleep(0.5)  # the late response of the first request is sent meanwhile
+
+    assert client.predict("a bad day") == ["sad"]
+    client.close()
+
+def test_requests_of_several_clients_share_batches(server):
+    clients = [ModelClient(*server.server_address) for _ in range(4)]
+    results = [None] * len(clients)
+
+    def ask(i):
+        results[i] = clients[i].predict("good" if i % 2 else "bad")
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [["sad"], ["happy"], ["sad"], ["happy"]]
+    assert max(server.model.batch_sizes) > 1
+    for client in clients:
+        client.close()
+
+def test_client_gets_metrics_from_server(server, monkeypatch):
+    monkeypatch.setattr(METRICS, "enabled", True)
+    METRICS.reset()
+    METRICS.observe("RoBertaModel.forward", 12.0, size=64)
+    client = ModelClient(*server.server_address)
+
+    assert client.metrics()["RoBertaModel.forward"]["count"] == 1
+    client.close()
+    METRICS.reset()
+
+def test_client_is_available(server):
+    assert ModelClient.is_available(*server.server_address)
@@ -0,0 +1,38 @@
+import os
+import pytest
+from unittest.mock import patch
+from .. import nltk_resources
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(nltk_resources.nltk.data, "path", [])
+    return str(tmp_path)
+
+def install(data_dir, *resources):
+    for resource in resources:
+        os.makedirs(os.path.join(data_dir, resource))
+
+def test_missing_resources(data_dir):
+    install(data_dir, "tokenizers/punkt/PY3")
+
+    assert nltk_resources.missing_resources(data_dir) == ["stopwords", "wordnet"]
+
+def test_ensure_resources_raises_if_missing(data_dir):
+    with pytest.raises(FileNotFoundError):
+        nltk_resources.ensure_resources(data_dir)
+
+def test_installed_resources_are_not_downloaded(data_dir):
+    install(data_dir, "tokenizers/punkt/PY3", "corpora/stopwords", "corpora/wordnet")
+
+    with patch.object(nltk_resources.nltk, "download") as download:
+        nltk_resources.ensure_resources(data_dir)
+        assert nltk_resources.provision(data_dir) == []
+        download.assert_not_called()
+
+def test_provision_downloads_only_missing(data_dir):
+    install(data_dir, "tokenizers/punkt/PY3", "corpora/stopwords")
+
+    with patch.object(nltk_resources.nltk, "download", return_value=True) as download:
+        assert nltk_resources.provision(data_dir) == ["wordnet"]
+        download.assert_called_once_with("wordnet", download_dir=data_dir)
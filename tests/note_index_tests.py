@@ -0,0 +1,33 @@
+import pytest
+from ..app.metaStore import toTimestamp
+from ..app.noteIndex import NoteIndex
+
+
+@pytest.fixture
+def index():
+    return NoteIndex({
+        "Walk": {"date": "2024-07-22 09:00:00", "emotion": ["calm", "happy"]},
+        "Exam": {"date": "2024-07-21 16:00:00", "emotion": ["anxious"]},
+        "Party": {"date": "2024-07-23 22:30:00", "emotion": ["happy"]},
+    })
+
+def test_note_index_sorts_and_ranges(index):
+    assert index.sortedBy("date") == ["Exam", "Walk", "Party"]
+    assert index.sortedBy("title") == ["Exam", "Party", "Walk"]
+    assert index.between(toTimestamp("2024-07-22 00:00:00"), toTimestamp("2024-07-24 00:00:00")) == ["Walk", "Party"]
+    assert index.between(toTimestamp("2024-07-22 09:00:00"), toTimestamp("2024-07-23 22:30:00")) == ["Walk"]
+    with pytest.raises(ValueError):
+        index.sortedBy("emotion")
+
+def test_note_index_is_updated_note_by_note(index):
+    index.put("Exam", {"date": "2024-07-24 08:00:00", "emotion": ["proud", ""]})
+    index.put("Diary", {"date": "2024-07-20 12:00:00", "emotion": [""]})
+    index.rename("Walk", "Hike")
+    index.remove("Party")
+
+    assert index.sortedBy("date") == ["Diary", "Hike", "Exam"]
+    assert index.sortedBy("title") == ["Diary", "Exam", "Hike"]
+    assert index.withEmotion("happy") == ["Hike"]
+    assert index.withEmotion("anxious") == [] and index.withEmotion("") == []
+    assert index.withEmotion("proud") == ["Exam"]
+    assert index.timestamp("Hike") == toTimestamp("2024-07-22 09:00:00")
@@ -0,0 +1,67 @@
+import json
+import pytest
+from ..app.noteJournal import NoteJournal, delta
+
+
+@pytest.fixture
+def journal(tmp_path):
+    (tmp_path / "Diary.txt").write_text("a good day", encoding="utf-8")
+    return NoteJournal(str(tmp_path), compactSize=100)
+
+def test_delta_is_the_changed_middle():
+    assert delta("a good day", "a very good day") == (2, 0, "very ")
+    assert delta("a good day", "a bad day") == (2, 3, "ba")
+    assert delta("aaaa", "aa") == (2, 2, "")
+    assert delta("same", "same") == (4, 0, "")
+
+    long = "x" * 10000 + "middle" + "y" * 10000
+    assert delta(long, long.replace("middle", "center")) == (10000, 6, "center")
+
+def test_note_journal_appends_only_edits(journal, tmp_path):
+    journal.append("Diary", "a good day", "a very good day")
+    journal.append("Diary", "a very good day", "a very good day!\nЁ")
+
+    lines = (tmp_path / "Diary.journal").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 3 and json.loads(lines[2]) == [15, 0, "!\nЁ"]
+    assert (tmp_path / "Diary.txt").read_text(encoding="utf-8") == "a good day"
+    assert journal.replay("Diary", "a good day") == "a very good day!\nЁ"
+
+def test_note_journal_ignores_torn_last_line(journal, tmp_path):
+    journal.append("Diary", "a good day", "a good day!")
+    with open(tmp_path / "Diary.journal", "a", encoding="utf-8") as f:
+        f.write('[11, 0, "unfini')
+
+    assert journal.replay("Diary", "a good day") == "a good day!"
+
+    journal.append("Diary", "a good day!", "a good day!!")
+
+    assert journal.replay("Diary", "a good day") == "a good day!!"
+    assert (tmp_path / "Diary.journal").read_text(encoding="utf-8").count("unfini") == 0
+
+def test_note_journal_doesnt_skip_broken_lines_in_the_middle(journal, tmp_path):
+    journal.append("Diary", "a good day", "a good day!")
+    with open(tmp_path / "Diary.journal", "a", encoding="utf-8") as f:
+        f.write('[11, 0, "broken\n')
+    journal.append("Diary", "a good day!", "a good day!!")
+
+    with pytest.raises(ValueError):
+        journal.replay("Diary", "a good day")
+
+def test_note_journal_folds_into_checkpoint(journal, tmp_path):
+    content = "a good day"
+    for word in ["and a long walk"] * 5:
+        previous, content = content, content + " " + word
+        oversized = journal.append("Diary", previous, content)
+    assert oversized
+
+    journal.fold("Diary", content)
+
+    assert not (tmp_path / "Diary.journal").exists()
+    assert (tmp_path / "Diary.txt").read_text(encoding="utf-8") == content
+
+def test_note_journal_ignores_folded_journal(journal, tmp_path):
+    journal.append("Diary", "a good day", "a good day!")
+    (tmp_path / "Diary.txt").write_text("a good day!", encoding="utf-8")  # the app stopped before the journal was removed
+
+    assert journal.replay("Diary", "a good day!") == "a good day!"
+    assert not (tmp_path / "Diary.journal").exists()
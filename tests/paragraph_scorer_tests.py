@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from ..app.paragraphScorer import ParagraphScorer
+
+
+EMOTIONS = {0: "happy", 1: "sad", 2: "calm", 3: "angry"}
+SCORES = {
+    "a good day": [0.7, 0.1, 0.2, 0.0],
+    "a bad day": [0.1, 0.6, 0.0, 0.3],
+    "a very long and quiet evening at home": [0.2, 0.1, 0.6, 0.1],
+}
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict_proba_batch(self, texts):
+        self.calls.append(list(texts))
+        return np.array([SCORES[text] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+def test_split_paragraphs_skips_empty_lines():
+    assert ParagraphScorer.splitParagraphs("a good day\n\n  \n a bad day \n") == ["a good day", "a bad day"]
+
+def test_only_edited_paragraphs_are_scored(model):
+    scorer = ParagraphScorer(model.predict_proba_batch, EMOTIONS)
+    scorer.predict("a good day\n\na bad day")
+    scorer.predict("a good day\n\na bad day\n\na very long and quiet evening at home")
+    scorer.predict("a bad day\na good day")
+
+    assert model.calls == [["a good day", "a bad day"], ["a very long and quiet evening at home"]]
+
+def test_note_probabilities_are_weighted_by_paragraph_length(model):
+    scorer = ParagraphScorer(model.predict_proba_batch, EMOTIONS)
+    text = "a good day\na very long and quiet evening at home"
+
+    expected = (3 * np.array(SCORES["a good day"]) + 8 * np.array(SCORES["a very long and quiet evening at home"])) / 11
+    assert np.allclose(scorer.probabilities(text), expected)
+    assert scorer.predict(text) == ["calm", "happy", "sad"]
+
+def test_repeated_paragraphs_are_scored_once(model):
+    scorer = ParagraphScorer(model.predict_proba_batch, EMOTIONS)
+
+    assert scorer.predict("a bad day\na bad day") == ["sad", "angry", "happy"]
+    assert model.calls == [["a bad day"]]
+
+def test_least_recently_used_paragraphs_are_evicted(model):
+    scorer = ParagraphScorer(model.predict_proba_batch, EMOTIONS, max_paragraphs=1)
+    scorer.predict("a good day")
+    scorer.predict("a bad day")
+    scorer.predict("a good day")
+
+    assert len(model.calls) == 3
+
+def test_empty_note_isnt_scored(model):
+    scorer = ParagraphScorer(model.predict_proba_batch, EMOTIONS)
+
+    assert scorer.predict(" \n ") == []
+    assert model.calls == []
@@ -0,0 +1,73 @@
+import os
+import pytest
+from ..reanalyse_notes import reanalyse, save_progress, load_progress, PROGRESS_FILE
+
+
+class FakeModel:
+    def predict_batch(self, texts):
+        return [["happy"] if "good" in text else ["sad"] for text in texts]
+
+
+class FakeProbabilityModel(FakeModel):
+    def predict_batch_with_proba(self, texts):
+        return self.predict_batch(texts), [[1.0, 0.0] if "good" in text else [0.0, 1.0] for text in texts]
+
+
+class FakeFileWorker:
+    def __init__(self, directory, notes):
+        self.notesDirectory = directory
+        self.notes = notes
+        self.emotions = {}
+        self.probabilities = {}
+        self.batches = []
+
+    def getFileList(self):
+        return {title: {} for title in self.notes}
+
+    def getFileInfo(self, title):
+        return {"content": self.notes[title]}
+
+    def changeEmotionsBatch(self, newEmotions, probabilities=None):
+        self.batches.append(newEmotions)
+        self.emotions.update(newEmotions)
+        self.probabilities.update(probabilities or {})
+
+
+@pytest.fixture
+def file_worker(tmp_path):
+    notes = {f"note {i}": "a good day" if i % 2 else "a bad day" for i in range(5)}
+    return FakeFileWorker(str(tmp_path), notes)
+
+def test_reanalyse_updates_all_notes_in_batches(file_worker):
+    count = reanalyse(file_worker, FakeModel, (), "model", workers=0, chunk_size=2, report=lambda line: None)
+
+    assert count == 5
+    assert file_worker.emotions == {f"note {i}": ["happy"] if i % 2 else ["sad"] for i in range(5)}
+    assert [len(batch) for batch in file_worker.batches] == [2, 2, 1]
+    assert not os.path.exists(os.path.join(file_worker.notesDirectory, PROGRESS_FILE))
+
+def test_reanalyse_saves_probabilities(file_worker):
+    reanalyse(file_worker, FakeProbabilityModel, (), "model", workers=0, report=lambda line: None)
+
+    assert file_worker.probabilities == {f"note {i}": [1.0, 0.0] if i % 2 else [0.0, 1.0] for i in range(5)}
+
+def test_reanalyse_resumes_after_interruption(file_worker):
+    save_progress(os.path.join(file_worker.notesDirectory, PROGRESS_FILE), "model", {"note 0", "note 1"})
+
+    count = reanalyse(file_worker, FakeModel, (), "model", workers=0, report=lambda line: None)
+
+    assert count == 3
+    assert set(file_worker.emotions) == {"note 2", "note 3", "note 4"}
+
+def test_progress_of_another_model_is_ignored(tmp_path):
+    path = str(tmp_path / PROGRESS_FILE)
+    save_progress(path, "old model", {"note 0"})
+
+    assert load_progress(path, "old model") == {"note 0"}
+    assert load_progress(path, "new model") == set()
+
+def test_reanalyse_in_worker_processes(file_worker):
+    count = reanalyse(file_worker, FakeModel, (), "model", workers=2, chunk_size=2, report=lambda line: None)
+
+    assert count == 5
+    assert file_worker.emotions == {f"note {i}": ["happy"] if i % 2 else ["sad"] for i in range(5)}
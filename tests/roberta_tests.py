@@ -0,0 +1,162 @@
+import sys
+import pytest
+import torch
+from types import SimpleNamespace
+from transformers import RobertaTokenizer, RobertaForSequenceClassification
+from ..cache_service import PredictionCache
+from ..model_service import RoBertaModel, StudentModel
+from ..translation_service import TranslationService, OfflineBackend
+
+
+class FakeTokenizer:
+    def __init__(self):
+        self.padded_lengths = []
+
+    def __call__(self, text, truncation=False, max_length=None, add_special_tokens=True):
+        token_ids = [5] * len(text.split())
+        if truncation:
+            token_ids = token_ids[:max_length - 2]
+        return {"input_ids": self.build_inputs_with_special_tokens(token_ids) if add_special_tokens else token_ids}
+
+    def build_inputs_with_special_tokens(self, token_ids):
+        return [0] + token_ids + [2]
+
+    def pad(self, features, return_tensors="pt"):
+        max_len = max(len(ids) for ids in features["input_ids"])
+        self.padded_lengths.append(max_len)
+        input_ids = [ids + [1] * (max_len - len(ids)) for ids in features["input_ids"]]
+        attention_mask = [[1] * len(ids) + [0] * (max_len - len(ids)) for ids in features["input_ids"]]
+        return {"input_ids": torch.tensor(input_ids), "attention_mask": torch.tensor(attention_mask)}
+
+
+class FakeModel:
+    """The most probable emotion id equals to the count of non-padding tokens"""
+
+    def __call__(self, input_ids, attention_mask):
+        lengths = attention_mask.sum(dim=1)
+        logits = torch.zeros(input_ids.shape[0], len(RoBertaModel.emotions))
+        logits[torch.arange(input_ids.shape[0]), lengths] = 10.0
+        return SimpleNamespace(logits=logits)
+
+
+@pytest.fixture
+def roberta_model():
+    model = RoBertaModel.__new__(RoBertaModel)
+    model.tokenizer = FakeTokenizer()
+    model.model = FakeModel()
+    model.long_text_mode = "truncate"
+    model.window_stride = 384
+    model.engine = "torch"
+    model.translator = TranslationService(OfflineBackend({"раз два три": "one two three"}))
+    return model
+
+def test_roberta_predict_batch_keeps_order(roberta_model):
+    texts = ["one two three four", "one", "one two three four five six", "one two"]
+
+    predictions = roberta_model.predict_batch(texts, batch_size=2)
+
+    assert [p[0] for p in predictions] == [RoBertaModel.emotions[len(t.split()) + 2] for t in texts]
+    assert all(len(p) == 3 for p in predictions)
+
+def test_roberta_predict_batch_pads_each_bucket_separately(roberta_model):
+    texts = ["one two three four five six", "one", "one two three four five", "one two"]
+
+    roberta_model.predict_batch(texts, batch_size=2)
+
+    assert roberta_model.tokenizer.padded_lengths == [4, 8]
+
+def test_roberta_predict_uses_batch(roberta_model):
+    assert roberta_model.predict("one two") == roberta_model.predict_batch(["one two"])[0]
+
+def test_roberta_long_text_is_split_into_windows(roberta_model):
+    roberta_model.long_text_mode = "mean"
+    roberta_model.max_length = 8
+    roberta_model.window_stride = 4
+
+    windows = roberta_model._preprocessing(" ".join(["word"] * 14))
+
+    assert [len(w) for w in windows] == [8, 8, 8]
+    assert all(w[0] == 0 and w[-1] == 2 for w in windows)
+
+def test_roberta_windows_are_combined_per_text(roberta_model):
+    roberta_model.max_length = 8
+    roberta_model.window_stride = 4
+    texts = [" ".join(["word"] * 14), "one two", " ".join(["word"] * 7)]
+
+    roberta_model.long_text_mode = "mean"
+    probabilities = roberta_model.predict_proba_batch(texts, batch_size=2)
+    assert probabilities.shape == (3, len(RoBertaModel.emotions))
+    assert probabilities.sum(axis=1) == pytest.approx([1.0, 1.0, 1.0], abs=1e-4)
+    assert probabilities[1].argmax() == 4
+
+    roberta_model.long_text_mode = "max"
+    probabilities = roberta_model.predict_proba_batch(texts, batch_size=2)
+    assert probabilities[0].argmax() == 8
+    assert probabilities[2].argmax() == 8
+
+def test_roberta_probabilities_are_cached(roberta_model, tmp_path):
+    weights = tmp_path / "weights.pt"
+    weights.write_bytes(b"weights")
+    roberta_model.cache = PredictionCache(str(tmp_path / "cache.json"), [str(weights)])
+
+    emotions, probabilities = roberta_model.predict_batch_with_proba(["one two"])
+    cached_emotions, cached_probabilities = roberta_model.predict_batch_with_proba(["one two"])
+
+    assert roberta_model.tokenizer.padded_lengths == [4]  # the second analysis didn't run the model
+    assert cached_emotions == emotions and cached_probabilities == pytest.approx(probabilities)
+    assert roberta_model.predict_batch(["one two", "one"])[0] == emotions[0]
+    assert roberta_model.tokenizer.padded_lengths == [4, 3]
+
+def test_roberta_translates_texts_before_tokenization(roberta_model):
+    assert roberta_model.predict_batch(["раз два три"]) == roberta_model.predict_batch(["one two three"])
+
+def test_roberta_exports_onnx_again_for_new_weights(tmp_path, monkeypatch):
+    weights = tmp_path / "nlp_model.pt"
+    weights.write_bytes(b"first weights")
+    exported = []
+    monkeypatch.setitem(sys.modules, "onnxruntime", SimpleNamespace(InferenceSession=lambda path, providers: path))
+    monkeypatch.setattr(RoBertaModel, "_load_torch_model", lambda self: None)
+    monkeypatch.setattr(RoBertaModel, "export_onnx", staticmethod(lambda model, path: exported.append(path) or open(path, "wb").close()))
+
+    model = RoBertaModel.__new__(RoBertaModel)
+    model.model_path = str(weights)
+    model.onnx_path = str(tmp_path / "nlp_model.onnx")
+
+    model._onnx_session()
+    model._onnx_session()
+    assert len(exported) == 1
+
+    weights.write_bytes(b"second weights")
+    model._onnx_session()
+    assert len(exported) == 2
+
+def test_roberta_loads_packaged_model_locally(tmp_path, monkeypatch):
+    calls = []
+
+    def from_pretrained(path, **kwargs):
+        calls.append((path, kwargs))
+        return SimpleNamespace(eval=lambda: None)
+
+    monkeypatch.setattr(RobertaTokenizer, "from_pretrained", from_pretrained)
+    monkeypatch.setattr(RobertaForSequenceClassification, "from_pretrained", from_pretrained)
+
+    RoBertaModel(str(tmp_path), translator=TranslationService(OfflineBackend()))
+
+    assert [path for path, _ in calls] == [str(tmp_path), str(tmp_path)]
+    assert all(kwargs["local_files_only"] for _, kwargs in calls)
+    assert calls[1][1]["low_cpu_mem_usage"]
+
+def test_student_model_is_a_packaged_roberta(tmp_path, monkeypatch):
+    paths = []
+
+    def from_pretrained(path, **kwargs):
+        paths.append(path)
+        return SimpleNamespace(eval=lambda: None)
+
+    monkeypatch.setattr(RobertaTokenizer, "from_pretrained", from_pretrained)
+    monkeypatch.setattr(RobertaForSequenceClassification, "from_pretrained", from_pretrained)
+
+    model = StudentModel(str(tmp_path), translator=TranslationService(OfflineBackend()))
+
+    assert paths == [str(tmp_path), str(tmp_path)]
+    assert model.emotions == RoBertaModel.emotions
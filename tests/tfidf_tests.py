@@ -27,3 +27,18 @@ def test_tfidf_model_prediction(tfidf_model):
     
     tfidf_model.predict = MagicMock(return_value=[1])
     assert tfidf_model.predict(text_input)[0] == expected_emotion
+
+def test_tfidf_model_predict_batch(tfidf_model):
+    texts = ["I am so happy today!", "I'm scared of the dark", "He made me really angry"]
+
+    predictions = tfidf_model.predict_batch(texts, top_k=3)
+
+    assert len(predictions) == len(texts)
+    assert all(len(set(p)) == 3 and set(p) <= set(tfidf_model.emotions.values()) for p in predictions)
+    assert [p[0] for p in predictions] == [tfidf_model.predict(t) for t in texts]
+
+def test_tfidf_model_lemmas_are_memoized(tfidf_model):
+    tfidf_model._lemmatize.cache_clear()
+    tfidf_model.predict_batch(["cats and dogs", "dogs and cats"])
+
+    assert tfidf_model._lemmatize.cache_info().hits == 2
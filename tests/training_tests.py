@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import pytest
+from ..training import FeatureCache, read_dataset
+
+
+EMOTIONS = {0: "afraid", 1: "anxious", 2: "happy"}
+
+
+@pytest.fixture
+def features_dir(tmp_path):
+    return str(tmp_path / "features")
+
+@pytest.fixture
+def kaggle_csv(tmp_path):
+    path = tmp_path / "text.csv"
+    path.write_text(",text,label\n0,i feel lonely,0\n1,what a great day,2\n", encoding="utf-8")
+    return str(path)
+
+def test_read_dataset_supports_both_formats(kaggle_csv):
+    texts, labels = read_dataset(kaggle_csv, EMOTIONS)
+    assert texts == ["i feel lonely", "what a great day"]
+    assert labels.tolist() == [[True, False, False], [False, False, True]]
+
+    texts, labels = read_dataset("emotion_analyser/data/data.csv", EMOTIONS)
+    assert len(texts) == 1473
+    assert labels[0].tolist() == [False, True, True]
+
+def test_feature_cache_reads_unchanged_data_back(kaggle_csv, features_dir):
+    texts, labels = FeatureCache(kaggle_csv, features_dir).dataset(EMOTIONS)
+
+    cache = FeatureCache(kaggle_csv, features_dir)
+    cached_texts, cached_labels = cache.dataset(EMOTIONS)
+
+    assert cache.hits == ["dataset"]
+    assert cached_texts == texts
+    assert cached_labels.dtype == bool and np.array_equal(cached_labels, labels)
+    assert np.load(os.path.join(cache.directory, "labels.npy")).shape == (2, 1)  # 3 emotions fit into one byte
+
+def test_feature_cache_is_keyed_by_data(kaggle_csv, features_dir):
+    first = FeatureCache(kaggle_csv, features_dir)
+    first.dataset(EMOTIONS)
+    with open(kaggle_csv, "a", encoding="utf-8") as f:
+        f.write("2,so nervous,1\n")
+
+    cache = FeatureCache(kaggle_csv, features_dir)
+    texts, labels = cache.dataset(EMOTIONS)
+
+    assert cache.directory != first.directory and cache.hits == []
+    assert len(texts) == 3 and labels[2].tolist() == [False, True, False]
+
+def test_feature_cache_preprocesses_texts_once(kaggle_csv, features_dir):
+    calls = []
+    def preprocess(text):
+        calls.append(text)
+        return text.upper()
+
+    texts, _ = FeatureCache(kaggle_csv, features_dir).dataset(EMOTIONS)
+    FeatureCache(kaggle_csv, features_dir).lemmatized(texts, preprocess)
+    cache = FeatureCache(kaggle_csv, features_dir)
+
+    assert cache.lemmatized(texts, preprocess) == ["I FEEL LONELY", "WHAT A GREAT DAY"]
+    assert len(calls) == 2 and cache.hits == ["lemmatized"]
+
+def test_feature_cache_keeps_token_ids(kaggle_csv, features_dir):
+    tokenize = lambda texts: [[0] + [len(word) for word in text.split()] + [2] for text in texts]
+    texts, _ = FeatureCache(kaggle_csv, features_dir).dataset(EMOTIONS)
+    expected = FeatureCache(kaggle_csv, features_dir).token_ids(texts, tokenize, "words")
+
+    cache = FeatureCache(kaggle_csv, features_dir)
+
+    assert cache.token_ids(texts, None, "words") == expected == [[0, 1, 4, 6, 2], [0, 4, 1, 5, 3, 2]]
+    assert cache.hits == ["tokens-words"]
+
+def test_feature_cache_is_keyed_by_preprocessing(kaggle_csv, features_dir):
+    texts, _ = FeatureCache(kaggle_csv, features_dir).dataset(EMOTIONS)
+    FeatureCache(kaggle_csv, features_dir).lemmatized(texts, lambda text: text.upper(), {"stop_words": []})
+
+    cache = FeatureCache(kaggle_csv, features_dir)
+    assert cache.lemmatized(texts, lambda text: text.lower(), {"stop_words": []}) == ["i feel lonely", "what a great day"]
+    assert cache.lemmatized(texts, lambda text: text.upper(), {"stop_words": ["a"]}) == ["I FEEL LONELY", "WHAT A GREAT DAY"]
+    assert cache.hits == []
+    assert cache.lemmatized(texts, lambda text: text.upper(), {"stop_words": []}) == ["I FEEL LONELY", "WHAT A GREAT DAY"]
+    assert cache.hits == ["lemmatized"]
@@ -0,0 +1,55 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from ..cache_service import PersistentLRUCache
+from ..translation_service import TranslationService, OfflineBackend
+
+
+@pytest.fixture
+def backend():
+    backend = OfflineBackend({"Я счастлив": "I am happy", "Мне грустно": "I am sad"})
+    backend.translate = MagicMock(side_effect=backend.translate)
+    return backend
+
+def test_needs_translation():
+    assert TranslationService.needs_translation("Я счастлив")
+    assert not TranslationService.needs_translation("I don’t feel “great” today — 100%")
+
+def test_english_texts_are_not_sent_to_backend(backend):
+    service = TranslationService(backend)
+
+    assert service.translate("I am fine") == "I am fine"
+    backend.translate.assert_not_called()
+
+def test_texts_are_translated_in_one_batch(backend):
+    service = TranslationService(backend)
+
+    result = service.translate_batch(["Я счастлив", "It's ok", "Мне грустно", "Я счастлив"])
+
+    assert result == ["I am happy", "It's ok", "I am sad", "I am happy"]
+    backend.translate.assert_called_once_with(["Я счастлив", "Мне грустно"], "en")
+
+def test_translations_are_cached_on_disk(tmp_path, backend):
+    path = str(tmp_path / "translations.json")
+    cache = PersistentLRUCache(path)
+    TranslationService(backend, cache=cache).translate("Я счастлив")
+    cache.flush()
+
+    service = TranslationService(backend, cache=PersistentLRUCache(path))
+    assert service.translate("Я счастлив") == "I am happy"
+    backend.translate.assert_called_once()
+
+def test_slow_backend_falls_back_to_source_text(tmp_path):
+    backend = MagicMock()
+    backend.translate.side_effect = lambda texts, dest: time.sleep(1) or ["late"]
+    cache = PersistentLRUCache(str(tmp_path / "translations.json"))
+    service = TranslationService(backend, cache=cache, timeout=0.05)
+
+    assert service.translate("Я счастлив") == "Я счастлив"
+    assert len(cache) == 0
+
+def test_failing_backend_falls_back_to_source_text():
+    backend = MagicMock()
+    backend.translate.side_effect = ConnectionError("offline")
+
+    assert TranslationService(backend).translate("Я счастлив") == "Я счастлив"
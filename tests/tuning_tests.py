@@ -0,0 +1,15 @@
+import numpy as np
+from ..training import split_train_test
+from ..tuning import validation_split, storage_url
+
+
+def test_validation_split_keeps_test_notes_unseen():
+    _, test = split_train_test(100)
+    fit, validation = validation_split(100)
+
+    assert len(fit) + len(validation) + len(test) == 100
+    assert len(np.intersect1d(fit, validation)) == 0
+    assert len(np.intersect1d(np.concatenate([fit, validation]), test)) == 0
+
+def test_storage_url():
+    assert storage_url("emotion_analyser/model/tuning.db") == "sqlite:///emotion_analyser/model/tuning.db"
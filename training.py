@@ -0,0 +1,344 @@
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import pickle
+import argparse
+
+import numpy as np
+
+from .cache_service import file_hash
+from .evaluation import DATA_PATH, LABEL_COLUMN, multilabel_scores, top_k_matrix
+from .model_packaging import STATE_DICT_PATH
+
+
+TFIDF_DATA_PATH = "emotion_analyser/data/text.csv"  # the kaggle dataset of the TF-IDF model, it isn't a part of the repo
+XGBOOST_PATH = "emotion_analyser/model/xgboost.model"
+VECTORIZER_PATH = "emotion_analyser/model/tfidf_vectorizer.pkl"
+FEATURES_DIR = "emotion_analyser/model/features"
+
+
+def read_dataset(path: str, emotions: dict) -> tuple:
+    """ Returns texts and a boolean matrix of their emotions, columns follow `emotions` ids.
+
+    Both datasets of the project are supported: the kaggle one with a single emotion id in the `label` column
+    and data.csv with a TRUE/FALSE column for every emotion.
+    """
+    texts, labels = [], []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        single_label = "label" in reader.fieldnames
+        for row in reader:
+            if single_label:
+                texts.append(row["text"])
+                labels.append([int(row["label"]) == i for i in range(len(emotions))])
+            else:
+                texts.append(row["Answer"])
+                labels.append([row[LABEL_COLUMN.format(emotions[i])] == "TRUE" for i in range(len(emotions))])
+
+    return texts, np.array(labels, dtype=bool).reshape(len(texts), len(emotions))
+
+
+def _write_atomic(path: str, write, mode: str = "w"):
+    tmpPath = path + ".tmp"
+    with open(tmpPath, mode, encoding=None if "b" in mode else "utf-8") as f:
+        write(f)
+    os.replace(tmpPath, path)
+
+
+class FeatureCache:
+    """ Parsed and preprocessed versions of a dataset, kept in `<root>/<sha256 of the dataset file>`.
+
+    Labels are stored as bits (np.packbits), the lemmatized corpus and the tokens as they are, so a training run
+    over unchanged data reads them back instead of parsing the CSV and preprocessing every text again.
+    Any change of the data gives another directory, so stale features are never used.
+    """
+
+    def __init__(self, data_path: str, root: str = FEATURES_DIR):
+        self.data_path = data_path
+        self.key = file_hash(data_path)
+        self.directory = os.path.join(root, self.key)
+        self.hits = []  # names of the features read from the cache, e.g. to report them
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _prepare(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def dataset(self, emotions: dict) -> tuple:
+        """Texts and the boolean label matrix of the dataset as `read_dataset` returns them"""
+        names = [emotions[i] for i in range(len(emotions))]
+        try:
+            with open(self._path("dataset.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["emotions"] == names:
+                packed = np.load(self._path("labels.npy"))
+                self.hits.append("dataset")
+                return meta["texts"], np.unpackbits(packed, axis=1, count=len(names)).astype(bool)
+        except (OSError, ValueError, KeyError):
+            pass  # a missing or broken cache is just computed again
+
+        texts, labels = read_dataset(self.data_path, emotions)
+        self._prepare()
+        _write_atomic(self._path("labels.npy"), lambda f: np.save(f, np.packbits(labels, axis=1)), "wb")
+        _write_atomic(self._path("dataset.json"), lambda f: json.dump({"emotions": names, "texts": texts}, f))
+        return texts, labels
+
+    def lemmatized(self, texts: list, preprocess, settings=()) -> list:
+        """ Texts preprocessed with `preprocess`, e.g. TFIDFEmotionalModel._preprocessing (tokenization, stop words, lemmas).
+        They're cached by the code of `preprocess` and by `settings` it depends on (e.g. the stop words),
+        so a changed preprocessing doesn't get lemmas of the previous one
+        """
+        path = self._path(f"lemmatized-{preprocessing_fingerprint(preprocess, settings)[:16]}.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.hits.append("lemmatized")
+                return json.load(f)
+
+        preprocessed = [preprocess(text) for text in texts]
+        self._prepare()
+        _write_atomic(path, lambda f: json.dump(preprocessed, f))
+        return preprocessed
+
+    def token_ids(self, texts: list, tokenize, name: str) -> list:
+        """ Token ids of the texts from `tokenize` (a list of texts -> a list of id lists) without padding.
+        `name` tells tokenizers and their settings apart, e.g. "roberta-base-256"
+        """
+        path = self._path(f"tokens-{name}.npz")
+        if os.path.exists(path):
+            with np.load(path) as tokens:
+                self.hits.append(f"tokens-{name}")
+                return [ids.tolist() for ids in np.split(tokens["ids"], tokens["offsets"][1:-1])]
+
+        token_ids = tokenize(texts)
+        offsets = np.cumsum([0] + [len(ids) for ids in token_ids])
+        flat = np.fromiter((i for ids in token_ids for i in ids), dtype=np.int32, count=offsets[-1])
+        self._prepare()
+        _write_atomic(path, lambda f: np.savez(f, ids=flat, offsets=offsets), "wb")
+        return token_ids
+
+    def matrix(self, name: str, compute) -> np.ndarray:
+        """An array from `compute()`, e.g. encoder features of the texts, memory-mapped when it's read from the cache"""
+        path = self._path(f"{name}.npy")
+        if os.path.exists(path):
+            self.hits.append(name)
+            return np.load(path, mmap_mode="r")
+
+        matrix = compute()
+        self._prepare()
+        _write_atomic(path, lambda f: np.save(f, matrix), "wb")
+        return matrix
+
+
+def preprocessing_fingerprint(preprocess, settings=()) -> str:
+    """Hash of the code of the preprocessing function (of a method too) and of the JSON-serializable settings it uses"""
+    function = getattr(preprocess, "__func__", preprocess)
+    code = getattr(function, "__code__", None)
+    parts = [getattr(function, "__qualname__", type(function).__name__)]
+    if code is not None:
+        parts += [code.co_code.hex(), repr(code.co_consts), repr(code.co_names)]
+    parts.append(json.dumps(settings, sort_keys=True))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def split_train_test(count: int, test_share: float = 0.2, seed: int = 42) -> tuple:
+    indices = np.random.default_rng(seed).permutation(count)
+    test_size = int(count * test_share)
+    return indices[test_size:], indices[:test_size]
+
+
+def held_out_scores(probabilities: np.ndarray, labels: np.ndarray) -> dict:
+    """Scores of the top-k emotions, k is the largest number of emotions of a text (the kaggle dataset has one, data.csv up to three)"""
+    k = int(labels.sum(axis=1).max()) if len(labels) else 1
+    return multilabel_scores(top_k_matrix(probabilities, k=min(max(k, 1), 3)), labels)
+
+
+def fit_xgboost(preprocessed: list, labels: np.ndarray, vectorizer_params: dict = None, xgb_params: dict = None,
+                num_threads: int = None, validation: tuple = None) -> tuple:
+    """ Fits TF-IDF and a multi-threaded `hist` XGBoost on preprocessed texts, returns the vectorizer and the classifier.
+
+    A text with several emotions becomes one training sample per emotion, so the classifier learns
+    a distribution over all the emotions. With `validation` (preprocessed texts and labels) the loss on them
+    is evaluated after every boosting round, e.g. for callbacks in `xgb_params`.
+    """
+    import xgboost as xgb
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    rows, classes = np.nonzero(labels)
+    vectorizer = TfidfVectorizer(**(vectorizer_params or {}))
+    vectors = vectorizer.fit_transform(preprocessed)
+
+    classifier = xgb.XGBClassifier(
+        objective="multi:softprob",
+        num_class=labels.shape[1],
+        tree_method="hist",
+        n_jobs=num_threads,
+        **(xgb_params or {})
+    )
+    eval_set = None
+    if validation is not None:
+        validation_rows, validation_classes = np.nonzero(validation[1])
+        eval_set = [(vectorizer.transform(validation[0])[validation_rows], validation_classes)]
+    classifier.fit(vectors[rows], classes, eval_set=eval_set, verbose=False)
+    return vectorizer, classifier
+
+
+def save_xgboost(vectorizer, classifier, model_path: str, vectorizer_path: str):
+    classifier.save_model(model_path)
+    with open(vectorizer_path, "wb") as f:
+        pickle.dump(vectorizer, f)
+
+
+def train_tfidf(data_path: str = TFIDF_DATA_PATH, model_path: str = XGBOOST_PATH, vectorizer_path: str = VECTORIZER_PATH,
+                emotions: dict = None, features_dir: str = FEATURES_DIR, num_threads: int = None, test_share: float = 0.2) -> dict:
+    """ Trains the TF-IDF + XGBoost model of TFIDFEmotionalModel with the parameters of the training notebook
+    and returns its scores on held-out texts. `emotions` are TFIDFEmotionalModel ones by default
+    """
+    from .model_service import TFIDFEmotionalModel
+
+    emotions = emotions or TFIDFEmotionalModel.emotions
+    features = FeatureCache(data_path, features_dir)
+    texts, labels = features.dataset(emotions)
+    preprocessor = TFIDFEmotionalModel.preprocessor()
+    preprocessed = features.lemmatized(texts, preprocessor._preprocessing, preprocessor.preprocessing_settings())
+    train, test = split_train_test(len(texts), test_share)
+
+    start = time.perf_counter()
+    vectorizer, classifier = fit_xgboost([preprocessed[i] for i in train], labels[train],
+                                         xgb_params={"max_depth": 6, "learning_rate": 0.3}, num_threads=num_threads)
+    fit_seconds = time.perf_counter() - start
+    save_xgboost(vectorizer, classifier, model_path, vectorizer_path)
+
+    probabilities = classifier.predict_proba(vectorizer.transform([preprocessed[i] for i in test]))
+    return {
+        "notes": {"train": len(train), "test": len(test)},
+        "cached_features": features.hits,
+        "fit_seconds": fit_seconds,
+        **held_out_scores(probabilities, labels[test])
+    }
+
+
+def clean_text(text: str) -> str:
+    """Lowercases the text and removes punctuation as the RoBERTa training notebook did"""
+    return re.sub(r"[^\w\s]", "", text.lower())
+
+
+def padded_batch(token_ids: list, pad_id: int):
+    import torch
+
+    width = max(len(ids) for ids in token_ids)
+    input_ids = torch.full((len(token_ids), width), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(token_ids), width), dtype=torch.long)
+    for row, ids in enumerate(token_ids):
+        input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+def roberta_probabilities(model, token_ids: list, pad_id: int, batch_size: int = 16) -> np.ndarray:
+    import torch
+
+    model.eval()
+    probabilities = []
+    with torch.no_grad():
+        for start in range(0, len(token_ids), batch_size):
+            input_ids, attention_mask = padded_batch(token_ids[start:start + batch_size], pad_id)
+            logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+            probabilities.append(torch.softmax(logits, dim=-1).numpy())
+    return np.concatenate(probabilities) if probabilities else np.zeros((0, model.num_labels))
+
+
+def train_roberta_epoch(model, optimizer, token_ids: list, labels: np.ndarray, pad_id: int, batch_size: int, seed: int) -> float:
+    """One epoch over shuffled batches, returns the mean loss"""
+    import torch
+
+    model.train()
+    order = np.random.default_rng(seed).permutation(len(token_ids))
+    losses = []
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        input_ids, attention_mask = padded_batch([token_ids[i] for i in batch], pad_id)
+        outputs = model(input_ids=input_ids, attention_mask=attention_mask, labels=torch.tensor(labels[batch], dtype=torch.float))
+
+        optimizer.zero_grad()
+        outputs.loss.backward()
+        optimizer.step()
+        losses.append(outputs.loss.item())
+    return float(np.mean(losses)) if losses else 0.0
+
+
+def load_roberta_features(data_path: str = DATA_PATH, features_dir: str = FEATURES_DIR, max_length: int = 256,
+                          base_model: str = "roberta-base") -> tuple:
+    """Returns the cache, texts, labels and token ids of data.csv for fine-tuning RoBERTa, with the tokenizer"""
+    from transformers import RobertaTokenizer
+    from .model_service import RoBertaModel
+
+    tokenizer = RobertaTokenizer.from_pretrained(base_model)
+    features = FeatureCache(data_path, features_dir)
+    texts, labels = features.dataset(RoBertaModel.emotions)
+    token_ids = features.token_ids(
+        texts,
+        lambda texts: tokenizer([clean_text(text) for text in texts], truncation=True, max_length=max_length)["input_ids"],
+        f"{base_model}-{max_length}"
+    )
+    return features, texts, labels, token_ids, tokenizer
+
+
+def train_roberta(data_path: str = DATA_PATH, state_dict_path: str = STATE_DICT_PATH, features_dir: str = FEATURES_DIR,
+                  epochs: int = 5, batch_size: int = 8, learning_rate: float = 2e-5, max_length: int = 256,
+                  num_threads: int = None, test_share: float = 0.2, base_model: str = "roberta-base") -> dict:
+    """ Fine-tunes roberta-base on the 18 emotions of data.csv as the notebook did (AdamW, multi-label loss),
+    saves the state dict RoBertaModel loads and returns the scores of the top-3 emotions on held-out notes.
+    Batches are padded to their longest note instead of `max_length`
+    """
+    import torch
+    from transformers import RobertaForSequenceClassification
+    from .model_service import RoBertaModel
+
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    features, texts, labels, token_ids, tokenizer = load_roberta_features(data_path, features_dir, max_length, base_model)
+    train, test = split_train_test(len(texts), test_share)
+
+    model = RobertaForSequenceClassification.from_pretrained(base_model, num_labels=len(RoBertaModel.emotions))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate, eps=1e-8)
+
+    start = time.perf_counter()
+    losses = [train_roberta_epoch(model, optimizer, [token_ids[i] for i in train], labels[train], tokenizer.pad_token_id, batch_size, seed=epoch)
+              for epoch in range(epochs)]
+    fit_seconds = time.perf_counter() - start
+    torch.save(model.state_dict(), state_dict_path)
+
+    probabilities = roberta_probabilities(model, [token_ids[i] for i in test], tokenizer.pad_token_id)
+    return {
+        "notes": {"train": len(train), "test": len(test)},
+        "cached_features": features.hits,
+        "fit_seconds": fit_seconds,
+        "losses": losses,
+        **held_out_scores(probabilities, labels[test])
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trains the models of the app. Preprocessed data is cached in --features-dir by the data hash")
+    parser.add_argument("models", nargs="+", choices=["tfidf", "roberta"])
+    parser.add_argument("--tfidf-data", default=TFIDF_DATA_PATH, help="kaggle emotions dataset (text and label columns)")
+    parser.add_argument("--roberta-data", default=DATA_PATH)
+    parser.add_argument("--features-dir", default=FEATURES_DIR)
+    parser.add_argument("--threads", type=int, default=None, help="threads of XGBoost and PyTorch, all cores by default")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    report = {}
+    if "tfidf" in args.models:
+        report["tfidf"] = train_tfidf(args.tfidf_data, features_dir=args.features_dir, num_threads=args.threads)
+    if "roberta" in args.models:
+        report["roberta"] = train_roberta(args.roberta_data, features_dir=args.features_dir, epochs=args.epochs,
+                                          batch_size=args.batch_size, num_threads=args.threads)
+    print(json.dumps(report, indent=4))
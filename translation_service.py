@@ -0,0 +1,95 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from .cache_service import PersistentLRUCache, text_hash
+
+
+logger = logging.getLogger(__name__)
+
+
+class GoogleTranslateBackend:
+    """Translates texts with googletrans, all texts of a batch are sent within one call"""
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    def translate(self, texts: list, dest: str) -> list:
+        return [translation.text for translation in self.translator.translate(texts, dest=dest)]
+
+
+class OfflineBackend:
+    """ Stand-in backend which doesn't need network access.
+
+    Texts are looked up in the given translations and are kept as they are if they aren't there.
+    """
+
+    def __init__(self, translations: dict = None):
+        self.translations = translations or {}
+
+    def translate(self, texts: list, dest: str) -> list:
+        return [self.translations.get(text, text) for text in texts]
+
+
+class TranslationService:
+    """ Translates non-English texts into `dest` language before the analysis.
+
+    Translations are cached by the hash of the source text. If the backend fails or doesn't answer
+    within `timeout` seconds, the texts are returned untranslated and nothing is cached.
+    """
+
+    def __init__(self, backend=None, cache: PersistentLRUCache = None, timeout: float = 5.0, dest: str = "en"):
+        self.backend = backend if backend is not None else GoogleTranslateBackend()
+        self.cache = cache
+        self.timeout = timeout
+        self.dest = dest
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="translation")
+
+    @staticmethod
+    def needs_translation(text: str) -> bool:
+        # only letters matter, typographic quotes, dashes or emoji don't make a text non-English
+        return any(c.isalpha() and not c.isascii() for c in text)
+
+    def _key(self, text: str) -> str:
+        return f"{self.dest}:{text_hash(text)}"
+
+    def translate(self, text: str) -> str:
+        return self.translate_batch([text])[0]
+
+    def translate_batch(self, texts: list) -> list:
+        translated = list(texts)
+        pending = {}  # cache key -> indices of the texts with this key
+
+        for i, text in enumerate(texts):
+            if not self.needs_translation(text):
+                continue
+
+            key = self._key(text)
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                translated[i] = cached
+            else:
+                pending.setdefault(key, []).append(i)
+
+        if not pending:
+            return translated
+
+        sources = [texts[indices[0]] for indices in pending.values()]
+        future = self._pool.submit(self.backend.translate, sources, self.dest)
+        try:
+            results = future.result(timeout=self.timeout)
+        except TimeoutError:
+            logger.warning("Translation timed out after %s seconds, the texts are analysed untranslated", self.timeout)
+            return translated
+        except Exception as e:
+            logger.warning("Translation failed (%s), the texts are analysed untranslated", e)
+            return translated
+
+        for indices, result in zip(pending.values(), results):
+            for i in indices:
+                translated[i] = result
+
+        if self.cache is not None:
+            self.cache.put_many(zip(pending.keys(), results))
+
+        return translated
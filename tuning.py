@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .cache_service import file_hash
+from .cascade import timed_predictions
+from .evaluation import DATA_PATH
+from .model_packaging import DEFAULT_MODEL_PATH, weights_path
+from .training import FEATURES_DIR, TFIDF_DATA_PATH, FeatureCache, split_train_test, fit_xgboost, held_out_scores
+
+
+STORAGE_PATH = "emotion_analyser/model/tuning.db"
+REPORT_EVERY = 10  # boosting rounds between reports of the validation loss to the pruner
+
+
+def storage_url(path: str) -> str:
+    return f"sqlite:///{path}"
+
+
+def validation_split(count: int) -> tuple:
+    """Fit and validation indices taken from the training part of `training.split_train_test`, so its test part stays unseen"""
+    train, _ = split_train_test(count)
+    fit, validation = split_train_test(len(train), seed=0)
+    return train[fit], train[validation]
+
+
+def _pruner():
+    import optuna
+
+    # a trial is stopped once its validation loss is worse than the median of the previous trials at the same step
+    return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=2)
+
+
+def _study(study_name: str, storage: str, seed: int = None):
+    import optuna
+
+    return optuna.create_study(
+        study_name=study_name,
+        storage=storage,
+        direction="maximize",
+        load_if_exists=True,
+        pruner=_pruner(),
+        sampler=optuna.samplers.TPESampler(seed=seed)
+    )
+
+
+class XGBoostObjective:
+    """ Trains TF-IDF + XGBoost with parameters of a trial on the training part of the dataset
+    and returns the score on the validation part. The test part of `training` isn't touched.
+
+    The negated validation loss is reported every REPORT_EVERY boosting rounds, so a hopeless trial is pruned
+    before all its trees are built.
+    """
+
+    def __init__(self, data_path: str, emotions: dict, features_dir: str = FEATURES_DIR, num_threads: int = None):
+        from .model_service import TFIDFEmotionalModel
+
+        features = FeatureCache(data_path, features_dir)
+        texts, labels = features.dataset(emotions)
+        preprocessor = TFIDFEmotionalModel.preprocessor()
+        preprocessed = features.lemmatized(texts, preprocessor._preprocessing, preprocessor.preprocessing_settings())
+
+        fit, validation = validation_split(len(texts))
+        self.fit_texts, self.fit_labels = [preprocessed[i] for i in fit], labels[fit]
+        self.validation_texts, self.validation_labels = [preprocessed[i] for i in validation], labels[validation]
+        self.raw_validation_texts = [texts[i] for i in validation]
+        self.num_threads = num_threads
+
+    @staticmethod
+    def params(trial) -> tuple:
+        vectorizer_params = {
+            "ngram_range": (1, trial.suggest_int("max_ngram", 1, 2)),
+            "min_df": trial.suggest_int("min_df", 1, 5),
+            "sublinear_tf": trial.suggest_categorical("sublinear_tf", [False, True]),
+        }
+        xgb_params = {
+            "n_estimators": trial.suggest_int("n_estimators", 100, 600, step=50),
+            "max_depth": trial.suggest_int("max_depth", 3, 10),
+            "learning_rate": trial.suggest_float("learning_rate", 0.02, 0.5, log=True),
+            "min_child_weight": trial.suggest_float("min_child_weight", 1.0, 10.0, log=True),
+            "subsample": trial.suggest_float("subsample", 0.5, 1.0),
+            "colsample_bytree": trial.suggest_float("colsample_bytree", 0.3, 1.0),
+        }
+        return vectorizer_params, xgb_params
+
+    @staticmethod
+    def _pruning_callback(trial):
+        import optuna
+        import xgboost as xgb
+
+        class PruningCallback(xgb.callback.TrainingCallback):
+            def after_iteration(self, model, epoch, evals_log):
+                if (epoch + 1) % REPORT_EVERY == 0:
+                    trial.report(-evals_log["validation_0"]["mlogloss"][-1], epoch + 1)
+                    if trial.should_prune():
+                        raise optuna.TrialPruned()
+                return False
+
+        return PruningCallback()
+
+    def fit(self, trial, callbacks: list = None) -> tuple:
+        vectorizer_params, xgb_params = self.params(trial)
+        return fit_xgboost(self.fit_texts, self.fit_labels, vectorizer_params, {**xgb_params, "callbacks": callbacks},
+                           self.num_threads, validation=(self.validation_texts, self.validation_labels))
+
+    def __call__(self, trial) -> float:
+        vectorizer, classifier = self.fit(trial, [self._pruning_callback(trial)])
+        # trees count and depth change the speed too, so every trial keeps it to compare trials by both
+        start = time.perf_counter()
+        probabilities = classifier.predict_proba(vectorizer.transform(self.validation_texts))
+        trial.set_user_attr("batch_ms_per_note", (time.perf_counter() - start) / len(self.validation_texts) * 1000)
+        return held_out_scores(probabilities, self.validation_labels)["jaccard"]
+
+    def latency_model(self, trial):
+        """TF-IDF model of the trial which predicts exactly as the app does, to measure its latency"""
+        from .model_service import TFIDFEmotionalModel
+
+        model = TFIDFEmotionalModel.preprocessor()
+        model.vectorizer, model.xgb_model = self.fit(trial)
+        return model
+
+
+class HeadObjective:
+    """ Trains a new classification head of the RoBERTa model over its frozen encoder and returns the validation score.
+
+    Encoder outputs (<s> token states) of all the notes are computed once and cached by the data and weights hashes,
+    so a trial costs only a few epochs of a two-layer head. The validation score is reported after every epoch
+    for pruning.
+    """
+
+    def __init__(self, data_path: str = DATA_PATH, model_path: str = DEFAULT_MODEL_PATH, features_dir: str = FEATURES_DIR,
+                 num_threads: int = None):
+        import torch
+        from .model_service import RoBertaModel
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self.roberta = RoBertaModel(model_path)
+        features = FeatureCache(data_path, features_dir)
+        texts, labels = features.dataset(RoBertaModel.emotions)
+        encoded = features.matrix(f"encoder-{file_hash(weights_path(model_path))[:16]}", lambda: self._encode(texts))
+
+        fit, validation = validation_split(len(texts))
+        self.fit_features, self.fit_labels = torch.tensor(np.asarray(encoded[fit])), torch.tensor(labels[fit], dtype=torch.float)
+        self.validation_features, self.validation_labels = torch.tensor(np.asarray(encoded[validation])), labels[validation]
+        self.raw_validation_texts = [texts[i] for i in validation]
+
+    def _encode(self, texts: list, batch_size: int = 16) -> np.ndarray:
+        """<s> token states the head gets, computed over the same tokens as the app's predictions"""
+        import torch
+
+        def forward(inputs):
+            with torch.no_grad():
+                return self.roberta.model.roberta(**inputs).last_hidden_state[:, 0].numpy()
+
+        return self.roberta._run_windows(texts, batch_size, forward, self.roberta.model.config.hidden_size, self.roberta.long_text_mode)
+
+    @staticmethod
+    def params(trial) -> dict:
+        return {
+            "learning_rate": trial.suggest_float("learning_rate", 1e-4, 1e-2, log=True),
+            "weight_decay": trial.suggest_float("weight_decay", 1e-6, 1e-1, log=True),
+            "dropout": trial.suggest_float("dropout", 0.0, 0.5),
+            "batch_size": trial.suggest_categorical("batch_size", [16, 32, 64]),
+            "epochs": trial.suggest_int("epochs", 5, 40),
+        }
+
+    def _head(self, dropout: float):
+        import copy
+        from transformers.models.roberta.modeling_roberta import RobertaClassificationHead
+
+        config = copy.deepcopy(self.roberta.model.config)
+        config.classifier_dropout = dropout
+        return RobertaClassificationHead(config)
+
+    def _validation_probabilities(self, head) -> np.ndarray:
+        import torch
+
+        head.eval()
+        with torch.no_grad():
+            return torch.softmax(head(self.validation_features[:, None, :]), dim=-1).numpy()
+
+    def fit(self, trial, report: bool = False):
+        import torch
+
+        params = self.params(trial)
+        torch.manual_seed(trial.number)
+        head = self._head(params["dropout"])
+        optimizer = torch.optim.AdamW(head.parameters(), lr=params["learning_rate"], weight_decay=params["weight_decay"])
+        loss_function = torch.nn.BCEWithLogitsLoss()  # the multi-label loss the whole model was fine-tuned with
+
+        generator = np.random.default_rng(trial.number)
+        for epoch in range(params["epochs"]):
+            head.train()
+            order = generator.permutation(len(self.fit_features))
+            for start in range(0, len(order), params["batch_size"]):
+                batch = order[start:start + params["batch_size"]]
+                loss = loss_function(head(self.fit_features[batch][:, None, :]), self.fit_labels[batch])
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+            if report:
+                self._report(trial, head, epoch + 1)
+        head.eval()
+        return head
+
+    def _report(self, trial, head, step: int):
+        import optuna
+
+        trial.report(held_out_scores(self._validation_probabilities(head), self.validation_labels)["jaccard"], step)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+
+    def __call__(self, trial) -> float:
+        head = self.fit(trial, report=True)
+        return held_out_scores(self._validation_probabilities(head), self.validation_labels)["jaccard"]
+
+    def latency_model(self, trial):
+        """The RoBERTa model with the head of the trial, to measure its latency"""
+        self.roberta.model.classifier = self.fit(trial)
+        return self.roberta
+
+
+def build_objective(kind: str, data_path: str, features_dir: str, num_threads: int = None):
+    from .model_service import TFIDFEmotionalModel
+
+    if kind == "xgboost":
+        return XGBoostObjective(data_path, TFIDFEmotionalModel.emotions, features_dir, num_threads)
+    return HeadObjective(data_path, features_dir=features_dir, num_threads=num_threads)
+
+
+def _run_worker(kind: str, study_name: str, storage: str, total_trials: int, data_path: str, features_dir: str,
+                num_threads: int, seed: int) -> int:
+    """Runs trials in a worker process until the study has `total_trials` finished trials, returns their count"""
+    import optuna
+    from optuna.study import MaxTrialsCallback
+    from optuna.trial import TrialState
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    objective = build_objective(kind, data_path, features_dir, num_threads)
+    study = _study(study_name, storage, seed)
+    study.optimize(objective, callbacks=[MaxTrialsCallback(total_trials, states=(TrialState.COMPLETE, TrialState.PRUNED))])
+    return len(study.trials)
+
+
+def tune(kind: str, trials: int = 50, workers: int = 2, data_path: str = None, storage_path: str = STORAGE_PATH,
+         study_name: str = None, features_dir: str = FEATURES_DIR, latency_notes: int = 100) -> dict:
+    """ Runs `trials` more trials of the `kind` ("xgboost" or "head") study in `workers` processes.
+
+    Trials are kept in the SQLite file, so an interrupted search continues with the next run of the same study.
+    The best trial is trained once more in this process to measure its latency per note on validation notes.
+    """
+    import optuna
+    from optuna.trial import TrialState
+
+    data_path = data_path or (TFIDF_DATA_PATH if kind == "xgboost" else DATA_PATH)
+    study_name = study_name or kind
+    storage = storage_url(storage_path)
+
+    # features are cached before the workers start, so they read them instead of preprocessing the data each
+    objective = build_objective(kind, data_path, features_dir)
+    study = _study(study_name, storage)
+    finished = len([t for t in study.trials if t.state in (TrialState.COMPLETE, TrialState.PRUNED)])
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    # spawned workers don't inherit the threads of torch and xgboost of this process
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_run_worker, kind, study_name, storage, finished + trials, data_path, features_dir, num_threads, seed)
+                   for seed in range(finished, finished + workers)]
+        for future in futures:
+            future.result()
+
+    study = optuna.load_study(study_name=study_name, storage=storage)
+    best = study.best_trial
+    _, ms_per_note = timed_predictions(objective.latency_model(best), objective.raw_validation_texts[:latency_notes])
+    study.set_user_attr("best_latency", {"trial": best.number, "ms_per_note": ms_per_note})
+
+    states = [t.state for t in study.trials]
+    return {
+        "study": study_name,
+        "storage": storage_path,
+        "trials": {"complete": states.count(TrialState.COMPLETE), "pruned": states.count(TrialState.PRUNED), "failed": states.count(TrialState.FAIL)},
+        "best": {"number": best.number, "jaccard": best.value, "params": best.params, "ms_per_note": ms_per_note, **best.user_attrs},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tunes hyperparameters of the TF-IDF + XGBoost model or of the RoBERTa classification head")
+    parser.add_argument("kind", choices=["xgboost", "head"])
+    parser.add_argument("--trials", type=int, default=50, help="trials to run in addition to the ones already in the study")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes, the cores are split between them")
+    parser.add_argument("--data-path", default=None, help="kaggle text.csv for xgboost, data.csv for head by default")
+    parser.add_argument("--storage", default=STORAGE_PATH, help="SQLite file of the studies")
+    parser.add_argument("--study-name", default=None, help="the kind by default, an existing study is resumed")
+    parser.add_argument("--latency-notes", type=int, default=100)
+    args = parser.parse_args()
+
+    print(json.dumps(tune(args.kind, args.trials, args.workers, args.data_path, args.storage, args.study_name,
+                          latency_notes=args.latency_notes), indent=4))